@@ -0,0 +1,273 @@
+"""Offline analysis of a recorded lecture video.
+
+Splits the video into ranges of consecutive frames, has a process pool of
+VisionEngines decode and analyze one range each, and folds the per-frame
+results back in frame order into the same session store, heatmap and PDF
+report the live server produces. Workers read the file themselves, so no
+frames cross process boundaries, and emotions are classified inline so the
+same video always gives the same result.
+
+    python analyze_video.py lecture.mp4 --stride 3 --width 960 --out-dir reports/
+    python analyze_video.py lecture.mp4 --room 101 --session 2024-03-01 --db insight_sessions.db
+
+Each chunk is analyzed with a fresh engine (student IDs and the keyframe
+schedule restart at chunk boundaries), so larger chunks keep tracking more
+continuous and smaller chunks spread better across workers.
+"""
+import argparse
+import json
+import multiprocessing as mp
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+
+from report import build_report
+from session_store import SessionStore
+from worker_pool import PRELOAD_MODULES, start_method
+
+# Student IDs from chunk k are offset by k * ID_STRIDE so they stay unique
+ID_STRIDE = 100_000
+
+def video_info(path):
+    # (fps, frame count); containers that don't store the count are counted
+    capture = cv2.VideoCapture(path)
+    if not capture.isOpened():
+        raise SystemExit(f"cannot open {path}")
+    try:
+        fps = capture.get(cv2.CAP_PROP_FPS) or 30.0
+        count = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+        if count <= 0:
+            count = 0
+            while capture.grab():
+                count += 1
+        return fps, count
+    finally:
+        capture.release()
+
+
+def read_range(capture, start, stop, stride, width):
+    """Yields (index, frame) for every stride-th frame index in [start, stop)."""
+    if start:
+        capture.set(cv2.CAP_PROP_POS_FRAMES, start)
+    for index in range(start, stop):
+        if index % stride:
+            # Skipped frames are demuxed but never converted or copied
+            if not capture.grab():
+                return
+            continue
+        ok, frame = capture.read()
+        if not ok:
+            return
+        if width and frame.shape[1] != width:
+            height = int(round(frame.shape[0] * width / frame.shape[1]))
+            frame = cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+        yield index, frame
+
+
+_mesh_pool = None
+_engine_options = None
+_video = None
+_capture = None
+
+
+def _init_worker(engine_options, video):
+    global _mesh_pool, _engine_options, _video
+    from engine_registry import FaceMeshPool
+
+    _mesh_pool = FaceMeshPool(max_idle=1)
+    _engine_options = engine_options
+    _video = video
+
+
+def process_chunk(chunk, start, stop):
+    """Decodes frames [start, stop) of the video and runs the sampled ones
+    through a fresh VisionEngine (FaceMesh reused from the pool).
+
+    Returns (chunk, per-frame student lists, video times, frame size, behavior
+    events, frames read, seconds spent). Events are stamped with video time.
+    """
+    global _capture
+    from vision_engine import VisionEngine
+
+    begin = time.perf_counter()
+    if _capture is None:
+        _capture = cv2.VideoCapture(_video["path"])
+    face_mesh = None if _engine_options.get("multi_face") else _mesh_pool.acquire()
+    engine = VisionEngine(face_mesh=face_mesh, **_engine_options)
+    results = []
+    stamps = []
+    events = []
+    size = None
+    read = 0
+    try:
+        for index, frame in read_range(_capture, start, stop, _video["stride"], _video["width"]):
+            ts = index / _video["fps"]
+            students, _ = engine.process_frame(frame, ts=ts)
+            for s in students:
+                s["id"] += chunk * ID_STRIDE
+            for e in engine.events:
+                e["id"] += chunk * ID_STRIDE
+            results.append(students)
+            stamps.append(ts)
+            events.extend(engine.events)
+            size = (frame.shape[1], frame.shape[0])
+            # Through the frames skipped after this one, within the range
+            read = min(index + _video["stride"], stop) - start
+    finally:
+        if face_mesh is not None:
+            _mesh_pool.release(face_mesh)
+    return chunk, results, stamps, size, events, read, time.perf_counter() - begin
+
+
+def frame_stats(students):
+    # Same aggregation as the /ws endpoint
+    total = len(students)
+    distracted = sum(1 for s in students if s["distracted"])
+    drowsy = sum(1 for s in students if s["drowsy"])
+    engagement = max(0, 100 - ((distracted + drowsy) / total * 100)) if total else 100
+    return total, distracted, drowsy, engagement
+
+
+def analyze(args):
+    fps, frame_count = video_info(args.video)
+    video = {"path": args.video, "fps": fps, "stride": args.stride, "width": args.width}
+
+    engine_options = {"pose_mode": args.pose_mode, "keyframe_interval": args.keyframe_interval,
+                      "multi_face": args.multi_face, "mesh_threads": args.mesh_threads,
+                      "emotion_model": args.emotion_model, "emotion_inline": True}
+    store = SessionStore()
+    timeline = []
+    events = []
+    log = None
+    camera = os.path.basename(args.video)
+    if args.db:
+        from session_log import SessionLog
+        log = SessionLog(args.db, block=True)
+
+    start = time.perf_counter()
+    base_ts = args.start_ts
+    processed = 0
+    busy = 0.0
+    read = 0
+
+    def consume(result):
+        nonlocal processed, busy, read
+        chunk, results, stamps, frame_size, chunk_events, chunk_read, seconds = result
+        busy += seconds
+        read += chunk_read
+        events.extend(chunk_events)
+        store.record_events(chunk_events)
+        if log is not None and chunk_events:
+            log.append_events(args.room, args.session, [dict(e, ts=base_ts + e["ts"]) for e in chunk_events],
+                              camera=camera)
+        for students, ts in zip(results, stamps):
+            total, distracted, drowsy, engagement = frame_stats(students)
+            now = base_ts + ts
+            timeline.append([round(ts, 3), engagement, total, distracted, drowsy])
+            if total:
+                store.record_frame(students, engagement, distracted, drowsy, ts=now, frame_size=frame_size)
+                if log is not None:
+                    log.append_frame(args.room, args.session, now, engagement, distracted, drowsy, students,
+                                     camera=camera, frame_size=frame_size)
+        processed += len(results)
+        if args.progress and timeline:
+            elapsed = time.perf_counter() - start
+            print(f"\r{processed} frames, video {timeline[-1][0]:.0f}s, "
+                  f"{timeline[-1][0] / max(elapsed, 1e-6):.1f}x real time", end="", flush=True)
+
+    # Chunks are submitted in order and consumed from the head of the queue,
+    # so results are reassembled in frame order with a bounded number in flight.
+    # A chunk is chunk_size sampled frames; its worker decodes them itself.
+    span = args.chunk_size * args.stride
+    ctx = mp.get_context(start_method())
+    if ctx.get_start_method() == "forkserver":
+        ctx.set_forkserver_preload(PRELOAD_MODULES)
+    with ProcessPoolExecutor(args.workers, mp_context=ctx, initializer=_init_worker,
+                             initargs=(engine_options, video)) as pool:
+        pending = deque()
+        for chunk, first in enumerate(range(0, frame_count, span)):
+            pending.append(pool.submit(process_chunk, chunk, first, min(first + span, frame_count)))
+            while len(pending) > args.workers * 2 or (pending and pending[0].done()):
+                consume(pending.popleft().result())
+        while pending:
+            consume(pending.popleft().result())
+    if args.progress:
+        print()
+    if read < frame_count:
+        print(f"Read {read} of {frame_count} frames, the video ended early")
+
+    elapsed = time.perf_counter() - start
+    video_seconds = read / fps
+    if log is not None:
+        log.close()
+    return {
+        "store": store,
+        "timeline": timeline,
+        "events": events,
+        "stats": {
+            "video_seconds": video_seconds,
+            "frames_analyzed": processed,
+            "elapsed_seconds": elapsed,
+            "speedup": video_seconds / elapsed if elapsed else None,
+            "worker_seconds": busy,
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("video")
+    parser.add_argument("--room", default="recorded")
+    parser.add_argument("--session", help="session name (default: video file name)")
+    parser.add_argument("--stride", type=int, default=2, help="analyze every Nth frame")
+    parser.add_argument("--width", type=int, default=960, help="resize frames to this width (0 keeps the original)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk-size", type=int, default=256, help="sampled frames per chunk")
+    parser.add_argument("--pose-mode", default="pnp", choices=["pnp", "fast"])
+    parser.add_argument("--keyframe-interval", type=int, default=2)
+    parser.add_argument("--multi-face", action="store_true",
+                        help="detect faces and mesh per-face crops (wide classroom shots)")
+    parser.add_argument("--mesh-threads", type=int, default=None,
+                        help="crop FaceMesh threads per worker with --multi-face (default: up to 4)")
+    parser.add_argument("--emotion-model", choices=["none", "standin", "fer"], default="none")
+    parser.add_argument("--start-ts", type=float, default=None,
+                        help="wall-clock time of the first frame (default: now)")
+    parser.add_argument("--out-dir", default=".")
+    parser.add_argument("--db", help="also append the session to this SQLite session log")
+    parser.add_argument("--quiet", dest="progress", action="store_false")
+    args = parser.parse_args()
+    args.session = args.session or os.path.splitext(os.path.basename(args.video))[0]
+    args.start_ts = time.time() if args.start_ts is None else args.start_ts
+
+    result = analyze(args)
+    stats = result["stats"]
+    os.makedirs(args.out_dir, exist_ok=True)
+    base = os.path.join(args.out_dir, f"{args.room}_{args.session}")
+
+    with open(base + "_timeline.json", "w") as f:
+        json.dump({
+            "room": args.room,
+            "session": args.session,
+            "start_ts": args.start_ts,
+            "columns": ["t", "engagement", "total", "distracted", "drowsy"],
+            "rows": result["timeline"],
+            "events": result["events"],
+            "stats": stats,
+        }, f)
+
+    store = result["store"]
+    pdf = build_report(args.room, args.session, store.summary(), store.behavior(),
+                       store.engagement_timeline(), store.heatmap.to_png() if store.heatmap.total else None)
+    with open(base + "_report.pdf", "wb") as f:
+        f.write(pdf)
+
+    print(f"Analyzed {stats['frames_analyzed']} frames ({stats['video_seconds']:.0f}s of video) "
+          f"in {stats['elapsed_seconds']:.1f}s, {stats['speedup'] or 0:.1f}x real time")
+    print(f"Wrote {base}_timeline.json and {base}_report.pdf")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+"""Accuracy and speed of the HeadPoseSolver modes on real face meshes.
+
+The head is a real FaceMesh result (benchmarks/data/frontal_face_landmarks.npz,
+FaceMesh on scikit-image's astronaut photo, or --image), turned upright and
+then moved along smooth random pose trajectories. Every frame is projected
+with the same pinhole camera the engine assumes and gets Gaussian pixel noise,
+so every mode is compared against known ground-truth angles on the landmark
+geometry FaceMesh actually produces, not on the PnP model itself.
+
+    python benchmarks/bench_head_pose.py --faces 30 --frames 200
+    python benchmarks/bench_head_pose.py --image student.jpg --out pose.json
+    python benchmarks/bench_head_pose.py --compare pose.json
+"""
+import argparse
+import os
+import time
+
+import cv2
+import numpy as np
+
+from common import compare_results, save_results
+from head_pose import (LEFT_EYE_OUTER_IDX, MODEL_TO_CAMERA, POSE_INDICES, RIGHT_EYE_OUTER_IDX,
+                       HeadPoseSolver, euler_angles, face_axes)
+from landmarks import NOSE_TIP, landmarks_to_array
+
+# The generic 6-point face and landmarks the engine used before the model was
+# fitted to FaceMesh's geometry (for the "legacy" mode)
+LEGACY_FACE_3D = np.array([
+    [0.0, 0.0, 0.0], [0.0, -330.0, -65.0], [-225.0, 170.0, -135.0],
+    [225.0, 170.0, -135.0], [-150.0, -150.0, -125.0], [150.0, -150.0, -125.0],
+])
+LEGACY_INDICES = [1, 199, 33, 263, 61, 291]
+
+FACE_LANDMARKS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "frontal_face_landmarks.npz")
+
+
+def load_face(image_path=None):
+    """One face's (N, 3) normalized landmarks and the frame size they are for."""
+    if image_path is None:
+        data = np.load(FACE_LANDMARKS)
+        return data["points"], int(data["width"]), int(data["height"])
+    import mediapipe as mp
+
+    image = cv2.imread(image_path)
+    if image is None:
+        raise SystemExit(f"Could not read {image_path}")
+    with mp.solutions.face_mesh.FaceMesh(static_image_mode=True, refine_landmarks=True) as face_mesh:
+        results = face_mesh.process(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
+    points = landmarks_to_array(results.multi_face_landmarks)
+    if len(points) == 0:
+        raise SystemExit(f"No face found in {image_path}")
+    return points[0], image.shape[1], image.shape[0]
+
+
+def upright_mesh(points, w, h):
+    """The face mesh in camera orientation with zero pitch/yaw/roll by the
+    closed-form axes, nose tip at the origin, 450 units between the outer eye
+    corners (the PnP model's scale)."""
+    p = points.astype(np.float64) * [w, h, w]
+    mesh = (p - p[NOSE_TIP]) @ face_axes(points[None], w, h)[0]
+    return mesh * 450.0 / np.linalg.norm(mesh[RIGHT_EYE_OUTER_IDX] - mesh[LEFT_EYE_OUTER_IDX])
+
+
+def rotation(pitch, yaw, roll):
+    a, b, c = np.radians([pitch, yaw, roll])
+    rx = np.array([[1, 0, 0], [0, np.cos(a), -np.sin(a)], [0, np.sin(a), np.cos(a)]])
+    ry = np.array([[np.cos(b), 0, np.sin(b)], [0, 1, 0], [-np.sin(b), 0, np.cos(b)]])
+    rz = np.array([[np.cos(c), -np.sin(c), 0], [np.sin(c), np.cos(c), 0], [0, 0, 1]])
+    return rx @ ry @ rz
+
+
+def line_of_sight(tvec):
+    # Rotation taking the optical axis onto the ray from the camera to tvec
+    d = tvec / np.linalg.norm(tvec)
+    a, c = np.arctan2(d[0], d[2]), np.arctan2(-d[1], np.hypot(d[0], d[2]))
+    ry = np.array([[np.cos(a), 0, np.sin(a)], [0, 1, 0], [-np.sin(a), 0, np.cos(a)]])
+    rx = np.array([[1, 0, 0], [0, np.cos(c), -np.sin(c)], [0, np.sin(c), np.cos(c)]])
+    return ry @ rx
+
+
+def make_sequences(mesh, faces, frames, w, h, noise_px, seed):
+    """Returns landmarks (frames, faces, N, 3) and true (pitch, yaw) (frames, faces)."""
+    rng = np.random.default_rng(seed)
+    f = float(w)
+
+    start = rng.uniform([-30, -35, -10], [30, 35, 10], size=(faces, 3))
+    steps = rng.normal(0, 1.0, size=(frames, faces, 3))
+    angles = np.clip(start + np.cumsum(steps, axis=0), [-40, -45, -15], [40, 45, 15])
+    centers = np.stack([rng.uniform(0.15, 0.85, faces) * w, rng.uniform(0.2, 0.8, faces) * h], axis=1)
+    depth = rng.uniform(2500, 6000, faces)
+
+    points = np.zeros((frames, faces, len(mesh), 3), dtype=np.float32)
+    truth = np.zeros((frames, faces, 2))
+    for t in range(frames):
+        for k in range(faces):
+            rmat = rotation(*angles[t, k])
+            # Place the face so that its nose projects onto the chosen center
+            tvec = np.array([(centers[k, 0] - w / 2) * depth[k] / f, (centers[k, 1] - h / 2) * depth[k] / f, depth[k]])
+            # Angles are measured against the line of sight to the nose
+            los = line_of_sight(tvec)
+            truth[t, k] = euler_angles(los.T @ rmat)
+            cam = mesh @ rmat.T + tvec
+            u = f * cam[:, 0] / cam[:, 2] + w / 2 + rng.normal(0, noise_px, len(cam))
+            v = f * cam[:, 1] / cam[:, 2] + h / 2 + rng.normal(0, noise_px, len(cam))
+            # FaceMesh predicts depth from a crop around the face, i.e. along
+            # the line of sight, on the same scale as x
+            z = f * ((cam - tvec) @ los)[:, 2] / np.linalg.norm(tvec) + rng.normal(0, noise_px, len(cam))
+            points[t, k] = np.stack([u / w, v / h, z / w], axis=1)
+    return points, truth
+
+
+def legacy_pose(face_2d, w, h):
+    # Per-call path (and model) the engine used before HeadPoseSolver
+    focal_length = 1 * w
+    cam_matrix = np.array([[focal_length, 0, w / 2], [0, focal_length, h / 2], [0, 0, 1]])
+    dist_matrix = np.zeros((4, 1), dtype=np.float64)
+    success, rot_vec, trans_vec = cv2.solvePnP(LEGACY_FACE_3D, face_2d, cam_matrix, dist_matrix)
+    if not success:
+        return np.nan, np.nan
+    rmat, _ = cv2.Rodrigues(rot_vec)
+    pitch, yaw = euler_angles(rmat @ MODEL_TO_CAMERA)
+    cv2.RQDecomp3x3(rmat)
+    return pitch, yaw
+
+
+def run_mode(mode, points, w, h):
+    frames, faces = points.shape[:2]
+    estimates = np.zeros((frames, faces, 2))
+    if mode == "legacy":
+        start = time.perf_counter()
+        for t in range(frames):
+            faces_2d = points[t][:, LEGACY_INDICES, :2].astype(np.float64, order="C") * [w, h]
+            for k in range(faces):
+                estimates[t, k] = legacy_pose(faces_2d[k], w, h)
+        return estimates, time.perf_counter() - start
+
+    solver = HeadPoseSolver(mode=mode)
+    start = time.perf_counter()
+    for t in range(frames):
+        pitch, yaw = solver.solve(points[t], POSE_INDICES, w, h)
+        estimates[t, :, 0] = pitch
+        estimates[t, :, 1] = yaw
+    return estimates, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--faces", type=int, default=30)
+    parser.add_argument("--frames", type=int, default=200)
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--noise", type=float, default=1.0, help="landmark noise in pixels")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--image", help="take the head from the first face FaceMesh finds in this image")
+    parser.add_argument("--out", help="write JSON results here")
+    parser.add_argument("--compare", help="baseline JSON to compare against")
+    args = parser.parse_args()
+
+    face, face_w, face_h = load_face(args.image)
+    mesh = upright_mesh(face, face_w, face_h)
+    points, truth = make_sequences(mesh, args.faces, args.frames, args.width, args.height, args.noise, args.seed)
+    total = args.faces * args.frames
+    results = {"head_pose": {}}
+    # The photo as FaceMesh saw it: every mode should agree on its pose
+    still = {mode: HeadPoseSolver(mode=mode).solve(face[None], POSE_INDICES, face_w, face_h)
+             for mode in HeadPoseSolver.MODES}
+    print("source face: " + ", ".join(f"{mode} pitch {p[0]:.1f} yaw {y[0]:.1f}" for mode, (p, y) in still.items()))
+    results["source_face"] = {mode: {"pitch": float(p[0]), "yaw": float(y[0])} for mode, (p, y) in still.items()}
+    print(f"{'mode':<10} {'us/face':>9} {'pitch MAE':>10} {'yaw MAE':>9} {'p95 err':>9} {'failed':>7}")
+    for mode in ("legacy", "pnp", "fast"):
+        estimates, elapsed = run_mode(mode, points, args.width, args.height)
+        err = np.abs(estimates - truth)
+        failed = int(np.isnan(err).any(axis=2).sum())
+        r = results["head_pose"][mode] = {
+            "us_per_face": elapsed / total * 1e6,
+            "pitch_mae": float(np.nanmean(err[..., 0])),
+            "yaw_mae": float(np.nanmean(err[..., 1])),
+            "p95_error": float(np.nanpercentile(err, 95)),
+            "failed": failed,
+        }
+        print(f"{mode:<10} {r['us_per_face']:>9.1f} {r['pitch_mae']:>10.2f} {r['yaw_mae']:>9.2f} "
+              f"{r['p95_error']:>9.2f} {failed:>7}")
+
+    if args.out:
+        save_results(args.out, args, results)
+    if args.compare:
+        compare_results(args.compare, results, metric="us_per_face")
+        compare_results(args.compare, results, metric="p95_error")
+
+
+if __name__ == "__main__":
+    main()
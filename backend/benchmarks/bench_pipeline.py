@@ -0,0 +1,177 @@
+"""Per-stage latency of the vision pipeline on a deterministic frame set.
+
+Two kinds of input:
+  - synthetic (default): seeded noise frames at each resolution, plus
+    synthetic landmark sets for each face count so the per-face stages (EAR,
+    PnP, serialization) scale like a real classroom. FaceMesh sees no faces.
+  - recorded: --frames-dir with images or --video with a clip, run through
+    the real pipeline end to end.
+
+Stages: decode, color, facemesh, landmarks, ear, pnp, serialize, plus the
+end-to-end VisionEngine.process_frame and VideoProcessor.recv (when the
+Streamlit/av dependencies are installed).
+
+    python benchmarks/bench_pipeline.py --out results.json
+    python benchmarks/bench_pipeline.py --frames-dir recordings/ --compare results.json
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+
+import cv2
+import numpy as np
+
+from common import StageTimer, compare_results, save_results, synthetic_frames
+from bench_head_pose import make_sequences
+from landmarks import landmarks_to_array, to_pixels, average_ear, gaze_direction, heatmap_points
+from vision_engine import VisionEngine
+
+RESOLUTIONS = {"480p": (640, 480), "720p": (1280, 720), "1080p": (1920, 1080)}
+
+
+def recorded_frames(args):
+    frames = []
+    if args.frames_dir:
+        for path in sorted(glob.glob(os.path.join(args.frames_dir, "*")))[:args.frames]:
+            image = cv2.imread(path)
+            if image is not None:
+                frames.append(image)
+    elif args.video:
+        capture = cv2.VideoCapture(args.video)
+        while len(frames) < args.frames:
+            ok, image = capture.read()
+            if not ok:
+                break
+            frames.append(image)
+        capture.release()
+    return frames
+
+
+def response_payload(students):
+    return json.dumps({
+        "students": students,
+        "stats": {"total": len(students), "distracted": 0, "drowsy": 0, "engagement": 100},
+        "intervention": None,
+    })
+
+
+def students_from(pixels, pitch, yaw, ids):
+    ears = average_ear(pixels)
+    directions = gaze_direction(pitch, yaw)
+    positions = heatmap_points(pixels)
+    return [{
+        "id": int(ids[i]), "drowsy": bool(ears[i] < 0.25), "ear": round(float(ears[i]), 2),
+        "distracted": bool(abs(pitch[i]) > 15 or abs(yaw[i]) > 20), "looking_at": str(directions[i]),
+        "emotion": "Neutral", "position": {"x": int(positions[i, 0]), "y": int(positions[i, 1])},
+    } for i in range(len(pixels))]
+
+
+def bench_stages(engine, frames, jpeg_quality, landmark_sets=None):
+    """Times each stage separately. landmark_sets: per-frame (faces, N, 3)
+    arrays that replace FaceMesh output for the per-face stages."""
+    timer = StageTimer()
+    encoded = [cv2.imencode(".jpg", f, [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality])[1] for f in frames]
+    for i, buf in enumerate(encoded):
+        frame = timer.time("decode", cv2.imdecode, buf, cv2.IMREAD_COLOR)
+        h, w = frame.shape[:2]
+        rgb = timer.time("color", cv2.cvtColor, frame, cv2.COLOR_BGR2RGB)
+        results = timer.time("facemesh", engine.face_mesh.process, rgb)
+        if landmark_sets is not None:
+            points = landmark_sets[i]
+        else:
+            points = timer.time("landmarks", landmarks_to_array, results.multi_face_landmarks)
+        pixels = to_pixels(points, w, h)
+        timer.time("ear", average_ear, pixels)
+        pitch, yaw = timer.time("pnp", engine.pose_solver.solve, points, engine.pose_indices, w, h)
+        students = students_from(pixels, pitch, yaw, range(len(points)))
+        timer.time("serialize", response_payload, students)
+    return timer.summary(), float(np.mean([len(b) for b in encoded]))
+
+
+def bench_end_to_end(frames, engine_kwargs):
+    timer = StageTimer()
+    engine = VisionEngine(**engine_kwargs)
+    for frame in frames:
+        timer.time("process_frame", engine.process_frame, frame)
+    summary = timer.summary()
+
+    try:
+        sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+        import av
+        from modules.tracking import VideoProcessor
+    except ImportError as e:
+        summary["recv"] = {"skipped": f"VideoProcessor unavailable: {e}"}
+        return summary
+
+    processor = VideoProcessor()
+    recv_timer = StageTimer()
+    for frame in frames:
+        video_frame = av.VideoFrame.from_ndarray(frame, format="bgr24")
+        recv_timer.time("recv", processor.recv, video_frame)
+    summary.update(recv_timer.summary())
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--frames", type=int, default=60, help="frames per case")
+    parser.add_argument("--resolutions", default="480p,720p,1080p")
+    parser.add_argument("--faces", default="1,10,30", help="face counts for synthetic per-face stages")
+    parser.add_argument("--frames-dir", help="directory of recorded frames (images)")
+    parser.add_argument("--video", help="recorded video file")
+    parser.add_argument("--jpeg-quality", type=int, default=80)
+    parser.add_argument("--pose-mode", default="pnp", choices=["pnp", "fast"])
+    parser.add_argument("--keyframe-interval", type=int, default=1)
+    parser.add_argument("--multi-face", action="store_true",
+                        help="run end-to-end cases with the detect-then-crop-then-mesh pipeline")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="write JSON results here")
+    parser.add_argument("--compare", help="baseline JSON to compare against")
+    args = parser.parse_args()
+
+    engine_kwargs = {"pose_mode": args.pose_mode, "keyframe_interval": args.keyframe_interval}
+    engine = VisionEngine(**engine_kwargs)
+    # Per-stage cases always time the full-frame mesh; end to end can use crops
+    end_to_end_kwargs = dict(engine_kwargs, multi_face=args.multi_face)
+    results = {}
+
+    if args.frames_dir or args.video:
+        frames = recorded_frames(args)
+        if not frames:
+            parser.error("no readable frames found")
+        h, w = frames[0].shape[:2]
+        case = f"recorded_{w}x{h}"
+        stages, jpeg_bytes = bench_stages(engine, frames, args.jpeg_quality)
+        stages.update(bench_end_to_end(frames, end_to_end_kwargs))
+        stages["jpeg_bytes"] = jpeg_bytes
+        results[case] = stages
+    else:
+        for name in args.resolutions.split(","):
+            w, h = RESOLUTIONS[name]
+            frames = synthetic_frames(w, h, args.frames, args.seed)
+            for faces in (int(n) for n in args.faces.split(",")):
+                points, _ = make_sequences(faces, args.frames, w, h, 1.0, args.seed)
+                stages, jpeg_bytes = bench_stages(engine, frames, args.jpeg_quality, landmark_sets=points)
+                stages["jpeg_bytes"] = jpeg_bytes
+                results[f"synthetic_{name}_{faces}faces"] = stages
+            results[f"synthetic_{name}_end_to_end"] = bench_end_to_end(frames, end_to_end_kwargs)
+
+    for case, stages in results.items():
+        print(case)
+        for stage, stats in stages.items():
+            if isinstance(stats, dict) and "p50_ms" in stats:
+                print(f"  {stage:<14} p50 {stats['p50_ms']:8.3f}  p90 {stats['p90_ms']:8.3f}  "
+                      f"p99 {stats['p99_ms']:8.3f} ms")
+            elif isinstance(stats, dict):
+                print(f"  {stage:<14} {stats.get('skipped', stats)}")
+
+    if args.out:
+        save_results(args.out, args, results)
+    if args.compare:
+        compare_results(args.compare, results)
+
+
+if __name__ == "__main__":
+    main()
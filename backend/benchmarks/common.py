@@ -0,0 +1,90 @@
+import json
+import os
+import platform
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+
+class StageTimer:
+    """Collects wall-clock samples per named stage."""
+
+    def __init__(self):
+        self.samples = {}
+
+    def time(self, stage, fn, *args, **kwargs):
+        start = time.perf_counter()
+        result = fn(*args, **kwargs)
+        self.add(stage, time.perf_counter() - start)
+        return result
+
+    def add(self, stage, seconds):
+        self.samples.setdefault(stage, []).append(seconds * 1000.0)
+
+    def summary(self):
+        return {stage: latency_summary(values) for stage, values in self.samples.items()}
+
+
+def synthetic_frames(width, height, count, seed):
+    # Smooth noise so JPEG sizes are realistic rather than incompressible
+    rng = np.random.default_rng(seed)
+    small = rng.integers(0, 255, size=(count, height // 16, width // 16, 3), dtype=np.uint8)
+    return [cv2.resize(f, (width, height), interpolation=cv2.INTER_CUBIC) for f in small]
+
+
+def latency_summary(values_ms):
+    values = np.asarray(values_ms, dtype=np.float64)
+    if len(values) == 0:
+        return {"count": 0}
+    p50, p90, p99 = np.percentile(values, [50, 90, 99])
+    return {
+        "count": int(len(values)),
+        "mean_ms": float(values.mean()),
+        "p50_ms": float(p50),
+        "p90_ms": float(p90),
+        "p99_ms": float(p99),
+        "max_ms": float(values.max()),
+    }
+
+
+def environment():
+    info = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "timestamp": time.time(),
+    }
+    for name in ("cv2", "mediapipe"):
+        try:
+            info[name] = __import__(name).__version__
+        except (ImportError, AttributeError):
+            info[name] = None
+    return info
+
+
+def save_results(path, args, results):
+    with open(path, "w") as f:
+        json.dump({"environment": environment(), "args": vars(args), "results": results}, f, indent=2)
+    print(f"Results written to {path}")
+
+
+def compare_results(baseline_path, results, metric="p50_ms"):
+    """Print the change of ``metric`` for every (case, stage) present in both runs."""
+    with open(baseline_path) as f:
+        baseline = json.load(f)["results"]
+    print(f"\nChange in {metric} vs {baseline_path}:")
+    for case, stages in results.items():
+        old_stages = baseline.get(case)
+        if not isinstance(stages, dict) or not isinstance(old_stages, dict):
+            continue
+        for stage, stats in stages.items():
+            old = old_stages.get(stage, {})
+            if not isinstance(stats, dict) or metric not in stats or metric not in old:
+                continue
+            delta = (stats[metric] - old[metric]) / old[metric] * 100 if old[metric] else 0.0
+            print(f"  {case:<28} {stage:<14} {old[metric]:>9.3f} -> {stats[metric]:>9.3f} ({delta:+.1f}%)")
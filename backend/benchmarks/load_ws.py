@@ -0,0 +1,210 @@
+"""Load generator for the /ws endpoint.
+
+Opens N concurrent clients that send binary frames (see frame_protocol.py) at a
+fixed rate and measures throughput and end-to-end latency from send to the
+response carrying the same sequence number. Frames the server dropped under
+load (latest-frame-wins) are counted from the responses. With --follow-control
+clients connect with ?control=1 and switch frame rate, width and JPEG quality
+whenever the server sends a capture hint (see capture_control.py).
+
+    uvicorn main:app --port 8000 &
+    python benchmarks/load_ws.py --clients 30 --fps 15 --duration 20 --out load.json
+    python benchmarks/load_ws.py --clients 30 --width 1280 --follow-control --duration 60
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import cv2
+import websockets
+
+from common import compare_results, latency_summary, save_results, synthetic_frames
+from compact_stream import CompactDecoder
+from frame_protocol import choose_decode_scale, pack_frame
+from landmarks import MIN_INPUT_WIDTH
+
+
+def load_image(args):
+    if args.image:
+        image = cv2.imread(args.image)
+        if image is None:
+            raise SystemExit(f"cannot read {args.image}")
+        if args.width:
+            h = int(image.shape[0] * args.width / image.shape[1])
+            image = cv2.resize(image, (args.width, h))
+        return image
+    return synthetic_frames(args.width or 640, int((args.width or 640) * 3 / 4), 1, args.seed)[0]
+
+
+def encode_payload(image, jpeg_quality, width=None):
+    if width and width < image.shape[1]:
+        image = cv2.resize(image, (width, int(image.shape[0] * width / image.shape[1])),
+                           interpolation=cv2.INTER_AREA)
+    ok, buf = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality])
+    return buf.tobytes()
+
+
+class Payloads:
+    # Encoded frame per (width, quality) hint, so following a hint costs one encode
+    def __init__(self, image, jpeg_quality):
+        self.image = image
+        self.default = encode_payload(image, jpeg_quality)
+        self.cache = {}
+
+    def get(self, hint=None):
+        if hint is None:
+            return self.default
+        key = (hint["width"], hint["quality"])
+        if key not in self.cache:
+            self.cache[key] = encode_payload(self.image, int(hint["quality"] * 100), hint["width"])
+        return self.cache[key]
+
+    def width(self, hint=None):
+        # Width of the frames sent under this hint (hints never upscale)
+        if hint is None:
+            return self.image.shape[1]
+        return min(hint["width"], self.image.shape[1])
+
+
+async def run_client(index, args, payloads, deadline, stats):
+    url = f"{args.url}?room={args.room}&session={args.session}-{index}&format={args.format}"
+    if args.follow_control:
+        url += "&control=1"
+    hint = None
+    hints = 0
+    # --scale is picked for the full-size frame; each hinted width gets its own
+    # (never more reduced) so the server still decodes MIN_INPUT_WIDTH pixels
+    scale = args.scale
+    compact = CompactDecoder() if args.format == "compact" else None
+    received_bytes = 0
+    sent_at = {}
+    latencies = []
+    responses = 0
+    dropped = 0
+    errors = 0
+    sent_bytes = 0
+
+    async with websockets.connect(url, max_size=None) as ws:
+        async def sender():
+            seq = 0
+            next_send = time.perf_counter()
+            nonlocal sent_bytes
+            while time.perf_counter() < deadline:
+                sent_at[seq] = time.perf_counter()
+                message = pack_frame(payloads.get(hint), seq, scale=scale)
+                sent_bytes += len(message)
+                await ws.send(message)
+                seq += 1
+                next_send += 1.0 / (hint["fps"] if hint else args.fps)
+                await asyncio.sleep(max(0.0, next_send - time.perf_counter()))
+            return seq
+
+        async def receiver():
+            nonlocal responses, dropped, errors, received_bytes, hint, hints, scale
+            while True:
+                message = await ws.recv()
+                received = time.perf_counter()
+                received_bytes += len(message)
+                data = compact.decode(message) if isinstance(message, bytes) else json.loads(message)
+                if "control" in data:
+                    hint = data["control"]
+                    hints += 1
+                    if args.scale:
+                        scale = min(args.scale, choose_decode_scale(payloads.width(hint), MIN_INPUT_WIDTH))
+                    continue
+                if "error" in data:
+                    errors += 1
+                    continue
+                frame = data.get("frame", {})
+                seq = frame.get("seq")
+                start = sent_at.pop(seq, None)
+                if start is not None:
+                    latencies.append((received - start) * 1000.0)
+                # Frames are answered in order, so anything older was dropped
+                # by the server and will never be answered
+                while sent_at and seq is not None and next(iter(sent_at)) < seq:
+                    del sent_at[next(iter(sent_at))]
+                responses += 1
+                dropped = frame.get("dropped", dropped)
+
+        receive_task = asyncio.create_task(receiver())
+        sent = await sender()
+        # Give in-flight frames a moment to come back
+        await asyncio.sleep(args.drain)
+        receive_task.cancel()
+
+    stats.append({"client": index, "sent": sent, "responses": responses, "dropped": dropped,
+                  "errors": errors, "received_bytes": received_bytes, "sent_bytes": sent_bytes,
+                  "latencies": latencies, "hints": hints, "hint": hint})
+
+
+async def run(args):
+    payloads = Payloads(load_image(args), args.jpeg_quality)
+    stats = []
+    start = time.perf_counter()
+    deadline = start + args.duration
+    await asyncio.gather(*(run_client(i, args, payloads, deadline, stats) for i in range(args.clients)))
+    elapsed = time.perf_counter() - start - args.drain
+
+    latencies = [v for s in stats for v in s["latencies"]]
+    sent = sum(s["sent"] for s in stats)
+    responses = sum(s["responses"] for s in stats)
+    return {
+        "load": {
+            "clients": args.clients,
+            "payload_bytes": sum(s["sent_bytes"] for s in stats) / max(sent, 1),
+            "sent": sent,
+            "responses": responses,
+            "dropped": sum(s["dropped"] for s in stats),
+            "errors": sum(s["errors"] for s in stats),
+            "format": args.format,
+            "response_bytes": sum(s["received_bytes"] for s in stats) / max(responses, 1),
+            "offered_fps": sent / elapsed,
+            "throughput_fps": responses / elapsed,
+            "end_to_end": latency_summary(latencies),
+            "control_hints": sum(s["hints"] for s in stats),
+            "final_hints": [s["hint"] for s in stats if s["hint"] is not None],
+        }
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="ws://localhost:8000/ws")
+    parser.add_argument("--clients", type=int, default=10)
+    parser.add_argument("--fps", type=float, default=15)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--drain", type=float, default=1.0)
+    parser.add_argument("--image", help="frame to send (default: synthetic)")
+    parser.add_argument("--width", type=int, help="resize frames to this width")
+    parser.add_argument("--jpeg-quality", type=int, default=80)
+    parser.add_argument("--scale", type=int, default=0, help="decode scale hint in the frame header")
+    parser.add_argument("--format", default="json", choices=["json", "compact"], help="response format to request")
+    parser.add_argument("--follow-control", action="store_true",
+                        help="request capture hints (?control=1) and follow them")
+    parser.add_argument("--room", default="loadtest")
+    parser.add_argument("--session", default="load")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="write JSON results here")
+    parser.add_argument("--compare", help="baseline JSON to compare against")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    load = results["load"]
+    e2e = load["end_to_end"]
+    print(f"clients={load['clients']} sent={load['sent']} responses={load['responses']} "
+          f"dropped={load['dropped']} errors={load['errors']}")
+    print(f"offered {load['offered_fps']:.1f} fps, throughput {load['throughput_fps']:.1f} fps, "
+          f"{load['response_bytes']:.0f} bytes per {load['format']} response")
+    if e2e["count"]:
+        print(f"end-to-end latency p50 {e2e['p50_ms']:.1f} ms, p90 {e2e['p90_ms']:.1f} ms, "
+              f"p99 {e2e['p99_ms']:.1f} ms")
+    if args.out:
+        save_results(args.out, args, results)
+    if args.compare:
+        compare_results(args.compare, {"load": {"end_to_end": e2e}})
+
+
+if __name__ == "__main__":
+    main()
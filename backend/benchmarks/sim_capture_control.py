@@ -0,0 +1,179 @@
+"""Simulated /ws clients against a simulated worker pool, driven by CaptureController.
+
+No server or model is involved: each frame costs a fixed part plus a part that
+scales with pixels and JPEG quality (with seeded jitter), cameras are pinned to
+workers round robin as in worker_pool.py, every connection has a latest-wins
+mailbox and is answered one frame at a time like the /ws loop. Clients start
+at full quality and follow every hint. Prints per-second aggregates and
+checks that, after settling, each client's p90 latency is within the budget.
+Exits with status 1 when it is not.
+
+    python benchmarks/sim_capture_control.py --clients 30 --workers 4 --budget-ms 150
+    python benchmarks/sim_capture_control.py --clients 10 --join 20 --join-at 20 --duration 60
+"""
+import argparse
+import heapq
+import json
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from capture_control import CaptureController
+
+
+def frame_cost_ms(width, quality, args, rng):
+    pixels = (width / 640.0) ** 2
+    return (args.fixed_ms + args.pixel_ms * pixels * (0.6 + 0.4 * quality)) * rng.uniform(0.8, 1.2)
+
+
+class Client:
+    def __init__(self, index, worker, args, start):
+        self.index = index
+        self.worker = worker
+        self.start = start
+        self.controller = CaptureController(budget_ms=args.budget_ms, max_fps=args.max_fps)
+        self.hint = self.controller.hint(force=True)
+        self.mailbox = None      # receive time of the waiting frame
+        self.busy = False
+        self.dropped = 0
+        self.reported_dropped = 0
+        self.answered = []       # (time, latency_ms)
+
+
+def simulate(args):
+    rng = random.Random(args.seed)
+    clients = []
+    for i in range(args.clients + args.join):
+        start = 0.0 if i < args.clients else args.join_at
+        clients.append(Client(i, i % args.workers, args, start + rng.uniform(0, 0.1)))
+    queues = [[] for _ in range(args.workers)]   # FIFO of (client, pickup time) per worker
+    worker_busy = [False] * args.workers
+    events = []   # (time, order, kind, client)
+    order = 0
+
+    def push(t, kind, client):
+        nonlocal order
+        heapq.heappush(events, (t, order, kind, client))
+        order += 1
+
+    def pick_up(client, now):
+        # The connection loop takes the newest frame and hands it to its worker
+        received = client.mailbox
+        client.mailbox = None
+        client.busy = True
+        queues[client.worker].append((client, received, now))
+        dispatch(client.worker, now)
+
+    def dispatch(worker, now):
+        if worker_busy[worker] or not queues[worker]:
+            return
+        client, received, picked = queues[worker].pop(0)
+        worker_busy[worker] = True
+        cost = frame_cost_ms(client.hint["width"], client.hint["quality"], args, rng) / 1000.0
+        push(now + cost, "done", (client, received, picked))
+
+    for client in clients:
+        push(client.start, "send", client)
+
+    while events:
+        now, _, kind, payload = heapq.heappop(events)
+        if now > args.duration:
+            break
+        if kind == "send":
+            client = payload
+            if client.mailbox is not None:
+                client.dropped += 1
+            client.mailbox = now
+            if not client.busy:
+                pick_up(client, now)
+            push(now + 1.0 / client.hint["fps"], "send", client)
+        else:
+            client, received, picked = payload
+            worker_busy[client.worker] = False
+            latency = (now - received) * 1000.0
+            client.answered.append((now, latency))
+            dropped = client.dropped - client.reported_dropped
+            client.reported_dropped = client.dropped
+            hint = client.controller.observe(latency, (now - picked) * 1000.0, dropped, now=now)
+            if hint is not None:
+                client.hint = hint
+            client.busy = False
+            if client.mailbox is not None:
+                pick_up(client, now)
+            dispatch(client.worker, now)
+    return clients
+
+
+def p90(values):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(0.9 * len(ordered)))] if ordered else 0.0
+
+
+def report(clients, args):
+    seconds = int(args.duration)
+    timeline = []
+    for second in range(seconds):
+        latencies = [lat for c in clients for t, lat in c.answered if second <= t < second + 1]
+        active = [c for c in clients if c.start <= second]
+        timeline.append({
+            "t": second,
+            "clients": len(active),
+            "answered_fps": len(latencies),
+            "p90_ms": round(p90(latencies), 1),
+        })
+    if not args.quiet:
+        print(f"{'t':>4} {'clients':>7} {'answered/s':>10} {'p90 ms':>8}")
+        for row in timeline:
+            print(f"{row['t']:>4} {row['clients']:>7} {row['answered_fps']:>10} {row['p90_ms']:>8}")
+
+    # Settled: the last third of the run (and after the last join)
+    settle = max(args.duration * 2 / 3, args.join_at + args.settle if args.join else 0)
+    per_client = []
+    for c in clients:
+        tail = [lat for t, lat in c.answered if t >= settle]
+        per_client.append({"client": c.index, "p90_ms": round(p90(tail), 1), "answered": len(tail),
+                           "hint": c.hint, "adjustments": c.controller.adjustments})
+    worst = max(per_client, key=lambda r: r["p90_ms"])
+    starved = [r["client"] for r in per_client if r["answered"] == 0]
+    converged = worst["p90_ms"] <= args.budget_ms and not starved
+    summary = {
+        "converged": converged,
+        "budget_ms": args.budget_ms,
+        "settled_after_s": settle,
+        "worst_client_p90_ms": worst["p90_ms"],
+        "starved_clients": starved,
+        "answered_fps_settled": sum(r["answered"] for r in per_client) / max(args.duration - settle, 1e-9),
+        "hints": sorted({json.dumps(r["hint"], sort_keys=True) for r in per_client}),
+    }
+    print(json.dumps(summary, indent=2))
+    return {"timeline": timeline, "clients": per_client, "summary": summary}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, default=30)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--budget-ms", type=float, default=150.0)
+    parser.add_argument("--max-fps", type=float, default=15.0)
+    parser.add_argument("--fixed-ms", type=float, default=8.0, help="per-frame cost independent of size")
+    parser.add_argument("--pixel-ms", type=float, default=12.0, help="extra cost of a 640px frame at quality 1")
+    parser.add_argument("--duration", type=float, default=60.0)
+    parser.add_argument("--join", type=int, default=0, help="clients that join at --join-at")
+    parser.add_argument("--join-at", type=float, default=20.0)
+    parser.add_argument("--settle", type=float, default=20.0, help="seconds allowed to settle after the join")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--quiet", action="store_true", help="only print the summary")
+    parser.add_argument("--out", help="write JSON results here")
+    args = parser.parse_args()
+
+    results = report(simulate(args), args)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+    sys.exit(0 if results["summary"]["converged"] else 1)
+
+
+if __name__ == "__main__":
+    main()
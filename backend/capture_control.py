@@ -0,0 +1,118 @@
+import time
+
+# Capture settings a client can be asked for, most expensive first: frame
+# width in pixels and JPEG quality (0-1). The controller moves one step at a time.
+CAPTURE_LEVELS = [
+    (1280, 0.8),
+    (960, 0.8),
+    (640, 0.8),
+    (640, 0.6),
+    (480, 0.6),
+    (320, 0.6),
+]
+
+
+class CaptureController:
+    """Feedback controller for one /ws connection's capture settings.
+
+    Every ``interval`` seconds it looks at the frames answered since the last
+    decision (p90 over the window) and adjusts two knobs:
+
+    - resolution/quality (CAPTURE_LEVELS): one step down while the time from
+      picking a frame up to answering it (decode, waiting for the worker,
+      inference) takes more than ``service_share`` of the budget, leaving the
+      rest for time in the mailbox; one step up after ``hold`` calm intervals
+      below ``low_water`` of the budget.
+    - frame rate (AIMD): multiplied by ``decrease`` when the full latency
+      (including time spent waiting in the mailbox) is over ``headroom`` of
+      the budget or more than ``max_drop_rate`` of the frames were dropped,
+      otherwise raised by ``increase`` fps; never above what the measured
+      per-frame time can sustain.
+
+    observe() returns a hint dict whenever the target changed, else None.
+    benchmarks/sim_capture_control.py simulates many clients following it.
+    """
+
+    def __init__(self, budget_ms=150.0, min_fps=1.0, max_fps=15.0, levels=CAPTURE_LEVELS, interval=1.0,
+                 min_samples=3, decrease=0.7, increase=0.5, service_share=0.6, low_water=0.25, hold=5,
+                 max_drop_rate=0.2, headroom=0.8, level=0):
+        self.budget_ms = budget_ms
+        self.min_fps = min_fps
+        self.max_fps = max_fps
+        self.levels = levels
+        self.interval = interval
+        self.min_samples = min_samples
+        self.decrease = decrease
+        self.increase = increase
+        self.service_share = service_share
+        self.low_water = low_water
+        self.hold = hold
+        self.max_drop_rate = max_drop_rate
+        self.headroom = headroom
+        self.level = level
+        self.fps = max_fps
+        self.calm = 0
+        self.window_start = None
+        self.latencies = []
+        self.service = []
+        self.dropped = 0
+        self.last_hint = None
+        self.adjustments = 0
+
+    def observe(self, latency_ms, service_ms, dropped=0, now=None):
+        """One answered frame: latency_ms from receipt to answer, service_ms
+        from pickup to answer, dropped frames since the previous call."""
+        now = time.monotonic() if now is None else now
+        if self.window_start is None:
+            self.window_start = now
+        self.latencies.append(latency_ms)
+        self.service.append(service_ms)
+        self.dropped += dropped
+        if now - self.window_start < self.interval or len(self.latencies) < self.min_samples:
+            return None
+        hint = self._decide(now - self.window_start)
+        self.window_start = now
+        self.latencies = []
+        self.service = []
+        self.dropped = 0
+        return hint
+
+    def _decide(self, elapsed):
+        latency = _p90(self.latencies)
+        service = _p90(self.service)
+
+        overloaded = latency > self.budget_ms * self.headroom or self.dropped > self.max_drop_rate * len(self.latencies)
+        if service > self.budget_ms * self.service_share and self.level < len(self.levels) - 1:
+            self.level += 1
+            self.calm = 0
+        elif service < self.budget_ms * self.low_water and latency < self.budget_ms * 0.5 and not overloaded:
+            self.calm += 1
+            if self.calm >= self.hold and self.level > 0:
+                self.level -= 1
+                self.calm = 0
+        else:
+            self.calm = 0
+
+        if overloaded:
+            self.fps *= self.decrease
+        else:
+            self.fps += self.increase
+        # A connection is answered one frame at a time, so it can't go faster
+        # than its per-frame time allows
+        sustainable = 1000.0 / max(sum(self.service) / len(self.service), 1e-3)
+        self.fps = min(max(self.fps, self.min_fps), self.max_fps, max(sustainable, self.min_fps))
+        return self.hint()
+
+    def hint(self, force=False):
+        width, quality = self.levels[self.level]
+        hint = {"fps": round(self.fps, 1), "width": width, "quality": quality, "budget_ms": self.budget_ms}
+        if not force and hint == self.last_hint:
+            return None
+        self.last_hint = hint
+        self.adjustments += 1
+        return hint
+
+
+def _p90(values):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(0.9 * len(ordered)))]
@@ -0,0 +1,245 @@
+import struct
+import time
+
+from session_store import EMOTIONS
+
+# Compact /ws responses (``/ws?format=compact``), binary, little endian.
+#
+# Header, 16 bytes:
+#   magic    2s   b"IC"
+#   version  B    1
+#   kind     B    0 = full snapshot, 1 = delta against the previous message
+#   flags    B    HAS_STATS | HAS_INTERVENTION
+#   pad      x
+#   seq      I    sequence number of the frame this answers
+#   dropped  I    frames replaced by a newer one on this connection so far
+#   count    H    student records that follow
+# then, in order:
+#   removed  H + H*I    ids that left since the previous message (delta only)
+#   records             snapshot: count * STUDENT
+#                       delta:    count * (id I, field mask B, masked fields in FIELD order)
+#   stats    STATS      if HAS_STATS (rate limited, always in snapshots)
+#   text     H + utf8   if HAS_INTERVENTION (empty string clears it)
+COMPACT_MAGIC = b"IC"
+COMPACT_VERSION = 1
+COMPACT_HEADER = struct.Struct("<2sBBBxIIH")
+
+KIND_SNAPSHOT = 0
+KIND_DELTA = 1
+
+HAS_STATS = 1
+HAS_INTERVENTION = 2
+
+# state byte: bit 0 drowsy, bit 1 distracted, bits 2-4 gaze direction
+GAZE = ["Center", "Down", "Up", "Left", "Right"]
+UNKNOWN_CODE = 255
+
+STUDENT = struct.Struct("<IBBBHH")  # id, state, emotion, ear * 100, x, y
+DELTA_KEY = struct.Struct("<IB")    # id, field mask
+STATS = struct.Struct("<HHHf")      # total, distracted, drowsy, engagement
+COUNT = struct.Struct("<H")
+ID = struct.Struct("<I")
+
+FIELD_STATE = 1
+FIELD_EMOTION = 2
+FIELD_EAR = 4
+FIELD_POSITION = 8
+# (mask bit, struct, index into the packed values tuple)
+FIELDS = [
+    (FIELD_STATE, struct.Struct("<B"), slice(0, 1)),
+    (FIELD_EMOTION, struct.Struct("<B"), slice(1, 2)),
+    (FIELD_EAR, struct.Struct("<B"), slice(2, 3)),
+    (FIELD_POSITION, struct.Struct("<HH"), slice(3, 5)),
+]
+
+_GAZE_CODES = {name: code for code, name in enumerate(GAZE)}
+_EMOTION_CODES = {name: code for code, name in enumerate(EMOTIONS)}
+
+
+def _clamp16(v):
+    return min(max(int(v), 0), 0xFFFF)
+
+
+def pack_student(s):
+    # dict from VisionEngine.process_frame -> (state, emotion, ear, x, y)
+    state = s["drowsy"] | s["distracted"] << 1 | _GAZE_CODES.get(s["looking_at"], 0) << 2
+    ear = s["ear"]
+    ear = min(int(ear * 100 + 0.5), 255) if ear > 0 else 0
+    x = s["position"]["x"]
+    y = s["position"]["y"]
+    if not (0 <= x <= 0xFFFF and 0 <= y <= 0xFFFF):
+        x, y = _clamp16(x), _clamp16(y)
+    return state, _EMOTION_CODES.get(s["emotion"], UNKNOWN_CODE), ear, x, y
+
+
+def unpack_student(student_id, values):
+    state, emotion, ear, x, y = values
+    gaze = state >> 2
+    return {
+        "id": student_id,
+        "drowsy": bool(state & 1),
+        "ear": ear / 100.0,
+        "distracted": bool(state & 2),
+        "looking_at": GAZE[gaze] if gaze < len(GAZE) else "Unknown",
+        "emotion": EMOTIONS[emotion] if emotion < len(EMOTIONS) else "Unknown",
+        "position": {"x": x, "y": y},
+    }
+
+
+class CompactEncoder:
+    """Per-connection encoder for the compact response stream.
+
+    Keeps the values the client last received for each student and only sends
+    fields that moved past a tolerance. Every ``snapshot_interval`` messages a
+    full snapshot is sent so a client that missed state can resync. Stats are
+    sent at most every ``stats_interval`` seconds (and only when they changed).
+    """
+
+    def __init__(self, snapshot_interval=30, stats_interval=1.0, ear_tolerance=1, position_tolerance=2):
+        self.snapshot_interval = snapshot_interval
+        self.stats_interval = stats_interval
+        self.ear_tolerance = ear_tolerance            # in hundredths
+        self.position_tolerance = position_tolerance  # in pixels
+        self.sent = {}
+        self.messages = 0
+        self.last_stats = None
+        self.last_stats_time = 0.0
+        self.last_intervention = None
+
+    def _changed_fields(self, old, new):
+        mask = 0
+        if old[0] != new[0]:
+            mask |= FIELD_STATE
+        if old[1] != new[1]:
+            mask |= FIELD_EMOTION
+        if abs(old[2] - new[2]) >= self.ear_tolerance:
+            mask |= FIELD_EAR
+        if max(abs(old[3] - new[3]), abs(old[4] - new[4])) >= self.position_tolerance:
+            mask |= FIELD_POSITION
+        return mask
+
+    def encode(self, response, now=None):
+        # response: the dict the JSON mode would send
+        now = time.monotonic() if now is None else now
+        snapshot = self.messages % self.snapshot_interval == 0
+        self.messages += 1
+
+        students = response["students"]
+        stats = response["stats"]
+        stats = (stats.get("total", 0), stats.get("distracted", 0), stats.get("drowsy", 0),
+                 float(stats["engagement"]))
+        intervention = response["intervention"] or ""
+        frame_info = response["frame"]
+
+        body = bytearray()
+        count = 0
+        current = {s["id"]: pack_student(s) for s in students}
+
+        if snapshot:
+            for student_id, values in current.items():
+                body += STUDENT.pack(student_id, *values)
+            count = len(current)
+            self.sent = current
+        else:
+            removed = [i for i in self.sent if i not in current]
+            body += COUNT.pack(len(removed))
+            for student_id in removed:
+                body += ID.pack(student_id)
+                del self.sent[student_id]
+            for student_id, values in current.items():
+                old = self.sent.get(student_id)
+                if old is None:
+                    mask = FIELD_STATE | FIELD_EMOTION | FIELD_EAR | FIELD_POSITION
+                else:
+                    if old == values:
+                        continue
+                    mask = self._changed_fields(old, values)
+                    if not mask:
+                        continue
+                    # Unsent fields keep the client's old value so drift still accumulates
+                    values = (values[0] if mask & FIELD_STATE else old[0],
+                              values[1] if mask & FIELD_EMOTION else old[1],
+                              values[2] if mask & FIELD_EAR else old[2],
+                              *(values[3:] if mask & FIELD_POSITION else old[3:]))
+                body += DELTA_KEY.pack(student_id, mask)
+                for bit, packer, sl in FIELDS:
+                    if mask & bit:
+                        body += packer.pack(*values[sl])
+                self.sent[student_id] = values
+                count += 1
+
+        flags = 0
+        if snapshot or (stats != self.last_stats and now - self.last_stats_time >= self.stats_interval):
+            flags |= HAS_STATS
+            body += STATS.pack(*stats)
+            self.last_stats = stats
+            self.last_stats_time = now
+        if snapshot or intervention != self.last_intervention:
+            flags |= HAS_INTERVENTION
+            text = intervention.encode("utf-8")
+            body += COUNT.pack(len(text)) + text
+            self.last_intervention = intervention
+
+        header = COMPACT_HEADER.pack(COMPACT_MAGIC, COMPACT_VERSION, KIND_SNAPSHOT if snapshot else KIND_DELTA,
+                                     flags, frame_info["seq"] & 0xFFFFFFFF, frame_info["dropped"] & 0xFFFFFFFF,
+                                     count)
+        return header + bytes(body)
+
+
+class CompactDecoder:
+    """Client side of the compact stream: rebuilds the JSON-mode response.
+
+    Until the first snapshot arrives the state may be partial (``synced`` is False).
+    """
+
+    def __init__(self):
+        self.students = {}
+        self.stats = None
+        self.intervention = None
+        self.synced = False
+
+    def decode(self, data):
+        magic, version, kind, flags, seq, dropped, count = COMPACT_HEADER.unpack_from(data)
+        if magic != COMPACT_MAGIC or version != COMPACT_VERSION:
+            raise ValueError("not a compact stream message")
+        offset = COMPACT_HEADER.size
+
+        if kind == KIND_SNAPSHOT:
+            self.students = {}
+            for _ in range(count):
+                student_id, *values = STUDENT.unpack_from(data, offset)
+                offset += STUDENT.size
+                self.students[student_id] = tuple(values)
+            self.synced = True
+        else:
+            (removed,) = COUNT.unpack_from(data, offset)
+            offset += COUNT.size
+            for _ in range(removed):
+                self.students.pop(ID.unpack_from(data, offset)[0], None)
+                offset += ID.size
+            for _ in range(count):
+                student_id, mask = DELTA_KEY.unpack_from(data, offset)
+                offset += DELTA_KEY.size
+                values = list(self.students.get(student_id, (0, 0, 0, 0, 0)))
+                for bit, packer, sl in FIELDS:
+                    if mask & bit:
+                        values[sl] = packer.unpack_from(data, offset)
+                        offset += packer.size
+                self.students[student_id] = tuple(values)
+
+        if flags & HAS_STATS:
+            total, distracted, drowsy, engagement = STATS.unpack_from(data, offset)
+            offset += STATS.size
+            self.stats = {"total": total, "distracted": distracted, "drowsy": drowsy, "engagement": engagement}
+        if flags & HAS_INTERVENTION:
+            (length,) = COUNT.unpack_from(data, offset)
+            offset += COUNT.size
+            self.intervention = bytes(data[offset:offset + length]).decode("utf-8") or None
+
+        return {
+            "students": [unpack_student(i, v) for i, v in self.students.items()],
+            "stats": self.stats,
+            "intervention": self.intervention,
+            "frame": {"seq": seq, "dropped": dropped, "snapshot": kind == KIND_SNAPSHOT},
+            "synced": self.synced,
+        }
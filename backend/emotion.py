@@ -0,0 +1,261 @@
+import abc
+import queue
+import threading
+
+import cv2
+import numpy as np
+
+from session_store import EMOTIONS
+
+DEFAULT_EMOTION = "Neutral"
+
+
+class EmotionModel(abc.ABC):
+    """Interface for emotion classifiers: one batched call per group of faces.
+
+    ``predict`` gets a (faces, input_size, input_size, 3) uint8 BGR array of
+    face crops and returns one label from EMOTIONS per face.
+    """
+
+    input_size = 64
+
+    @abc.abstractmethod
+    def predict(self, crops):
+        """One label from EMOTIONS per crop."""
+
+    def close(self):
+        pass
+
+
+class StandInEmotionModel(EmotionModel):
+    """Deterministic, dependency-free stand-in (tests, benchmarks, demos).
+
+    The label depends only on the crop's mean brightness, so the same crop
+    always gets the same label and cost is one reduction per batch.
+    """
+
+    input_size = 32
+
+    def predict(self, crops):
+        if len(crops) == 0:
+            return []
+        means = crops.reshape(len(crops), -1).mean(axis=1)
+        return [EMOTIONS[int(m) * len(EMOTIONS) // 256] for m in means]
+
+
+class FerEmotionModel(EmotionModel):
+    """FER's CNN (``pip install fer``), run on crops we already located.
+
+    The whole batch goes through the classifier in one call, with FER's own
+    preprocessing (grayscale, scaled to [-1, 1]).
+    """
+
+    input_size = 64
+
+    def __init__(self):
+        from fer import FER
+
+        self.detector = FER(mtcnn=False)
+        labels = FER._get_labels()
+        self.labels = [labels[i].capitalize() for i in sorted(labels)]
+
+    def predict(self, crops):
+        if len(crops) == 0:
+            return []
+        # BGR to gray with OpenCV's weights, for the whole batch at once
+        gray = crops.astype(np.float32) @ np.array([0.114, 0.587, 0.299], dtype=np.float32)
+        scores = np.asarray(self.detector._classify_emotions((gray / 255.0 - 0.5) * 2.0))
+        names = (self.labels[i] for i in scores.argmax(axis=1))
+        return [name if name in EMOTIONS else DEFAULT_EMOTION for name in names]
+
+
+MODELS = {"standin": StandInEmotionModel, "fer": FerEmotionModel}
+
+
+def load_emotion_model(name):
+    # None when disabled or the model's dependencies are missing
+    if not name or name == "none":
+        return None
+    try:
+        return MODELS[name]()
+    except ImportError as e:
+        print(f"Emotion model {name!r} unavailable ({e}). Running without emotion detection.")
+        return None
+
+
+class EmotionWorker:
+    """Background thread that classifies queued face crops in batches.
+
+    submit() never blocks: when ``max_pending`` crops are already waiting the
+    crop is dropped (its face is simply retried later). Results are written
+    into the EmotionCache that submitted the crop, so one worker (and one
+    model) serves every engine in the process.
+    """
+
+    def __init__(self, model, batch_size=32, max_pending=256):
+        self.model = model
+        self.batch_size = batch_size
+        self.queue = queue.Queue(maxsize=max_pending)
+        self.batches = 0
+        self.classified = 0
+        self.dropped = 0
+        self.thread = threading.Thread(target=self._run, name="emotion-worker", daemon=True)
+        self.thread.start()
+
+    def submit(self, cache, key, crop, ts):
+        try:
+            self.queue.put_nowait((cache, key, crop, ts))
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            batch = [item]
+            while len(batch) < self.batch_size:
+                try:
+                    item = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    self.queue.put(None)
+                    break
+                batch.append(item)
+            try:
+                labels = self.model.predict(np.stack([crop for _, _, crop, _ in batch]))
+            except Exception as e:
+                print(f"Emotion model failed: {e}")
+                labels = [None] * len(batch)
+            for (cache, key, _, ts), label in zip(batch, labels):
+                cache.store(key, label, ts)
+            self.batches += 1
+            self.classified += len(batch)
+
+    def flush(self):
+        # Labels arrive in the background; nothing to wait for
+        pass
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join(timeout=5)
+        self.model.close()
+
+
+class InlineEmotionWorker:
+    """Same interface as EmotionWorker, but classifies on the calling thread.
+
+    Crops submitted for a frame are classified as one batch by flush(), before
+    the frame's labels are looked up, so results depend only on the input.
+    Used for offline analysis (analyze_video.py), where runs must be
+    reproducible and nobody waits on a frame.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.pending = []
+        self.batches = 0
+        self.classified = 0
+        self.dropped = 0
+
+    def submit(self, cache, key, crop, ts):
+        self.pending.append((cache, key, crop, ts))
+        return True
+
+    def flush(self):
+        if not self.pending:
+            return
+        batch, self.pending = self.pending, []
+        labels = self.model.predict(np.stack([crop for _, _, crop, _ in batch]))
+        for (cache, key, _, ts), label in zip(batch, labels):
+            cache.store(key, label, ts)
+        self.batches += 1
+        self.classified += len(batch)
+
+    def close(self):
+        self.model.close()
+
+
+_shared = {}
+_shared_lock = threading.Lock()
+
+
+def shared_emotion_worker(name, inline=False):
+    # One worker per model name and process, None when the model is disabled
+    with _shared_lock:
+        if (name, inline) not in _shared:
+            model = load_emotion_model(name)
+            worker = None
+            if model is not None:
+                worker = InlineEmotionWorker(model) if inline else EmotionWorker(model)
+            _shared[(name, inline)] = worker
+        return _shared[(name, inline)]
+
+
+class EmotionCache:
+    """Latest emotion per tracked face, refreshed in the background.
+
+    update() queues a crop for each face whose label is older than
+    ``refresh`` seconds and not already being classified, so the cost follows
+    the number of faces rather than the frame rate and process_frame never
+    waits for the model. Labels older than ``ttl`` fall back to Neutral.
+    """
+
+    def __init__(self, worker, refresh=1.0, ttl=5.0, margin=0.15):
+        self.worker = worker
+        self.refresh = refresh
+        self.ttl = ttl
+        self.margin = margin
+        self.labels = {}      # track id -> (label, ts of the crop)
+        self.requested = {}   # track id -> ts of the crop in flight
+
+    def _crop(self, frame, box):
+        h, w = frame.shape[:2]
+        x1, y1, x2, y2 = box
+        pad = self.margin * max(x2 - x1, y2 - y1)
+        x1, y1 = max(int(x1 - pad), 0), max(int(y1 - pad), 0)
+        x2, y2 = min(int(x2 + pad), w), min(int(y2 + pad), h)
+        if x2 <= x1 or y2 <= y1:
+            return None
+        size = self.worker.model.input_size
+        # resize copies, so the frame buffer can be reused right away
+        return cv2.resize(frame[y1:y2, x1:x2], (size, size), interpolation=cv2.INTER_AREA)
+
+    def update(self, frame, ids, boxes, now):
+        # ids: track ids, boxes: (faces, 4) pixel boxes
+        for key, box in zip(ids, boxes):
+            key = int(key)
+            entry = self.labels.get(key)
+            if entry is not None and now - entry[1] < self.refresh:
+                continue
+            pending = self.requested.get(key)
+            if pending is not None and now - pending < self.ttl:
+                continue
+            crop = self._crop(frame, box)
+            if crop is not None and self.worker.submit(self, key, crop, now):
+                self.requested[key] = now
+        self.worker.flush()
+
+    def store(self, key, label, ts):
+        # Called from the worker thread
+        self.requested.pop(key, None)
+        if label is not None:
+            self.labels[key] = (label, ts)
+
+    def lookup(self, ids, now):
+        result = []
+        for key in ids:
+            entry = self.labels.get(int(key))
+            result.append(entry[0] if entry is not None and now - entry[1] < self.ttl else DEFAULT_EMOTION)
+        return result
+
+    def retain(self, live_ids):
+        live = set(live_ids)
+        for table in (self.labels, self.requested):
+            # list() first: the worker thread may store while we prune
+            for key in list(table):
+                if key not in live:
+                    table.pop(key, None)
@@ -0,0 +1,197 @@
+import os
+import time
+from collections import OrderedDict
+
+# Resident memory of one VisionEngine, almost all of it the FaceMesh graph
+# (measured ~29 MB per engine with refine_landmarks=True).
+ENGINE_BYTES = 30 * 1024 * 1024
+
+
+def create_face_mesh():
+    import mediapipe as mp
+
+    return mp.solutions.face_mesh.FaceMesh(
+        min_detection_confidence=0.5,
+        min_tracking_confidence=0.5,
+        refine_landmarks=True
+    )
+
+
+def registry_options():
+    # EngineRegistry limits from the environment
+    memory_mb = os.environ.get("INSIGHT_ENGINE_MEMORY_MB")
+    return {
+        "ttl": float(os.environ.get("INSIGHT_ENGINE_TTL", 300)),
+        "max_engines": int(os.environ.get("INSIGHT_MAX_ENGINES", 64)),
+        "memory_cap": int(float(memory_mb) * 1024 * 1024) if memory_mb else None,
+    }
+
+
+class FaceMeshPool:
+    """Free list of FaceMesh graphs so new engines skip graph construction.
+
+    Meshes come back here when their engine is evicted and are reset so no
+    tracking state leaks to the next camera; at most ``max_idle`` are kept,
+    the rest are closed, and so are meshes nobody picked up within ``trim``.
+    """
+
+    def __init__(self, max_idle=4, factory=create_face_mesh):
+        self.max_idle = max_idle
+        self.factory = factory
+        self.idle = []
+        self.created = 0
+        self.reused = 0
+
+    def acquire(self):
+        if self.idle:
+            self.reused += 1
+            return self.idle.pop()[0]
+        self.created += 1
+        return self.factory()
+
+    def release(self, face_mesh, now=None):
+        if len(self.idle) < self.max_idle:
+            face_mesh.reset()
+            self.idle.append((face_mesh, time.monotonic() if now is None else now))
+        else:
+            face_mesh.close()
+
+    def trim(self, max_age, now=None):
+        # Closes meshes idle for longer than max_age seconds (oldest are first)
+        now = time.monotonic() if now is None else now
+        while self.idle and now - self.idle[0][1] > max_age:
+            self.idle.pop(0)[0].close()
+
+
+class EngineRegistry:
+    """VisionEngines keyed by camera, created on first use.
+
+    Engines stay alive while a connection uses them and for ``ttl`` seconds
+    after, so a camera that reconnects keeps its tracker and behavior counters.
+    A camera that reconnects for a different session gets its engine back with
+    the behavior states and counters reset.
+    Idle engines are evicted least recently used first whenever the registry
+    holds more than ``max_engines`` or its estimated memory passes
+    ``memory_cap`` bytes, and unconditionally once idle longer than ``ttl``.
+    """
+
+    def __init__(self, engine_options=None, ttl=300.0, max_engines=64, memory_cap=None,
+                 engine_bytes=ENGINE_BYTES, mesh_pool=None):
+        self.engine_options = engine_options or {}
+        self.ttl = ttl
+        self.max_engines = max_engines
+        self.memory_cap = memory_cap
+        self.engine_bytes = engine_bytes
+        self.mesh_pool = mesh_pool or FaceMeshPool()
+        self.engines = OrderedDict()  # key -> engine, least recently used first
+        self.users = {}               # key -> open connections
+        self.sessions = {}            # key -> session the engine last served
+        self.last_used = {}
+        self.created = 0
+        self.evicted = 0
+
+    def _create(self):
+        from vision_engine import VisionEngine
+
+        self.created += 1
+        if self.engine_options.get("multi_face"):
+            # Crop meshes are shared per process, there is no full-frame mesh
+            return VisionEngine(**self.engine_options)
+        return VisionEngine(face_mesh=self.mesh_pool.acquire(), **self.engine_options)
+
+    def get(self, key, now=None):
+        # Engine for key, created lazily; marks it most recently used
+        now = time.monotonic() if now is None else now
+        engine = self.engines.get(key)
+        if engine is None:
+            engine = self.engines[key] = self._create()
+            self.evict(now, keep=key)
+        else:
+            self.engines.move_to_end(key)
+        self.last_used[key] = now
+        return engine
+
+    def acquire(self, key, session=None, now=None):
+        # A connection starts using key's engine; it can't be evicted until released
+        self.users[key] = self.users.get(key, 0) + 1
+        engine = self.get(key, now)
+        if session is not None:
+            if self.sessions.get(key, session) != session:
+                engine.start_session()
+            self.sessions[key] = session
+        return engine
+
+    def release(self, key, now=None):
+        count = self.users.get(key, 0) - 1
+        if count > 0:
+            self.users[key] = count
+        else:
+            self.users.pop(key, None)
+            if key in self.engines:
+                self.last_used[key] = time.monotonic() if now is None else now
+
+    def _over_limit(self):
+        if self.max_engines and len(self.engines) > self.max_engines:
+            return True
+        return self.memory_cap is not None and self.memory_bytes > self.memory_cap
+
+    def evict(self, now=None, keep=None):
+        # Drops expired idle engines, then LRU idle engines while over a limit
+        now = time.monotonic() if now is None else now
+        for key in list(self.engines):
+            if key in self.users or key == keep:
+                continue
+            if now - self.last_used[key] > self.ttl or self._over_limit():
+                self._remove(key, now)
+        self.mesh_pool.trim(self.ttl, now)
+
+    def _remove(self, key, now=None):
+        engine = self.engines.pop(key)
+        self.last_used.pop(key, None)
+        self.sessions.pop(key, None)
+        self.evicted += 1
+        if engine.face_mesh is None:
+            return
+        if self.memory_cap is not None and self.memory_bytes + self.engine_bytes > self.memory_cap:
+            engine.face_mesh.close()
+        else:
+            self.mesh_pool.release(engine.face_mesh, now)
+
+    def warmup(self, meshes=1, shape=(480, 640, 3)):
+        # Push a blank frame through fresh FaceMesh graphs and park them in the
+        # pool, so the first real frame doesn't pay for model initialization
+        import numpy as np
+        from vision_engine import VisionEngine  # noqa: F401 (import cost paid here too)
+
+        if self.engine_options.get("multi_face"):
+            from face_crops import shared_crop_mesher
+
+            shared_crop_mesher(threads=self.engine_options.get("mesh_threads")).warmup(shape)
+            return
+        frame = np.zeros(shape, dtype=np.uint8)
+        warmed = [self.mesh_pool.acquire() for _ in range(meshes)]
+        for face_mesh in warmed:
+            face_mesh.process(frame)
+        for face_mesh in warmed:
+            self.mesh_pool.release(face_mesh)
+
+    def clear(self):
+        for key in list(self.engines):
+            self._remove(key)
+
+    @property
+    def memory_bytes(self):
+        # Estimate: live engines plus the pooled meshes waiting for reuse
+        return (len(self.engines) + len(self.mesh_pool.idle)) * self.engine_bytes
+
+    def stats(self):
+        return {
+            "engines": len(self.engines),
+            "active_engines": len(self.users),
+            "engine_memory_bytes": self.memory_bytes,
+            "engines_created": self.created,
+            "engines_evicted": self.evicted,
+            "face_mesh_created": self.mesh_pool.created,
+            "face_mesh_reused": self.mesh_pool.reused,
+            "face_mesh_idle": len(self.mesh_pool.idle),
+        }
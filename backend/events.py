@@ -0,0 +1,237 @@
+import numpy as np
+
+from face_tracker import box_iou
+
+EVENT_TYPES = ("drowsy", "distracted", "looked_down", "left_seat")
+
+
+def event(kind, student_id, phase, ts):
+    return {"type": kind, "id": int(student_id), "phase": phase, "ts": round(float(ts), 3)}
+
+
+class EventEngine:
+    """Per-track behavior states with smoothing, debounce and hysteresis.
+
+    State lives in fixed-capacity arrays indexed by FaceTracker slot, so each
+    update is a few vectorized operations over the faces in the frame.
+    update() returns only the state changes, as ``start``/``end`` events:
+
+    - drowsy: EMA of the EAR below ``ear_threshold`` for ``drowsy_frames``
+      frames; ends above ``ear_threshold + ear_hysteresis`` for
+      ``recover_frames`` frames.
+    - distracted: EMA head pose beyond the pitch/yaw limits for
+      ``distracted_frames`` frames; ends back inside the limits minus
+      ``angle_hysteresis`` for ``recover_frames`` frames.
+    - looked_down: EMA pitch below ``down_enter`` degrees for
+      ``down_frames`` frames; ends above ``down_exit`` for ``recover_frames``
+      frames.
+    - left_seat: no face seen near the track's last box for
+      ``absent_seconds``, whether the tracker still holds the track or
+      already dropped it. A face near the box (IoU above ``near_iou`` or
+      centers within ``near_distance`` face widths) counts as the student
+      still being there, so a track the tracker lost and re-created under a
+      new ID is not an absence. Ends when the track is matched again or a new
+      track is born near its box. Open absences of dropped tracks are
+      forgotten (without an end event) after ``forget_seconds``.
+    """
+
+    def __init__(self, ear_threshold=0.25, ear_hysteresis=0.03, drowsy_frames=20, pitch_limit=15.0,
+                 yaw_limit=20.0, angle_hysteresis=3.0, distracted_frames=10, down_enter=-20.0,
+                 down_exit=-15.0, down_frames=10, recover_frames=5, absent_seconds=3.0, near_iou=0.1,
+                 near_distance=1.0, forget_seconds=600.0, alpha=0.3, capacity=64):
+        self.ear_threshold = ear_threshold
+        self.ear_hysteresis = ear_hysteresis
+        self.drowsy_frames = drowsy_frames
+        self.pitch_limit = pitch_limit
+        self.yaw_limit = yaw_limit
+        self.angle_hysteresis = angle_hysteresis
+        self.distracted_frames = distracted_frames
+        self.down_enter = down_enter
+        self.down_exit = down_exit
+        self.down_frames = down_frames
+        self.recover_frames = recover_frames
+        self.absent_seconds = absent_seconds
+        self.near_iou = near_iou
+        self.near_distance = near_distance
+        self.forget_seconds = forget_seconds
+        self.alpha = alpha
+        self._allocate(capacity)
+        # Tracks the tracker dropped: id -> [last box, last ts it was seen,
+        # whether left_seat started]
+        self.departed = {}
+        self.counts = dict.fromkeys(EVENT_TYPES, 0)
+
+    def _allocate(self, capacity):
+        self.capacity = capacity
+        self.active = np.zeros(capacity, dtype=bool)
+        self.ids = np.zeros(capacity, dtype=np.int64)
+        self.ear = np.zeros(capacity, dtype=np.float32)
+        self.pitch = np.zeros(capacity, dtype=np.float32)
+        self.yaw = np.zeros(capacity, dtype=np.float32)
+        self.boxes = np.zeros((capacity, 4), dtype=np.float32)
+        # Last time the track, or a face near its box, was seen
+        self.last_seen = np.zeros(capacity, dtype=np.float64)
+        # Frames the enter (or, while active, the exit) condition has held
+        self.drowsy_run = np.zeros(capacity, dtype=np.int32)
+        self.distracted_run = np.zeros(capacity, dtype=np.int32)
+        self.looked_down_run = np.zeros(capacity, dtype=np.int32)
+        self.drowsy = np.zeros(capacity, dtype=bool)
+        self.distracted = np.zeros(capacity, dtype=bool)
+        self.looked_down = np.zeros(capacity, dtype=bool)
+        self.absent = np.zeros(capacity, dtype=bool)
+
+    def reset(self):
+        # Forget every track and zero the counters (a new session starts)
+        self._allocate(self.capacity)
+        self.departed = {}
+        self.counts = dict.fromkeys(EVENT_TYPES, 0)
+
+    def _grow(self, capacity):
+        old = {name: getattr(self, name) for name in (
+            "active", "ids", "ear", "pitch", "yaw", "boxes", "last_seen", "drowsy_run", "distracted_run",
+            "looked_down_run", "drowsy", "distracted", "looked_down", "absent")}
+        self._allocate(capacity)
+        for name, values in old.items():
+            getattr(self, name)[:len(values)] = values
+
+    def _emit(self, events, kind, slots, phase, ts):
+        for slot in slots:
+            events.append(event(kind, self.ids[slot], phase, ts))
+        if phase == "start":
+            self.counts[kind] += len(slots)
+
+    def _debounced(self, events, kind, slots, enter, exit, enter_frames, ts):
+        # Advances one state for these slots: it starts after enter held for
+        # enter_frames frames and ends after exit held for recover_frames
+        state, run = getattr(self, kind), getattr(self, kind + "_run")
+        active, count = state[slots], run[slots]
+        count = np.where(active, np.where(exit, count + 1, 0), np.where(enter, count + 1, 0))
+        started = ~active & (count >= enter_frames)
+        ended = active & (count >= self.recover_frames)
+        flipped = started | ended
+        state[slots] = active ^ flipped
+        run[slots] = np.where(flipped, 0, count)
+        self._emit(events, kind, slots[started], "start", ts)
+        self._emit(events, kind, slots[ended], "end", ts)
+
+    def _near(self, regions, boxes):
+        # (R, B) bool: box b is close enough to region r to be the same seat
+        if len(regions) == 0 or len(boxes) == 0:
+            return np.zeros((len(regions), len(boxes)), dtype=bool)
+        centers_r = (regions[:, :2] + regions[:, 2:]) / 2
+        centers_b = (boxes[:, :2] + boxes[:, 2:]) / 2
+        dist = np.linalg.norm(centers_r[:, None] - centers_b[None], axis=2)
+        width = np.maximum(regions[:, 2] - regions[:, 0], 1.0)[:, None]
+        return (box_iou(regions, boxes) > self.near_iou) | (dist < self.near_distance * width)
+
+    def update(self, ts, ids, slots, ears, pitch, yaw, tracker_active, boxes):
+        """One frame. ids/slots/ears/pitch/yaw/boxes: per detected face (NaN
+        pose is held); tracker_active: FaceTracker.active after its update."""
+        events = []
+        slots = np.asarray(slots, dtype=np.int64)
+        boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        if len(tracker_active) > self.capacity:
+            self._grow(len(tracker_active))
+
+        # Tracks that were dropped: their seat is watched until it counts as
+        # absent, and absences stay open until a new track is born there
+        gone = np.flatnonzero(self.active[:len(tracker_active)] & ~tracker_active)
+        for slot in gone:
+            self._end_all(events, slot, ts)
+            self.departed[int(self.ids[slot])] = [self.boxes[slot].copy(), self.last_seen[slot], self.absent[slot]]
+            self.active[slot] = False
+
+        # New tracks (or a reused slot) start from a clean state
+        fresh = slots[~self.active[slots] | (self.ids[slots] != ids)]
+        for slot in fresh:
+            self._reset(slot)
+        self.ids[slots] = ids
+        self.active[slots] = True
+
+        if len(slots):
+            returned = slots[self.absent[slots]]
+            self.absent[returned] = False
+            self._emit(events, "left_seat", returned, "end", ts)
+            self.last_seen[slots] = ts
+            self.boxes[slots] = boxes
+
+            a = self.alpha
+            init = np.isin(slots, fresh)
+            ears = np.asarray(ears, dtype=np.float32)
+            self.ear[slots] = np.where(init, ears, self.ear[slots] + a * (ears - self.ear[slots]))
+            for values, target in ((pitch, self.pitch), (yaw, self.yaw)):
+                values = np.asarray(values, dtype=np.float32)
+                valid = ~np.isnan(values)
+                smoothed = np.where(init, values, target[slots] + a * (values - target[slots]))
+                target[slots] = np.where(valid, smoothed, target[slots])
+
+            ear = self.ear[slots]
+            self._debounced(events, "drowsy", slots, ear < self.ear_threshold,
+                            ear > self.ear_threshold + self.ear_hysteresis, self.drowsy_frames, ts)
+            p, y = np.abs(self.pitch[slots]), np.abs(self.yaw[slots])
+            self._debounced(events, "distracted", slots, (p > self.pitch_limit) | (y > self.yaw_limit),
+                            (p < self.pitch_limit - self.angle_hysteresis)
+                            & (y < self.yaw_limit - self.angle_hysteresis), self.distracted_frames, ts)
+            pitch_ema = self.pitch[slots]
+            self._debounced(events, "looked_down", slots, pitch_ema < self.down_enter, pitch_ema > self.down_exit,
+                            self.down_frames, ts)
+
+        self._update_seats(events, ts, slots, fresh, boxes)
+        return events
+
+    def _update_seats(self, events, ts, slots, fresh, boxes):
+        # Seats of unmatched tracks, live or dropped: a face seen near one
+        # keeps it occupied, a new track born near an absent one ends the absence
+        unmatched = np.flatnonzero(self.active)
+        unmatched = unmatched[~np.isin(unmatched, slots)]
+        departed = list(self.departed)
+        regions = np.concatenate([self.boxes[unmatched],
+                                  np.array([self.departed[i][0] for i in departed], dtype=np.float32).reshape(-1, 4)])
+        near = self._near(regions, boxes)
+        seen = near.any(axis=1)
+        born = near[:, np.isin(slots, fresh)].any(axis=1)
+
+        live_seen, live_born = seen[:len(unmatched)], born[:len(unmatched)]
+        ended = unmatched[self.absent[unmatched] & live_born]
+        self.absent[ended] = False
+        self._emit(events, "left_seat", ended, "end", ts)
+        self.last_seen[unmatched[live_seen & ~self.absent[unmatched]]] = ts
+        missing = unmatched[~self.absent[unmatched] & (ts - self.last_seen[unmatched] > self.absent_seconds)]
+        self.absent[missing] = True
+        self._emit(events, "left_seat", missing, "start", ts)
+
+        for student_id, was_seen, was_born in zip(departed, seen[len(unmatched):], born[len(unmatched):]):
+            entry = self.departed[student_id]
+            if entry[2]:
+                if was_born:
+                    events.append(event("left_seat", student_id, "end", ts))
+                    del self.departed[student_id]
+                elif ts - entry[1] > self.forget_seconds:
+                    del self.departed[student_id]
+                continue
+            if was_seen:
+                # Someone else's track is in the seat: most likely the same
+                # student under a new ID, whose own track takes over
+                del self.departed[student_id]
+            elif ts - entry[1] > self.absent_seconds:
+                entry[2] = True
+                events.append(event("left_seat", student_id, "start", ts))
+                self.counts["left_seat"] += 1
+
+    def _end_all(self, events, slot, ts):
+        # Closes the open states of a track the tracker dropped
+        for kind, state in (("drowsy", self.drowsy), ("distracted", self.distracted),
+                            ("looked_down", self.looked_down)):
+            if state[slot]:
+                state[slot] = False
+                events.append(event(kind, self.ids[slot], "end", ts))
+
+    def _reset(self, slot):
+        for values in (self.ear, self.pitch, self.yaw, self.drowsy_run, self.distracted_run, self.looked_down_run):
+            values[slot] = 0
+        for state in (self.drowsy, self.distracted, self.looked_down, self.absent):
+            state[slot] = False
+
+    def states(self, slots):
+        # (drowsy, distracted) flags of these slots for per-frame output
+        return self.drowsy[slots], self.distracted[slots]
@@ -0,0 +1,238 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from face_tracker import box_iou, landmark_boxes
+from landmarks import NUM_LANDMARKS, landmarks_to_array
+
+# FaceMesh's landmark model takes 192x192 (256 with some margin is what its own
+# detector-to-mesh handoff produces), so larger crops only cost resize time.
+CROP_SIZE = 256
+
+# Square crop side as a multiple of the face box: detector boxes are tight
+# (eyebrows to chin), landmark boxes already include the whole face outline.
+DETECTION_SCALE = 1.8
+LANDMARK_SCALE = 1.5
+
+
+def _square_regions(boxes, scale):
+    # (faces, 4) x1, y1, x2, y2 -> (faces, 3) crop left, top and side in pixels
+    boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+    centers = (boxes[:, :2] + boxes[:, 2:]) / 2
+    sides = np.maximum(boxes[:, 2] - boxes[:, 0], boxes[:, 3] - boxes[:, 1]) * scale
+    return np.column_stack([centers - sides[:, None] / 2, sides]).astype(np.float32)
+
+
+def _region_boxes(regions):
+    return np.column_stack([regions[:, :2], regions[:, :2] + regions[:, 2:3]])
+
+
+def non_max_suppression(boxes, scores, iou_threshold=0.3):
+    # Indices of the boxes kept, highest score first
+    order = np.argsort(-np.asarray(scores))
+    keep = []
+    while len(order):
+        best = order[0]
+        keep.append(best)
+        if len(order) == 1:
+            break
+        iou = box_iou(boxes[best:best + 1], boxes[order[1:]])[0]
+        order = order[1:][iou <= iou_threshold]
+    return np.array(keep, dtype=np.int64)
+
+
+class CropMesher:
+    """Face detector plus a set of single-face FaceMesh graphs run on crops.
+
+    Detection runs the MediaPipe full-range face detector on a downscaled
+    copy of the frame, split into overlapping tiles so faces a few dozen
+    pixels wide in a wide classroom shot are still found. Landmarks come from
+    ``threads`` static-image FaceMesh graphs (one face each) fed 256x256 crops
+    on a thread pool; MediaPipe releases the GIL while a graph runs.
+
+    Nothing here is per camera, so one mesher per process is shared by every
+    engine (see ``shared_crop_mesher``); the per-camera crop state lives in
+    ``MultiFacePipeline``.
+    """
+
+    def __init__(self, threads=None, detect_width=960, tiles=(2, 2), overlap=0.2,
+                 min_detection_confidence=0.5):
+        import mediapipe as mp
+
+        self.threads = threads or min(4, os.cpu_count() or 1)
+        self.detect_width = detect_width
+        self.tiles = tiles
+        self.overlap = overlap
+        self.detector = mp.solutions.face_detection.FaceDetection(
+            model_selection=1, min_detection_confidence=min_detection_confidence)
+        self.detector_lock = threading.Lock()
+        self.meshes = queue.Queue()
+        for _ in range(self.threads):
+            self.meshes.put(mp.solutions.face_mesh.FaceMesh(
+                static_image_mode=True,
+                max_num_faces=1,
+                min_detection_confidence=0.5,
+                refine_landmarks=True
+            ))
+        self.executor = ThreadPoolExecutor(self.threads, thread_name_prefix="crop-mesh")
+
+    def _tiles(self, w, h):
+        cols, rows = self.tiles
+        tile_w = w / (cols - (cols - 1) * self.overlap)
+        tile_h = h / (rows - (rows - 1) * self.overlap)
+        for r in range(rows):
+            for c in range(cols):
+                x = int(round(c * tile_w * (1 - self.overlap)))
+                y = int(round(r * tile_h * (1 - self.overlap)))
+                yield x, y, min(w, int(round(x + tile_w))), min(h, int(round(y + tile_h)))
+
+    def detect(self, frame):
+        """(faces, 4) face boxes in frame pixels, merged across tiles."""
+        h, w = frame.shape[:2]
+        scale = min(1.0, self.detect_width / w)
+        small = cv2.resize(frame, (int(w * scale), int(h * scale)), interpolation=cv2.INTER_AREA) \
+            if scale < 1.0 else frame
+        rgb = cv2.cvtColor(small, cv2.COLOR_BGR2RGB)
+        sh, sw = rgb.shape[:2]
+        boxes, scores = [], []
+        with self.detector_lock:
+            for x1, y1, x2, y2 in self._tiles(sw, sh):
+                results = self.detector.process(np.ascontiguousarray(rgb[y1:y2, x1:x2]))
+                for d in results.detections or ():
+                    b = d.location_data.relative_bounding_box
+                    tw, th = x2 - x1, y2 - y1
+                    bx, by = x1 + b.xmin * tw, y1 + b.ymin * th
+                    boxes.append([bx, by, bx + b.width * tw, by + b.height * th])
+                    scores.append(d.score[0])
+        if not boxes:
+            return np.empty((0, 4), dtype=np.float32)
+        boxes = np.array(boxes, dtype=np.float32) / scale
+        return boxes[non_max_suppression(boxes, scores)]
+
+    def _mesh_one(self, frame, region):
+        x, y, side = region
+        s = CROP_SIZE / side
+        transform = np.array([[s, 0, -x * s], [0, s, -y * s]], dtype=np.float32)
+        crop = cv2.warpAffine(frame, transform, (CROP_SIZE, CROP_SIZE), flags=cv2.INTER_LINEAR,
+                              borderMode=cv2.BORDER_CONSTANT)
+        crop = cv2.cvtColor(crop, cv2.COLOR_BGR2RGB)
+        mesh = self.meshes.get()
+        try:
+            results = mesh.process(crop)
+        finally:
+            self.meshes.put(mesh)
+        if not results.multi_face_landmarks:
+            return None
+        return landmarks_to_array(results.multi_face_landmarks)[0]
+
+    def mesh(self, frame, regions):
+        """Landmarks for each crop region: (faces, N, 3) normalized to the full
+        frame, and a (regions,) mask of the regions a face was found in."""
+        h, w = frame.shape[:2]
+        crops = list(self.executor.map(lambda r: self._mesh_one(frame, r), regions))
+        found = np.array([c is not None for c in crops], dtype=bool)
+        if not found.any():
+            return np.empty((0, NUM_LANDMARKS, 3), dtype=np.float32), found
+        points = np.stack([c for c in crops if c is not None])
+        kept = regions[found]
+        # Crop-normalized -> frame-normalized; z is scaled like x (by width)
+        points[..., 0] = (kept[:, None, 0] + points[..., 0] * kept[:, None, 2]) / w
+        points[..., 1] = (kept[:, None, 1] + points[..., 1] * kept[:, None, 2]) / h
+        points[..., 2] *= kept[:, None, 2] / w
+        return points, found
+
+    def warmup(self, shape=(480, 640, 3)):
+        frame = np.zeros(shape, dtype=np.uint8)
+        self.detect(frame)
+        regions = np.tile(np.array([[0, 0, min(shape[:2])]], dtype=np.float32), (self.threads, 1))
+        self.mesh(frame, regions)
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        self.detector.close()
+        while not self.meshes.empty():
+            self.meshes.get().close()
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def shared_crop_mesher(**options):
+    # One CropMesher per process, created on first use (options of the first
+    # caller win)
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = CropMesher(**options)
+        return _shared
+
+
+class MultiFacePipeline:
+    """Detect-then-crop-then-mesh landmarks for one camera.
+
+    The detector runs every ``detect_interval`` calls (and whenever no face is
+    being followed). In between, each face's crop for the next call is taken
+    from its own landmarks, so tracked faces skip detection entirely; faces
+    the mesh no longer finds in their crop are dropped until the next
+    detection picks them up again. New detections overlapping a followed face
+    are ignored, so every face is meshed once.
+    """
+
+    def __init__(self, mesher, detect_interval=10, max_faces=64, overlap_iou=0.3):
+        self.mesher = mesher
+        self.detect_interval = max(1, detect_interval)
+        self.max_faces = max_faces
+        self.overlap_iou = overlap_iou
+        self.regions = np.empty((0, 3), dtype=np.float32)
+        self.calls_since_detect = None
+        self.detections = 0
+        self.timings = {}
+
+    def _needs_detection(self):
+        return (self.calls_since_detect is None or len(self.regions) == 0
+                or self.calls_since_detect + 1 >= self.detect_interval)
+
+    def process(self, frame):
+        """(faces, N, 3) landmarks normalized to frame, like FaceMesh output."""
+        self.timings = {}
+        regions = self.regions
+        if self._needs_detection():
+            t = time.perf_counter()
+            boxes = self.mesher.detect(frame)
+            detected = _square_regions(boxes, DETECTION_SCALE)
+            if len(regions) and len(detected):
+                overlap = box_iou(_region_boxes(detected), _region_boxes(regions)).max(axis=1)
+                detected = detected[overlap < self.overlap_iou]
+            regions = np.concatenate([regions, detected])[:self.max_faces]
+            self.calls_since_detect = 0
+            self.detections += 1
+            self.timings["detect"] = (time.perf_counter() - t) * 1000.0
+        else:
+            self.calls_since_detect += 1
+
+        t = time.perf_counter()
+        points, _ = self.mesher.mesh(frame, regions)
+        self.timings["facemesh"] = (time.perf_counter() - t) * 1000.0
+        return self.follow(points, frame.shape)
+
+    def follow(self, points, shape):
+        # Sets the crop regions for the next call from these landmarks and
+        # returns them with faces that two crops converged on merged
+        h, w = shape[:2]
+        if len(points) == 0:
+            self.regions = np.empty((0, 3), dtype=np.float32)
+            return points
+        boxes = landmark_boxes(points[..., :2] * np.array([w, h], dtype=np.float32))
+        keep = np.sort(non_max_suppression(boxes, boxes[:, 2] - boxes[:, 0], iou_threshold=0.5))
+        self.regions = _square_regions(boxes[keep], LANDMARK_SCALE)
+        return points[keep]
+
+    def reset(self):
+        self.regions = np.empty((0, 3), dtype=np.float32)
+        self.calls_since_detect = None
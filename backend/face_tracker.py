@@ -0,0 +1,139 @@
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+
+
+def box_iou(a, b):
+    # a: (T, 4), b: (D, 4) as x1, y1, x2, y2 -> (T, D)
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    union = area_a[:, None] + area_b[None, :] - inter
+    return np.divide(inter, union, out=np.zeros_like(inter), where=union > 0)
+
+
+def landmark_boxes(pixels):
+    # (faces, N, 2) pixel landmarks -> (faces, 4) bounding boxes
+    if len(pixels) == 0:
+        return np.empty((0, 4), dtype=np.float32)
+    return np.concatenate([pixels.min(axis=1), pixels.max(axis=1)], axis=1)
+
+
+class FaceTracker:
+    """Associates faces across frames and gives them persistent IDs.
+
+    Cost is 1 - IoU, with the centroid distance (in face widths) as a fallback
+    for small or fast-moving faces; assignment is optimal (Hungarian). Track
+    state lives in fixed-capacity arrays indexed by slot, so other per-track
+    state (events) can use the same slot numbers. When update() is given the
+    frame size, track boxes are rescaled whenever it changes (a client that
+    switches resolution keeps its IDs).
+    """
+
+    def __init__(self, max_misses=15, min_iou=0.1, max_center_dist=1.0, capacity=64):
+        self.max_misses = max_misses
+        self.min_iou = min_iou
+        self.max_center_dist = max_center_dist
+        self.next_id = 1
+        self.size = None
+        self._allocate(capacity)
+        self.births = []
+        self.deaths = []
+
+    def _allocate(self, capacity):
+        self.capacity = capacity
+        self.active = np.zeros(capacity, dtype=bool)
+        self.ids = np.zeros(capacity, dtype=np.int64)
+        self.boxes = np.zeros((capacity, 4), dtype=np.float32)
+        self.hits = np.zeros(capacity, dtype=np.int32)
+        self.misses = np.zeros(capacity, dtype=np.int32)
+
+    def _grow(self):
+        old = (self.active, self.ids, self.boxes, self.hits, self.misses)
+        self._allocate(self.capacity * 2)
+        n = len(old[0])
+        self.active[:n], self.ids[:n], self.boxes[:n], self.hits[:n], self.misses[:n] = old
+
+    def _new_track(self, box):
+        free = np.flatnonzero(~self.active)
+        if len(free) == 0:
+            self._grow()
+            free = np.flatnonzero(~self.active)
+        slot = free[0]
+        self.active[slot] = True
+        self.ids[slot] = self.next_id
+        self.boxes[slot] = box
+        self.hits[slot] = 1
+        self.misses[slot] = 0
+        self.next_id += 1
+        self.births.append(int(self.ids[slot]))
+        return slot
+
+    def _cost(self, track_boxes, boxes):
+        iou = box_iou(track_boxes, boxes)
+        track_centers = (track_boxes[:, :2] + track_boxes[:, 2:]) / 2
+        centers = (boxes[:, :2] + boxes[:, 2:]) / 2
+        widths = np.maximum(track_boxes[:, 2] - track_boxes[:, 0], 1.0)
+        dist = np.linalg.norm(track_centers[:, None] - centers[None], axis=2) / widths[:, None]
+        gated = (iou < self.min_iou) & (dist > self.max_center_dist)
+        cost = 1.0 - iou + 0.1 * np.minimum(dist, self.max_center_dist)
+        cost[gated] = 1e6
+        return cost, gated
+
+    def rescale(self, size):
+        # Moves track boxes to a new (w, h) frame size
+        if self.size is not None and size != self.size:
+            sx, sy = size[0] / self.size[0], size[1] / self.size[1]
+            self.boxes *= np.array([sx, sy, sx, sy], dtype=np.float32)
+        self.size = size
+
+    def update(self, boxes, size=None):
+        """boxes: (faces, 4) in a frame of size (w, h). Returns (ids, slots),
+        one entry per face."""
+        boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        if size is not None:
+            self.rescale(tuple(size))
+        self.births = []
+        self.deaths = []
+        num_faces = len(boxes)
+        slots = np.full(num_faces, -1, dtype=np.int64)
+
+        live = np.flatnonzero(self.active)
+        if len(live) and num_faces:
+            cost, gated = self._cost(self.boxes[live], boxes)
+            rows, cols = linear_sum_assignment(cost)
+            keep = ~gated[rows, cols]
+            rows, cols = rows[keep], cols[keep]
+            matched = live[rows]
+            slots[cols] = matched
+            self.boxes[matched] = boxes[cols]
+            self.hits[matched] += 1
+            self.misses[matched] = 0
+        else:
+            matched = np.empty(0, dtype=np.int64)
+
+        # Tracks that were not matched this frame age, and die after max_misses
+        unmatched = np.setdiff1d(live, matched, assume_unique=True)
+        self.misses[unmatched] += 1
+        dead = unmatched[self.misses[unmatched] > self.max_misses]
+        if len(dead):
+            self.deaths = self.ids[dead].tolist()
+            self.active[dead] = False
+
+        for i in np.flatnonzero(slots < 0):
+            slots[i] = self._new_track(boxes[i])
+
+        return self.ids[slots].copy(), slots
+
+    @property
+    def live_ids(self):
+        return self.ids[self.active].tolist()
+
+    def reset(self):
+        self.size = None
+        self._allocate(self.capacity)
+        self.births = []
+        self.deaths = []
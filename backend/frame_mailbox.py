@@ -0,0 +1,39 @@
+import asyncio
+
+
+class LatestMailbox:
+    """Single-slot mailbox between a socket reader and a frame processor.
+
+    put() never blocks: a newer frame overwrites one that has not been picked
+    up yet and counts it as dropped, so the processor always works on the most
+    recent frame and latency stays bounded when inference falls behind.
+    """
+
+    def __init__(self):
+        self._item = None
+        self._event = asyncio.Event()
+        self.closed = False
+        self.received = 0
+        self.dropped = 0
+
+    def put(self, item):
+        if self._item is not None:
+            self.dropped += 1
+        self._item = item
+        self.received += 1
+        self._event.set()
+
+    async def get(self):
+        # Returns None once the mailbox is closed and drained.
+        while self._item is None:
+            if self.closed:
+                return None
+            self._event.clear()
+            await self._event.wait()
+        item = self._item
+        self._item = None
+        return item
+
+    def close(self):
+        self.closed = True
+        self._event.set()
@@ -0,0 +1,174 @@
+import struct
+import base64
+import time
+import cv2
+import numpy as np
+
+# Binary frame layout (little endian, 16 byte header followed by JPEG/WebP bytes):
+#   magic      2s   b"IF"
+#   version    B    1
+#   scale      B    desired decode scale: 1, 2, 4 or 8 (0 = let the server pick)
+#   seq        I    client frame sequence number
+#   capture_ts d    client capture time in ms since epoch
+FRAME_MAGIC = b"IF"
+FRAME_VERSION = 1
+FRAME_HEADER = struct.Struct("<2sBBId")
+
+# OpenCV can decode JPEG/WebP straight into a 1/2, 1/4 or 1/8 size image, which
+# skips most of the IDCT work instead of decoding full size and resizing.
+REDUCED_DECODE_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+
+class FrameProtocolError(ValueError):
+    pass
+
+
+class DecodedFrame:
+    __slots__ = ("image", "seq", "capture_ts", "scale", "num_bytes", "decode_ms", "binary", "base64_ms")
+
+    def __init__(self, image, seq, capture_ts, scale, num_bytes, decode_ms, binary, base64_ms=0.0):
+        self.image = image
+        self.seq = seq
+        self.capture_ts = capture_ts
+        self.scale = scale
+        self.num_bytes = num_bytes
+        # decode_ms is the whole decode, base64_ms the part spent unwrapping text frames
+        self.decode_ms = decode_ms
+        self.binary = binary
+        self.base64_ms = base64_ms
+
+
+def pack_frame(payload, seq, capture_ts=None, scale=0):
+    """Build a binary /ws message (used by test clients and the load generator)."""
+    if capture_ts is None:
+        capture_ts = time.time() * 1000.0
+    return FRAME_HEADER.pack(FRAME_MAGIC, FRAME_VERSION, scale, seq & 0xFFFFFFFF, capture_ts) + bytes(payload)
+
+
+def parse_header(data):
+    if len(data) < FRAME_HEADER.size:
+        raise FrameProtocolError("binary frame shorter than header")
+    magic, version, scale, seq, capture_ts = FRAME_HEADER.unpack_from(data, 0)
+    if magic != FRAME_MAGIC:
+        raise FrameProtocolError("bad frame magic")
+    if version != FRAME_VERSION:
+        raise FrameProtocolError(f"unsupported frame version {version}")
+    if scale not in (0, 1, 2, 4, 8):
+        raise FrameProtocolError(f"unsupported decode scale {scale}")
+    return seq, capture_ts, scale
+
+
+def image_width(buf):
+    """Pixel width from a JPEG, WebP or PNG header without decoding, else None."""
+    data = memoryview(buf)
+    n = len(data)
+    if n >= 4 and data[0] == 0xFF and data[1] == 0xD8:
+        # JPEG: walk the marker segments up to the first start-of-frame
+        i = 2
+        while i + 9 <= n:
+            if data[i] != 0xFF:
+                return None
+            marker = data[i + 1]
+            if marker == 0xFF:
+                i += 1
+                continue
+            if 0xD0 <= marker <= 0xD9 or marker == 0x01:
+                i += 2
+                continue
+            length = (data[i + 2] << 8) | data[i + 3]
+            if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+                return (data[i + 7] << 8) | data[i + 8]
+            i += 2 + length
+        return None
+    if n >= 30 and bytes(data[0:4]) == b"RIFF" and bytes(data[8:12]) == b"WEBP":
+        chunk = bytes(data[12:16])
+        if chunk == b"VP8 ":
+            return (data[26] | (data[27] << 8)) & 0x3FFF
+        if chunk == b"VP8L":
+            return 1 + (data[21] | ((data[22] & 0x3F) << 8))
+        if chunk == b"VP8X":
+            return 1 + (data[24] | (data[25] << 8) | (data[26] << 16))
+        return None
+    if n >= 24 and bytes(data[0:8]) == b"\x89PNG\r\n\x1a\n":
+        return int.from_bytes(data[16:20], "big")
+    return None
+
+
+def choose_decode_scale(full_width, min_width):
+    # Largest reduction that still leaves the engine at least min_width pixels.
+    scale = 1
+    for candidate in (2, 4, 8):
+        if full_width // candidate >= min_width:
+            scale = candidate
+    return scale
+
+
+class FrameDecoder:
+    """Per-connection decoder for both the binary and the legacy data-URL protocol.
+
+    When the client leaves the scale to the server, every frame's width is read
+    from its image header and the frame is decoded with the largest reduced
+    decode mode that keeps it at least ``min_width`` pixels wide, so clients
+    can change resolution at any time. Payloads whose header we can't read are
+    decoded at full size.
+    """
+
+    def __init__(self, min_width=320, default_scale=0):
+        self.min_width = min_width
+        self.default_scale = default_scale
+        self.full_width = None
+        self.text_seq = 0
+
+    def _auto_scale(self, buf):
+        if self.default_scale:
+            return self.default_scale
+        width = image_width(buf)
+        if width is None:
+            return 1
+        self.full_width = width
+        return choose_decode_scale(width, self.min_width)
+
+    def _decode(self, buf, scale):
+        image = cv2.imdecode(buf, REDUCED_DECODE_FLAGS[scale])
+        if image is None:
+            raise FrameProtocolError("could not decode image payload")
+        return image
+
+    def decode_binary(self, data):
+        seq, capture_ts, scale = parse_header(data)
+        start = time.perf_counter()
+        # Wrap the received buffer directly, no intermediate copies.
+        buf = np.frombuffer(data, dtype=np.uint8, offset=FRAME_HEADER.size)
+        if scale == 0:
+            scale = self._auto_scale(buf)
+        image = self._decode(buf, scale)
+        decode_ms = (time.perf_counter() - start) * 1000.0
+        return DecodedFrame(image, seq, capture_ts, scale, len(data), decode_ms, True)
+
+    def decode_text(self, data):
+        # Legacy clients: "data:image/jpeg;base64,....."
+        if "base64," not in data:
+            return None
+        start = time.perf_counter()
+        header, encoded = data.split(",", 1)
+        image_data = base64.b64decode(encoded)
+        base64_ms = (time.perf_counter() - start) * 1000.0
+        buf = np.frombuffer(image_data, np.uint8)
+        scale = self._auto_scale(buf)
+        image = self._decode(buf, scale)
+        decode_ms = (time.perf_counter() - start) * 1000.0
+        self.text_seq += 1
+        return DecodedFrame(image, self.text_seq, None, scale, len(data), decode_ms, False, base64_ms)
+
+    def decode_message(self, message):
+        # message is the dict returned by Starlette's websocket.receive()
+        if message.get("bytes") is not None:
+            return self.decode_binary(message["bytes"])
+        if message.get("text") is not None:
+            return self.decode_text(message["text"])
+        return None
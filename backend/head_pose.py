@@ -0,0 +1,145 @@
+import math
+
+import cv2
+import numpy as np
+
+# FaceMesh landmarks PnP solves with: nose tip, chin, outer eye corners, mouth
+# corners, forehead, chin tip and the two sides of the face. The last four keep
+# the solve stable; with only the first six, 1px of landmark noise flips the
+# yaw of small faces by 20+ degrees.
+POSE_INDICES = [1, 199, 33, 263, 61, 291, 10, 152, 234, 454]
+
+# 3D face used for PnP (y up, z towards the camera, nose tip at origin): the
+# POSE_INDICES landmarks of MediaPipe's face mesh in the mesh's own upright
+# frame, where x runs through the outer eye corners and y from forehead to chin,
+# scaled to 450 units between the eye corners. Fitted on FaceMesh output for a
+# real frontal face (benchmarks/data/frontal_face_landmarks.npz) and made
+# symmetric, so PnP and the closed-form mode agree on what "level" is.
+GENERIC_FACE_3D = np.array([
+    [0.0, 0.0, 0.0],            # Nose tip
+    [0.0, -317.0, -118.0],      # Chin
+    [-225.0, 172.0, -232.0],    # Left eye left corner
+    [225.0, 172.0, -232.0],     # Right eye right corner
+    [-159.0, -111.0, -205.0],   # Left Mouth corner
+    [159.0, -111.0, -205.0],    # Right mouth corner
+    [0.0, 415.0, -162.0],       # Forehead
+    [0.0, -386.0, -162.0],      # Chin tip
+    [-338.0, 52.0, -487.0],     # Left side of the face
+    [338.0, 52.0, -487.0]       # Right side of the face
+], dtype=np.float64)
+
+# The generic model is y-up / z-towards-camera while OpenCV's camera is y-down /
+# z-away, so every PnP rotation carries this 180 degree flip about x.
+MODEL_TO_CAMERA = np.diag([1.0, -1.0, -1.0])
+
+# Landmarks used by the closed-form mode
+FOREHEAD_IDX = 10
+CHIN_IDX = 152
+LEFT_EYE_OUTER_IDX = 33
+RIGHT_EYE_OUTER_IDX = 263
+
+
+def euler_angles(rmats):
+    """Pitch and yaw in degrees from face rotation matrices (..., 3, 3).
+
+    Same decomposition as cv2.RQDecomp3x3, vectorized. Pitch is negative when
+    the face looks down, matching the thresholds in VisionEngine.
+    """
+    pitch = -np.degrees(np.arctan2(rmats[..., 2, 1], rmats[..., 2, 2]))
+    yaw = np.degrees(np.arctan2(-rmats[..., 2, 0], np.hypot(rmats[..., 2, 1], rmats[..., 2, 2])))
+    return pitch, yaw
+
+
+def face_axes(points, w, h):
+    """Closed-form face rotation from landmark geometry, for all faces at once.
+
+    points: (faces, N, 3) normalized landmarks. MediaPipe z is on the same scale
+    as x, so x and z are scaled by the frame width and y by the height. The face
+    x axis runs through the outer eye corners, the y axis from forehead to chin.
+    """
+    scale = np.array([w, h, w], dtype=np.float64)
+    p = points.astype(np.float64) * scale
+    x_axis = p[:, RIGHT_EYE_OUTER_IDX] - p[:, LEFT_EYE_OUTER_IDX]
+    y_axis = p[:, CHIN_IDX] - p[:, FOREHEAD_IDX]
+    x_axis /= np.linalg.norm(x_axis, axis=1, keepdims=True) + 1e-9
+    y_axis -= np.sum(y_axis * x_axis, axis=1, keepdims=True) * x_axis
+    y_axis /= np.linalg.norm(y_axis, axis=1, keepdims=True) + 1e-9
+    z_axis = np.cross(x_axis, y_axis)
+    return np.stack([x_axis, y_axis, z_axis], axis=2)
+
+
+class HeadPoseSolver:
+    """Head pose for many faces per frame.
+
+    Modes:
+      - "pnp": SQPnP on the POSE_INDICES landmarks. It finds the global
+        minimum without an initial guess and is faster than a warm-started
+        iterative solve, so no per-face state is kept. Camera intrinsics are
+        cached per frame size. Angles are relative to the line of sight from
+        the camera to the nose tip.
+      - "fast": closed-form pitch/yaw from the 3D landmark geometry, no PnP.
+    """
+
+    MODES = ("pnp", "fast")
+
+    def __init__(self, model_points=GENERIC_FACE_3D, mode="pnp"):
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown head pose mode: {mode}")
+        self.model_points = np.ascontiguousarray(model_points, dtype=np.float64)
+        self.mode = mode
+        self.dist_coeffs = np.zeros((4, 1), dtype=np.float64)
+        self._cam_matrices = {}
+
+    def camera_matrix(self, w, h):
+        cam_matrix = self._cam_matrices.get((w, h))
+        if cam_matrix is None:
+            focal_length = 1 * w
+            cam_matrix = np.array([[focal_length, 0, w / 2],
+                                   [0, focal_length, h / 2],
+                                   [0, 0, 1]], dtype=np.float64)
+            self._cam_matrices[(w, h)] = cam_matrix
+        return cam_matrix
+
+    def solve_pnp(self, face_2d, w, h):
+        """Returns (pitch, yaw, rot_vec, trans_vec) or None."""
+        face_2d = np.ascontiguousarray(face_2d, dtype=np.float64)
+        success, rot_vec, trans_vec = cv2.solvePnP(
+            self.model_points, face_2d, self.camera_matrix(w, h), self.dist_coeffs, flags=cv2.SOLVEPNP_SQPNP)
+        # A pose behind the camera is the mirror solution, not a face
+        if not success or trans_vec[2, 0] <= 0:
+            return None
+
+        # Angles relative to the line of sight (camera to nose tip) rather than
+        # the optical axis, so a face anywhere in the frame that looks at the
+        # camera reads as level. Only the last row of the rotation into the
+        # line-of-sight frame is needed: the unit ray times rmat. Then
+        # euler_angles(... @ MODEL_TO_CAMERA) for a single face, in scalar math
+        rmat, _ = cv2.Rodrigues(rot_vec)
+        ray = trans_vec.ravel()
+        r20, r21, r22 = (ray / np.linalg.norm(ray)) @ rmat
+        pitch = -math.degrees(math.atan2(-r21, -r22))
+        yaw = math.degrees(math.atan2(-r20, math.hypot(r21, r22)))
+        return pitch, yaw, rot_vec, trans_vec
+
+    def solve(self, points, pose_indices, w, h):
+        """Pitch and yaw (degrees) for every face; NaN where PnP failed.
+
+        points: (faces, N, 3) normalized landmarks from landmarks_to_array.
+        """
+        num_faces = len(points)
+        if self.mode == "fast" or num_faces == 0:
+            return euler_angles(face_axes(points, w, h)) if num_faces else (np.empty(0), np.empty(0))
+
+        pitch = np.full(num_faces, np.nan)
+        yaw = np.full(num_faces, np.nan)
+        faces_2d = points[:, pose_indices, :2].astype(np.float64, order="C") * np.array([w, h], dtype=np.float64)
+        for i in range(num_faces):
+            pose = self.solve_pnp(faces_2d[i], w, h)
+            if pose is not None:
+                pitch[i], yaw[i] = pose[0], pose[1]
+        return pitch, yaw
+
+    def project(self, points_3d, rot_vec, trans_vec, w, h):
+        projected, _ = cv2.projectPoints(np.asarray(points_3d, dtype=np.float64), rot_vec, trans_vec,
+                                         self.camera_matrix(w, h), self.dist_coeffs)
+        return projected.reshape(-1, 2)
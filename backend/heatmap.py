@@ -0,0 +1,76 @@
+import base64
+import time
+
+import cv2
+import numpy as np
+
+
+class HeatmapAccumulator:
+    """Fixed-resolution 2D histogram of where faces are in the frame.
+
+    Positions are binned in place on every update, so memory is constant no
+    matter how long a room runs. With ``half_life`` (seconds) older activity
+    fades out exponentially. The rendered PNG is cached until the next update.
+    """
+
+    def __init__(self, width=64, height=48, half_life=None):
+        self.width = width
+        self.height = height
+        self.half_life = half_life
+        self.grid = np.zeros((height, width), dtype=np.float32)
+        self.last_update = None
+        self.version = 0
+        self.total = 0
+        self._png = None
+
+    def _decay(self, ts):
+        if self.half_life and self.last_update is not None and ts > self.last_update:
+            self.grid *= 0.5 ** ((ts - self.last_update) / self.half_life)
+        self.last_update = ts
+
+    def add(self, xs, ys, frame_w, frame_h, ts=None):
+        # xs, ys: pixel positions in a frame_w x frame_h image
+        ts = time.time() if ts is None else ts
+        self._decay(ts)
+        xs = np.asarray(xs, dtype=np.float32)
+        ys = np.asarray(ys, dtype=np.float32)
+        if len(xs):
+            gx = np.clip((xs * (self.width / frame_w)).astype(np.int32), 0, self.width - 1)
+            gy = np.clip((ys * (self.height / frame_h)).astype(np.int32), 0, self.height - 1)
+            np.add.at(self.grid, (gy, gx), 1.0)
+            self.total += len(xs)
+        self.version += 1
+
+    def normalized(self, grid=None):
+        # uint8 grid scaled so the hottest cell is 255
+        grid = self.grid if grid is None else grid
+        peak = grid.max()
+        if peak <= 0:
+            return np.zeros(grid.shape, dtype=np.uint8)
+        return (grid * (255.0 / peak)).astype(np.uint8)
+
+    def snapshot(self):
+        return {
+            "width": self.width,
+            "height": self.height,
+            "version": self.version,
+            "samples": self.total,
+            "peak": float(self.grid.max()),
+            "encoding": "uint8-base64",
+            "data": base64.b64encode(self.normalized().tobytes()).decode("ascii"),
+        }
+
+    def to_png(self, size=(640, 480)):
+        if self._png is not None and self._png[0] == (self.version, size):
+            return self._png[1]
+        image = self.normalized(cv2.GaussianBlur(self.grid, (0, 0), 1.0))
+        image = cv2.resize(image, size, interpolation=cv2.INTER_LINEAR)
+        colored = cv2.applyColorMap(image, cv2.COLORMAP_JET)
+        ok, png = cv2.imencode(".png", colored)
+        png = png.tobytes()
+        self._png = ((self.version, size), png)
+        return png
+
+    @property
+    def nbytes(self):
+        return self.grid.nbytes
@@ -0,0 +1,162 @@
+import math
+import time
+
+import cv2
+import numpy as np
+
+from landmarks import LEFT_EYE, RIGHT_EYE, NOSE_TIP
+
+# Landmarks followed with optical flow between keyframes: both eyes (EAR),
+# the head pose points and the face outline. The rest of the mesh follows a
+# per-face similarity transform fitted to these.
+FLOW_INDICES = np.array(sorted(set(
+    LEFT_EYE + RIGHT_EYE + [NOSE_TIP, 199, 152, 10, 33, 263, 61, 291, 234, 454, 127, 356, 172, 397]
+)))
+
+LK_PARAMS = dict(
+    winSize=(15, 15),
+    maxLevel=2,
+    criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 10, 0.03),
+)
+
+
+class KeyframeScheduler:
+    """Decides when VisionEngine runs FaceMesh and propagates landmarks in between.
+
+    Between keyframes a sparse set of landmarks is tracked with pyramidal
+    Lucas-Kanade flow and the full mesh is moved with a similarity transform
+    fitted per face. A keyframe is forced when flow loses points, its error or
+    the motion since the last keyframe crosses a threshold, or the frame size
+    changes.
+
+    With ``cpu_budget_ms`` the keyframe interval adapts so that the average
+    per-frame cost (one keyframe plus interval - 1 propagated frames) stays
+    within the budget; otherwise it is fixed at ``max_interval``.
+    """
+
+    def __init__(self, max_interval=4, cpu_budget_ms=None, motion_threshold=0.25,
+                 error_threshold=20.0, min_tracked=0.8, smoothing=0.1):
+        self.max_interval = max(1, max_interval)
+        self.cpu_budget_ms = cpu_budget_ms
+        self.motion_threshold = motion_threshold
+        self.error_threshold = error_threshold
+        self.min_tracked = min_tracked
+        self.smoothing = smoothing
+
+        self.interval = self.max_interval if cpu_budget_ms is None else 1
+        self.keyframe_ms = None
+        self.propagate_ms = None
+        self.frames_since_keyframe = 0
+        self.prev_gray = None
+        self.prev_points = None
+        self.key_points = None
+        self.keyframes = 0
+        self.propagated = 0
+        self.forced = 0
+
+    @property
+    def enabled(self):
+        return self.max_interval > 1
+
+    def should_detect(self, shape):
+        if not self.enabled or self.prev_gray is None or self.prev_gray.shape != shape[:2]:
+            return True
+        return self.frames_since_keyframe + 1 >= self.interval
+
+    def record_keyframe(self, gray, points, w, h, cost_ms):
+        # points: (faces, N, 3) normalized landmarks from FaceMesh
+        self.keyframes += 1
+        self.frames_since_keyframe = 0
+        self.keyframe_ms = self._ema(self.keyframe_ms, cost_ms)
+        self.prev_gray = gray
+        self.prev_points = points.copy()
+        self.key_points = points.copy()
+        self._adapt()
+
+    def propagate(self, gray, w, h):
+        """Landmarks for a non-keyframe, or None when a keyframe is needed."""
+        start = time.perf_counter()
+        points = self.prev_points
+        if len(points) == 0:
+            result = points
+        else:
+            result = self._flow(gray, points, w, h)
+            if result is None:
+                self.forced += 1
+                self.frames_since_keyframe = self.interval
+                return None
+
+        self.propagated += 1
+        self.frames_since_keyframe += 1
+        self.prev_gray = gray
+        self.prev_points = result
+        self.propagate_ms = self._ema(self.propagate_ms, (time.perf_counter() - start) * 1000.0)
+        self._adapt()
+        return result
+
+    def _flow(self, gray, points, w, h):
+        scale = np.array([w, h], dtype=np.float32)
+        faces = len(points)
+        k = len(FLOW_INDICES)
+        prev_px = points[:, FLOW_INDICES, :2] * scale
+        next_px, status, err = cv2.calcOpticalFlowPyrLK(
+            self.prev_gray, gray, prev_px.reshape(-1, 1, 2), None, **LK_PARAMS)
+        next_px = next_px.reshape(faces, k, 2)
+        ok = status.reshape(faces, k).astype(bool)
+        err = err.reshape(faces, k)
+
+        # Any face that lost its points, tracks badly or moved too far since the
+        # keyframe triggers a fresh detection for the whole frame.
+        if (ok.mean(axis=1) < self.min_tracked).any():
+            return None
+        if np.nanmax(np.where(ok, err, 0).mean(axis=1)) > self.error_threshold:
+            return None
+        key_px = self.key_points[:, FLOW_INDICES, :2] * scale
+        face_width = np.ptp(key_px[..., 0], axis=1) + 1e-6
+        motion = np.median(np.linalg.norm(next_px - key_px, axis=2), axis=1) / face_width
+        if (motion > self.motion_threshold).any():
+            return None
+
+        result = points.copy()
+        for i in range(faces):
+            transform, _ = cv2.estimateAffinePartial2D(prev_px[i][ok[i]], next_px[i][ok[i]])
+            if transform is None:
+                return None
+            full_px = points[i, :, :2] * scale
+            moved = full_px @ transform[:, :2].T + transform[:, 2]
+            # Tracked points keep their own flow so blinks still change the EAR
+            moved[FLOW_INDICES[ok[i]]] = next_px[i][ok[i]]
+            result[i, :, :2] = moved / scale
+        return result
+
+    def _ema(self, current, value):
+        if current is None:
+            return value
+        return current + self.smoothing * (value - current)
+
+    def _adapt(self):
+        if self.cpu_budget_ms is None or self.keyframe_ms is None:
+            return
+        if self.propagate_ms is None:
+            # No propagation cost measured yet: try stretching the interval
+            self.interval = 1 if self.keyframe_ms <= self.cpu_budget_ms else min(2, self.max_interval)
+            return
+        # Average cost over an interval of n frames is (kf + (n - 1) * prop) / n
+        spare = self.cpu_budget_ms - self.propagate_ms
+        if self.keyframe_ms <= self.cpu_budget_ms:
+            interval = 1
+        elif spare <= 0:
+            interval = self.max_interval
+        else:
+            interval = math.ceil((self.keyframe_ms - self.propagate_ms) / spare)
+        self.interval = int(min(max(interval, 1), self.max_interval))
+
+    def stats(self):
+        return {
+            "interval": self.interval,
+            "keyframes": self.keyframes,
+            "propagated": self.propagated,
+            "forced_keyframes": self.forced,
+            "keyframe_ms": self.keyframe_ms,
+            "propagate_ms": self.propagate_ms,
+        }
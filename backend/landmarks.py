@@ -0,0 +1,70 @@
+import numpy as np
+
+# Shared landmark helpers for VisionEngine (backend) and VideoProcessor
+# (modules/tracking.py). Everything works on one (faces, landmarks, 3) float32
+# array per frame so per-face math is a handful of NumPy operations.
+
+NUM_LANDMARKS = 478  # 468 mesh points + 10 iris points with refine_landmarks
+
+LEFT_EYE = [362, 385, 387, 263, 373, 380]
+RIGHT_EYE = [33, 160, 158, 133, 153, 144]
+EYES = np.array([LEFT_EYE, RIGHT_EYE])
+NOSE_TIP = 1
+
+# FaceMesh runs its detector at 128px and the mesh at 192px per face, so
+# frames can be decoded at reduced resolution down to this width.
+MIN_INPUT_WIDTH = 320
+
+
+def landmarks_to_array(multi_face_landmarks):
+    """Convert MediaPipe ``multi_face_landmarks`` to a (faces, N, 3) float32 array
+    of normalized x, y, z coordinates."""
+    if not multi_face_landmarks:
+        return np.empty((0, NUM_LANDMARKS, 3), dtype=np.float32)
+    faces = len(multi_face_landmarks)
+    n = len(multi_face_landmarks[0].landmark)
+    flat = np.fromiter(
+        (v for face in multi_face_landmarks for lm in face.landmark for v in (lm.x, lm.y, lm.z)),
+        dtype=np.float32,
+        count=faces * n * 3,
+    )
+    return flat.reshape(faces, n, 3)
+
+
+def to_pixels(points, w, h):
+    # (faces, N, 3) normalized -> (faces, N, 2) pixel coordinates, no rounding
+    return points[..., :2] * np.array([w, h], dtype=np.float32)
+
+
+def eye_aspect_ratio(pixels, eye_indices=EYES):
+    """EAR for every face (and every eye when ``eye_indices`` is 2D).
+
+    Returns shape (faces,) for one eye or (faces, eyes) for a stack of eyes.
+    """
+    p = pixels[:, eye_indices]
+    v1 = np.linalg.norm(p[..., 1, :] - p[..., 5, :], axis=-1)
+    v2 = np.linalg.norm(p[..., 2, :] - p[..., 4, :], axis=-1)
+    h_dist = np.linalg.norm(p[..., 0, :] - p[..., 3, :], axis=-1)
+    return np.divide(v1 + v2, 2.0 * h_dist, out=np.zeros_like(h_dist), where=h_dist > 0)
+
+
+def average_ear(pixels):
+    if len(pixels) == 0:
+        return np.empty(0, dtype=np.float32)
+    return eye_aspect_ratio(pixels, EYES).mean(axis=1)
+
+
+def gaze_direction(pitch, yaw, threshold=10):
+    # NaN angles (pose failed) compare False everywhere and fall through to Center
+    pitch = np.asarray(pitch)
+    yaw = np.asarray(yaw)
+    return np.select(
+        [pitch < -threshold, pitch > threshold, yaw < -threshold, yaw > threshold],
+        ["Down", "Up", "Left", "Right"],
+        default="Center",
+    )
+
+
+def heatmap_points(pixels, index=NOSE_TIP):
+    # (faces, 2) integer pixel positions of the nose tip
+    return pixels[:, index].astype(np.int32)
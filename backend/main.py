@@ -1,16 +1,30 @@
+import time
+
+# Boot timestamp for the startup-time metric, before the heavier imports
+BOOT_TIME = time.perf_counter()
+
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, Response
 import uvicorn
-import cv2
-import numpy as np
-import base64
 import json
-import time
-from datetime import datetime
-from reportlab.lib.pagesizes import letter
-from reportlab.pdfgen import canvas
-from vision_engine import VisionEngine
+# Only the worker processes load MediaPipe (vision_engine); this process
+# needs the input width FaceMesh works at and nothing else from it.
+from landmarks import MIN_INPUT_WIDTH
+from frame_protocol import FrameDecoder, FrameProtocolError
+from worker_pool import create_pool
+from frame_mailbox import LatestMailbox
+from session_store import SessionStore
+from session_log import SessionLog
+from heatmap import HeatmapAccumulator
+from report import ReportCache, build_report
+from metrics import Metrics, metrics_enabled
+from compact_stream import CompactEncoder
+from room_channel import RoomChannel
+from capture_control import CaptureController
+import asyncio
+import functools
+import itertools
 import os
 
 app = FastAPI()
@@ -24,121 +38,384 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-vision_engine = VisionEngine()
+# VisionEngine instances live in the worker processes, one per camera, kept
+# in an engine registry that evicts idle cameras (see engine_registry.py)
+inference_pool = create_pool()
+connection_ids = itertools.count(1)
+# Connections without ?camera= are labelled conn-<run>-<n>; the run id keeps
+# those labels (and the student IDs logged under them) apart across restarts
+RUN_ID = format(int(time.time()), "x")
+
+# Live aggregates per (room, session): bounded ring buffers + running sums.
+# A store is dropped INSIGHT_SESSION_TTL seconds after its last camera
+# disconnected; the session log still has everything, so a session that
+# resumes later is rebuilt from it.
+session_stores = {}
+session_connections = {}
+session_idle_since = {}
+SESSION_TTL = float(os.environ.get("INSIGHT_SESSION_TTL", 600))
+
+# Attention heatmap per room (fixed-size histogram, optional time decay)
+heatmaps = {}
+HEATMAP_HALF_LIFE = float(os.environ.get("INSIGHT_HEATMAP_HALF_LIFE", 0)) or None
+
+def get_heatmap(room):
+    heatmap = heatmaps.get(room)
+    if heatmap is None:
+        heatmap = heatmaps[room] = HeatmapAccumulator(half_life=HEATMAP_HALF_LIFE)
+    return heatmap
+
+# Rendered PDFs by (room, session, session log version)
+report_cache = ReportCache()
+
+# Durable append-only log of every processed frame (opened at startup)
+session_log = None
+
+# Seconds from process boot until the inference workers were warmed up
+startup_seconds = None
+
+# ?format=compact responses: full snapshot every N messages, stats at most every N seconds
+COMPACT_SNAPSHOT_INTERVAL = int(os.environ.get("INSIGHT_COMPACT_SNAPSHOT_INTERVAL", 30))
+COMPACT_STATS_INTERVAL = float(os.environ.get("INSIGHT_COMPACT_STATS_INTERVAL", 1.0))
+
+# Capture hints for /ws?control=1 clients: keep each connection's latency under this budget
+LATENCY_BUDGET_MS = float(os.environ.get("INSIGHT_LATENCY_BUDGET_MS", 150))
+MAX_CLIENT_FPS = float(os.environ.get("INSIGHT_MAX_CLIENT_FPS", 15))
 
-# Store session data for reporting
-session_data = {
-    "timestamps": [],
-    "avg_engagement": [],
-    "distraction_events": [],
-    "emotions_log": [],
-    "heatmap_points": []
-}
+# Class aggregates pushed to teacher subscribers (/ws/teacher) every tick
+room_channel = RoomChannel(tick=float(os.environ.get("INSIGHT_TEACHER_TICK", 1.0)))
+
+# Prometheus metrics for /metrics; None when disabled with INSIGHT_METRICS=0
+metrics = Metrics() if metrics_enabled() else None
+active_connections = set()
+
+def collect_state():
+    return {
+        "active_connections": len(active_connections),
+        "teacher_subscribers": room_channel.subscriber_count,
+        "session_stores": len(session_stores),
+        "session_store_bytes": sum(store.nbytes for store in session_stores.values()),
+        "heatmap_bytes": sum(heatmap.nbytes for heatmap in heatmaps.values()),
+        "session_log_pending": session_log.pending() if session_log is not None else 0,
+        "session_log_dropped": session_log.dropped if session_log is not None else 0,
+    }
+
+if metrics is not None:
+    metrics.collectors.append(collect_state)
+    metrics.collectors.append(inference_pool.engine_stats)
+    metrics.collectors.append(inference_pool.startup_stats)
+    metrics.collectors.append(lambda: {"startup_seconds": startup_seconds or 0.0})
+
+async def get_session_store(room, session):
+    # Live store for a (room, session); a session resumed after a restart
+    # continues from the aggregates in the log
+    store = session_stores.get((room, session))
+    if store is None:
+        loaded = await asyncio.to_thread(SessionStore.from_log, session_log, room, session)
+        store = session_stores.setdefault((room, session), loaded)
+    return store
+
+def evict_idle_sessions(now=None):
+    now = time.monotonic() if now is None else now
+    for key, since in list(session_idle_since.items()):
+        if now - since >= SESSION_TTL:
+            del session_idle_since[key]
+            session_stores.pop(key, None)
+
+async def sweep_idle_sessions():
+    while True:
+        await asyncio.sleep(min(SESSION_TTL, 60.0))
+        evict_idle_sessions()
+
+@app.on_event("startup")
+async def start_inference_pool():
+    global session_log
+    session_log = SessionLog(os.environ.get("INSIGHT_DB", "insight_sessions.db"))
+    inference_pool.start()
+    room_channel.start()
+    asyncio.create_task(record_startup())
+    asyncio.create_task(sweep_idle_sessions())
+    if metrics is not None:
+        asyncio.create_task(metrics.watch_event_loop())
+
+async def record_startup():
+    global startup_seconds
+    await inference_pool.wait_ready()
+    startup_seconds = time.perf_counter() - BOOT_TIME
+    print(f"Inference workers ready, startup took {startup_seconds:.2f}s")
+
+@app.on_event("shutdown")
+async def stop_inference_pool():
+    room_channel.stop()
+    inference_pool.stop()
+    session_log.close()
 
 @app.get("/")
 async def root():
     return {"message": "Classroom Insight AI Backend Running"}
 
+@app.get("/ready")
+async def ready():
+    # 200 once every inference worker has warmed up FaceMesh, 503 before that
+    # (and while a crashed worker is being replaced)
+    is_ready = inference_pool.ready and session_log is not None
+    body = {"ready": is_ready, "startup_seconds": startup_seconds, "workers": inference_pool.num_workers}
+    return JSONResponse(body, status_code=200 if is_ready else 503)
+
+async def receive_frames(websocket: WebSocket, mailbox: LatestMailbox):
+    # Reads the socket as fast as the client sends; only the newest frame is kept.
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            message["received_at"] = time.perf_counter()
+            mailbox.put(message)
+    finally:
+        mailbox.close()
+
 @app.websocket("/ws")
-async def websocket_endpoint(websocket: WebSocket):
+async def websocket_endpoint(websocket: WebSocket, room: str = "default", session: str = "default",
+                             format: str = "json", camera: str = None, control: bool = False):
     await websocket.accept()
+    # Accepts binary frames (see frame_protocol.py) and legacy base64 data URLs.
+    decoder = FrameDecoder(min_width=MIN_INPUT_WIDTH)
+    # Responses are JSON text, or binary deltas with ?format=compact (see compact_stream.py)
+    encoder = None
+    if format == "compact":
+        encoder = CompactEncoder(snapshot_interval=COMPACT_SNAPSHOT_INTERVAL, stats_interval=COMPACT_STATS_INTERVAL)
+    send = websocket.send_text if encoder is None else websocket.send_bytes
+    encode = json.dumps if encoder is None else encoder.encode
+    # With ?control=1 the server sends {"control": {fps, width, quality, budget_ms}}
+    # text messages whenever the capture settings it wants change (capture_control.py)
+    controller = CaptureController(budget_ms=LATENCY_BUDGET_MS, max_fps=MAX_CLIENT_FPS) if control else None
+    controlled_dropped = 0
+    conn_id = next(connection_ids)
+    # Cameras that pass a stable ?camera= id get their engine (tracker and
+    # behavior counters) back when they reconnect
+    camera_key = (room, camera or f"conn-{RUN_ID}-{conn_id}")
+    session_connections[(room, session)] = session_connections.get((room, session), 0) + 1
+    session_idle_since.pop((room, session), None)
+    session_store = await get_session_store(room, session)
+    heatmap = get_heatmap(room)
+    mailbox = LatestMailbox()
+    receiver = asyncio.create_task(receive_frames(websocket, mailbox))
+    active_connections.add(conn_id)
+    conn_label = str(conn_id)
+    reported_dropped = 0
+    inference_pool.acquire(camera_key, session)
     try:
+        if controller is not None:
+            await websocket.send_text(json.dumps({"control": controller.hint(force=True)}))
         while True:
-            data = await websocket.receive_text()
-            # Expecting base64 image: "data:image/jpeg;base64,....."
-            if "base64," in data:
-                header, encoded = data.split(",", 1)
-                image_data = base64.b64decode(encoded)
-                nparr = np.frombuffer(image_data, np.uint8)
-                frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-
-                # Process Frame
-                students, processed_frame = vision_engine.process_frame(frame)
-
-                # Aggregate Stats
-                total_students = len(students)
-                if total_students > 0:
-                    distracted_count = sum(1 for s in students if s['distracted'])
-                    drowsy_count = sum(1 for s in students if s['drowsy'])
-                    engagement_score = max(0, 100 - ((distracted_count + drowsy_count) / total_students * 100))
-                    
-                    # Log for report
-                    now = datetime.now().isoformat()
-                    session_data["timestamps"].append(now)
-                    session_data["avg_engagement"].append(engagement_score)
-                    if engagement_score < 70:
-                        session_data["distraction_events"].append(now)
-                    
-                    for s in students:
-                        session_data["heatmap_points"].append(s["position"])
-                        session_data["emotions_log"].append(s["emotion"])
-                    
-                    # Logic for Intervention
-                    intervention = None
-                    if engagement_score < 70:
-                         intervention = "Attention dropping! Suggest a 2-minute stretch break."
-                    elif drowsy_count > total_students * 0.3:
-                         intervention = "High drowsiness detected. Try an interactive poll/quiz."
-
-                    response = {
-                        "students": students,
-                        "stats": {
-                            "total": total_students,
-                            "distracted": distracted_count,
-                            "drowsy": drowsy_count,
-                            "engagement": engagement_score
-                        },
-                        "intervention": intervention
-                    }
-                    
-                    await websocket.send_text(json.dumps(response))
-                else:
-                    await websocket.send_text(json.dumps({"students": [], "stats": {"engagement": 100}, "intervention": None}))
-            
+            message = await mailbox.get()
+            if message is None:
+                raise WebSocketDisconnect()
+            picked_at = time.perf_counter()
+            try:
+                decoded = decoder.decode_message(message)
+            except FrameProtocolError as e:
+                await websocket.send_text(json.dumps({"error": str(e)}))
+                continue
+            if decoded is None:
+                continue
+
+            # Process Frame
+            if metrics is not None:
+                t = time.perf_counter()
+            students, _behavior, timings, events = await inference_pool.process(camera_key, decoded.image)
+            if metrics is not None:
+                t = time.perf_counter() - t
+                metrics.observe_stages(timings)
+                metrics.stage_ms.observe(t * 1000.0, "inference")
+                metrics.stage_ms.observe(decoded.decode_ms - decoded.base64_ms, "imdecode")
+                if not decoded.binary:
+                    metrics.stage_ms.observe(decoded.base64_ms, "base64")
+                metrics.frames.inc(1, room, conn_label)
+                if mailbox.dropped != reported_dropped:
+                    metrics.dropped.inc(mailbox.dropped - reported_dropped, room, conn_label)
+                    reported_dropped = mailbox.dropped
+            if decoded.scale != 1:
+                # Report positions in the client's full resolution coordinates
+                for s in students:
+                    s["position"] = {"x": s["position"]["x"] * decoded.scale,
+                                     "y": s["position"]["y"] * decoded.scale}
+
+            frame_info = {
+                "seq": decoded.seq,
+                "bytes": decoded.num_bytes,
+                "decode_ms": round(decoded.decode_ms, 2),
+                "scale": decoded.scale,
+                "dropped": mailbox.dropped
+            }
+
+            # Drowsy/distracted/looked down/left seat start and end events
+            if events:
+                session_store.record_events(events)
+                session_log.append_events(room, session, events, camera=camera_key[1])
+
+            # Aggregate Stats
+            total_students = len(students)
+            if total_students > 0:
+                distracted_count = sum(1 for s in students if s['distracted'])
+                drowsy_count = sum(1 for s in students if s['drowsy'])
+                engagement_score = max(0, 100 - ((distracted_count + drowsy_count) / total_students * 100))
+                
+                # Log for report
+                now = time.time()
+                frame_h, frame_w = decoded.image.shape[:2]
+                frame_size = (frame_w * decoded.scale, frame_h * decoded.scale)
+                session_store.record_frame(students, engagement_score, distracted_count, drowsy_count, ts=now,
+                                           frame_size=frame_size)
+                session_log.append_frame(room, session, now, engagement_score, distracted_count, drowsy_count, students,
+                                         camera=camera_key[1], frame_size=frame_size)
+                heatmap.add([s["position"]["x"] for s in students], [s["position"]["y"] for s in students],
+                            *frame_size, ts=now)
+                
+                # Logic for Intervention
+                intervention = None
+                if engagement_score < 70:
+                     intervention = "Attention dropping! Suggest a 2-minute stretch break."
+                elif drowsy_count > total_students * 0.3:
+                     intervention = "High drowsiness detected. Try an interactive poll/quiz."
+
+                response = {
+                    "students": students,
+                    "stats": {
+                        "total": total_students,
+                        "distracted": distracted_count,
+                        "drowsy": drowsy_count,
+                        "engagement": engagement_score
+                    },
+                    "intervention": intervention,
+                    "frame": frame_info
+                }
+                room_channel.update(room, conn_id, total_students, distracted_count, drowsy_count, intervention)
+            else:
+                response = {"students": [], "stats": {"engagement": 100}, "intervention": None, "frame": frame_info}
+                room_channel.update(room, conn_id, 0, 0, 0, None)
+
+            if events:
+                response["events"] = events
+
+            if metrics is not None:
+                t = time.perf_counter()
+                payload = encode(response)
+                metrics.stage_ms.observe((time.perf_counter() - t) * 1000.0, "serialize")
+            else:
+                payload = encode(response)
+            await send(payload)
+
+            if controller is not None:
+                done = time.perf_counter()
+                hint = controller.observe((done - message["received_at"]) * 1000.0, (done - picked_at) * 1000.0,
+                                          mailbox.dropped - controlled_dropped)
+                controlled_dropped = mailbox.dropped
+                if hint is not None:
+                    await websocket.send_text(json.dumps({"control": hint}))
+
     except WebSocketDisconnect:
         print("Client disconnected")
     except Exception as e:
         print(f"Error: {e}")
+    finally:
+        receiver.cancel()
+        inference_pool.release(camera_key)
+        active_connections.discard(conn_id)
+        room_channel.remove(room, conn_id)
+        session_connections[(room, session)] -= 1
+        if not session_connections[(room, session)]:
+            del session_connections[(room, session)]
+            session_idle_since[(room, session)] = time.monotonic()
+        if metrics is not None:
+            metrics.connection_closed(room, conn_id)
+
+@app.websocket("/ws/teacher")
+async def teacher_endpoint(websocket: WebSocket, room: str = "default"):
+    # Receive-only for the client: class aggregates for the room, once per tick when they change
+    await websocket.accept()
+    try:
+        # Inside the try: a client that disconnects before the first snapshot
+        # is sent must not stay subscribed
+        await room_channel.subscribe(room, websocket)
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+    finally:
+        room_channel.unsubscribe(room, websocket)
+
+@app.get("/stats")
+async def session_stats(room: str = "default", session: str = "default"):
+    # Handlers that read the live stores run on the event loop, which is the
+    # only place they are mutated; past sessions are rebuilt on a thread
+    store = session_stores.get((room, session))
+    if store is None:
+        store = await asyncio.to_thread(SessionStore.from_log, session_log, room, session)
+    return store.summary()
+
+@app.get("/sessions")
+def list_sessions(room: str = None):
+    return session_log.sessions(room)
+
+@app.get("/sessions/{room}/{session}/timeline")
+def session_timeline(room: str, session: str, start: float = None, end: float = None, limit: int = 10000):
+    rows = session_log.frames(room, session, start, end, limit)
+    return {
+        "room": room,
+        "session": session,
+        "columns": ["ts", "engagement", "total", "distracted", "drowsy"],
+        "rows": rows
+    }
+
+@app.get("/sessions/{room}/{session}/events")
+def session_events(room: str, session: str, start: float = None, end: float = None, student: int = None,
+                   camera: str = None):
+    rows = session_log.events(room, session, start, end, student, camera)
+    return {
+        "room": room,
+        "session": session,
+        "columns": ["ts", "camera", "student_id", "type", "phase"],
+        "rows": rows
+    }
+
+@app.get("/heatmap/{room}")
+async def room_heatmap(room: str, format: str = "json"):
+    heatmap = heatmaps.get(room)
+    if heatmap is None:
+        return JSONResponse({"detail": f"Unknown room: {room}"}, status_code=404)
+    if format == "png":
+        return Response(content=heatmap.to_png(), media_type="image/png")
+    return heatmap.snapshot()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    if metrics is None:
+        return PlainTextResponse("# metrics disabled (INSIGHT_METRICS=0)\n", status_code=404)
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
 
 @app.get("/generate_report")
-def generate_report():
-    filename = "end_of_session_report.pdf"
-    c = canvas.Canvas(filename, pagesize=letter)
-    width, height = letter
-
-    c.setFont("Helvetica-Bold", 20)
-    c.drawString(50, height - 50, "Classroom Insight AI - Session Report")
-    
-    c.setFont("Helvetica", 12)
-    c.drawString(50, height - 100, f"Date: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-    
-    # Calculate Summary Stats
-    avg_eng = 0
-    if len(session_data["avg_engagement"]) > 0:
-        avg_eng = sum(session_data["avg_engagement"]) / len(session_data["avg_engagement"])
-    
-    unique_emotions = set(session_data["emotions_log"])
-    dominant_emotion = "N/A"
-    if session_data["emotions_log"]:
-        dominant_emotion = max(set(session_data["emotions_log"]), key=session_data["emotions_log"].count)
-
-    c.drawString(50, height - 130, f"Average Engagement Score: {avg_eng:.2f}%")
-    c.drawString(50, height - 150, f"Dominant Emotion (Vibe Check): {dominant_emotion}")
-    c.drawString(50, height - 170, f"Peak Distraction Events: {len(session_data['distraction_events'])}")
-
-    # Behavioral Analysis Section
-    c.setFont("Helvetica-Bold", 14)
-    c.drawString(50, height - 210, "Behavioral Analysis")
-    c.setFont("Helvetica", 12)
-    c.drawString(50, height - 230, f"Total Times Left Seat: {vision_engine.leaving_seat_count}")
-    c.drawString(50, height - 250, f"Total Times Looked Down: {vision_engine.looking_down_count}")
-
-    c.drawString(50, height - 290, "Heatmap Analysis:")
-    c.drawString(50, height - 310, "(See Live Dashboard for Interactive Heatmap Visuals)")
-    
-    c.save()
-    
-    return FileResponse(filename, media_type='application/pdf', filename=filename)
+async def generate_report(room: str = "default", session: str = "default"):
+    # Every append to the session bumps its log version, so a cached PDF for
+    # the current version is served without touching the session data
+    key = (room, session, session_log.version(room, session))
+    build = None
+    if key not in report_cache:
+        session_store = session_stores.get((room, session))
+        if session_store is None:
+            session_store = await asyncio.to_thread(SessionStore.from_log, session_log, room, session)
+        # Snapshot everything on the event loop, render on a worker thread
+        summary = session_store.summary()
+        behavior = session_store.behavior()
+        timeline = session_store.engagement_timeline()
+        heatmap_png = session_store.heatmap.to_png() if session_store.heatmap.total else None
+        build = functools.partial(build_report, room, session, summary, behavior, timeline, heatmap_png)
+    pdf = await report_cache.get(key, build)
+
+    filename = f"session_report_{room}_{session}.pdf"
+    return Response(content=pdf, media_type="application/pdf",
+                    headers={"Content-Disposition": f'attachment; filename="{filename}"'})
 
 if __name__ == "__main__":
-    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
+    uvicorn.run("main:app", host=os.environ.get("INSIGHT_HOST", "0.0.0.0"), port=int(os.environ.get("INSIGHT_PORT", 8000)),
+                reload=os.environ.get("INSIGHT_RELOAD") == "1")
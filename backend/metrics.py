@@ -0,0 +1,130 @@
+import asyncio
+import bisect
+import os
+import time
+
+# Upper bounds in milliseconds, roughly x2 apart from 0.1 ms to 2.5 s
+LATENCY_BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+
+def metrics_enabled():
+    # INSIGHT_METRICS=0 turns instrumentation off entirely (no timers on the hot path)
+    return os.environ.get("INSIGHT_METRICS", "1") != "0"
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{v}"' for n, v in zip(names, values)) + "}"
+
+
+class Histogram:
+    """Cumulative-bucket histogram per label set, Prometheus style.
+
+    observe() is a bisect and two list increments, cheap enough for every stage
+    of every frame.
+    """
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS_MS):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self.buckets = tuple(buckets)
+        self.series = {}
+
+    def observe(self, value, *labels):
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total) in sorted(self.series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                label_str = _labels(self.label_names + ("le",), labels + (bound,))
+                lines.append(f"{self.name}_bucket{label_str} {cumulative}")
+            label_str = _labels(self.label_names, labels)
+            lines.append(f"{self.name}_sum{label_str} {total}")
+            lines.append(f"{self.name}_count{label_str} {cumulative}")
+        return lines
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self.values = {}
+
+    def inc(self, amount=1, *labels):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def remove(self, *labels):
+        self.values.pop(labels, None)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for labels, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{_labels(self.label_names, labels)} {value}")
+        return lines
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value, *labels):
+        self.values[labels] = value
+
+
+class Metrics:
+    """Everything /metrics reports for this server process.
+
+    Gauges that are cheap to compute on demand (sizes, connection counts) are
+    filled in by a collect callback at scrape time instead of on the hot path.
+    """
+
+    def __init__(self):
+        self.stage_ms = Histogram("insight_stage_latency_ms", "Per-stage frame processing latency",
+                                  labels=("stage",))
+        self.loop_lag_ms = Histogram("insight_event_loop_lag_ms", "Event loop scheduling delay")
+        self.frames = Counter("insight_frames_processed_total", "Frames processed per connection",
+                              labels=("room", "conn"))
+        self.dropped = Counter("insight_frames_dropped_total", "Frames replaced by a newer one before processing",
+                               labels=("room", "conn"))
+        self.gauges = Gauge("insight_state", "Server state sampled at scrape time", labels=("name",))
+        self.collectors = []
+        self.started = time.time()
+
+    def observe_stages(self, timings):
+        # timings: {stage: ms}
+        for stage, ms in timings.items():
+            self.stage_ms.observe(ms, stage)
+
+    def connection_closed(self, room, conn_id):
+        # Drop per-connection series so label cardinality stays bounded
+        self.frames.remove(room, str(conn_id))
+        self.dropped.remove(room, str(conn_id))
+
+    def render(self):
+        for collect in self.collectors:
+            for name, value in collect().items():
+                self.gauges.set(value, name)
+        self.gauges.set(time.time() - self.started, "uptime_seconds")
+        lines = []
+        for metric in (self.stage_ms, self.loop_lag_ms, self.frames, self.dropped, self.gauges):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    async def watch_event_loop(self, interval=0.25):
+        # How late a sleep wakes up is how long other callbacks held the loop
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(interval)
+            lag = (time.perf_counter() - start - interval) * 1000.0
+            self.loop_lag_ms.observe(max(lag, 0.0))
@@ -0,0 +1,121 @@
+import asyncio
+import io
+from collections import OrderedDict
+from datetime import datetime
+
+
+def _draw_line_chart(c, x, y, w, h, title, xs, series, y_max=100):
+    # series: list of (label, values, (r, g, b)); x axis in minutes
+    c.setFont("Helvetica-Bold", 12)
+    c.setFillColorRGB(0, 0, 0)
+    c.drawString(x, y + h + 10, title)
+    c.setStrokeColorRGB(0.6, 0.6, 0.6)
+    c.setLineWidth(0.5)
+    c.rect(x, y, w, h)
+    c.setFont("Helvetica", 8)
+    for frac in (0, 0.5, 1):
+        c.drawRightString(x - 4, y + frac * h - 3, f"{frac * y_max:.0f}")
+    x_max = max(xs[-1], 1e-6) if xs else 1
+    c.drawString(x, y - 12, "0 min")
+    c.drawRightString(x + w, y - 12, f"{x_max:.1f} min")
+
+    legend_x = x
+    for label, values, color in series:
+        c.setStrokeColorRGB(*color)
+        c.setFillColorRGB(*color)
+        c.setLineWidth(1.2)
+        if len(values) > 1:
+            points = [(x + w * t / x_max, y + h * min(max(v, 0), y_max) / y_max) for t, v in zip(xs, values)]
+            path = c.beginPath()
+            path.moveTo(*points[0])
+            for px, py in points[1:]:
+                path.lineTo(px, py)
+            c.drawPath(path, stroke=1, fill=0)
+        c.drawString(legend_x, y - 26, label)
+        legend_x += 90
+    c.setFillColorRGB(0, 0, 0)
+
+
+def build_report(room, session, summary, behavior, timeline, heatmap_png):
+    """Render the session report PDF into memory and return its bytes.
+
+    Takes plain snapshots (no live stores) so it can run on a worker thread.
+    """
+    # reportlab is only needed once someone asks for a report, not at boot
+    from reportlab.lib.pagesizes import letter
+    from reportlab.lib.utils import ImageReader
+    from reportlab.pdfgen import canvas
+
+    buffer = io.BytesIO()
+    c = canvas.Canvas(buffer, pagesize=letter)
+    width, height = letter
+
+    c.setFont("Helvetica-Bold", 20)
+    c.drawString(50, height - 50, "Classroom Insight AI - Session Report")
+
+    c.setFont("Helvetica", 12)
+    c.drawString(50, height - 80, f"Room: {room}    Session: {session}")
+    c.drawString(50, height - 100, f"Date: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+
+    c.drawString(50, height - 130, f"Average Engagement Score: {summary['avg_engagement']:.2f}%")
+    c.drawString(50, height - 150, f"Dominant Emotion (Vibe Check): {summary['dominant_emotion']}")
+    c.drawString(50, height - 170, f"Peak Distraction Events: {summary['distraction_events']}")
+
+    # Behavioral Analysis Section
+    c.setFont("Helvetica-Bold", 14)
+    c.drawString(50, height - 210, "Behavioral Analysis")
+    c.setFont("Helvetica", 12)
+    c.drawString(50, height - 230, f"Total Times Left Seat: {behavior['left_seat']}")
+    c.drawString(50, height - 250, f"Total Times Looked Down: {behavior['looked_down']}")
+
+    c.drawString(50, height - 290, "Heatmap Analysis:")
+    if heatmap_png:
+        c.drawImage(ImageReader(io.BytesIO(heatmap_png)), 50, height - 610, width=400, height=300)
+    else:
+        c.drawString(50, height - 310, "(No face positions recorded for this room yet)")
+
+    if timeline["minutes"]:
+        c.showPage()
+        c.setFont("Helvetica-Bold", 16)
+        c.drawString(50, height - 50, "Engagement Over Time")
+        _draw_line_chart(c, 70, height - 330, 470, 220, "Average engagement (%)", timeline["minutes"],
+                         [("Engagement", timeline["engagement"], (0.1, 0.5, 0.9))])
+        _draw_line_chart(c, 70, height - 640, 470, 220, "Students distracted / drowsy (%)", timeline["minutes"],
+                         [("Distracted", timeline["distracted"], (0.9, 0.5, 0.1)),
+                          ("Drowsy", timeline["drowsy"], (0.6, 0.2, 0.7))])
+
+    c.save()
+    return buffer.getvalue()
+
+
+class ReportCache:
+    """Small LRU of rendered reports keyed by (room, session, data version).
+
+    Concurrent requests for the same key share one build. Check ``key in
+    cache`` before gathering the report data; get() only calls ``build`` when
+    the key is missing.
+    """
+
+    def __init__(self, max_entries=16):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    async def get(self, key, build):
+        # build: zero-argument callable run on a worker thread
+        task = self.entries.get(key)
+        if task is None:
+            task = asyncio.ensure_future(asyncio.to_thread(build))
+            self.entries[key] = task
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        else:
+            self.entries.move_to_end(key)
+        try:
+            return await asyncio.shield(task)
+        except Exception:
+            if self.entries.get(key) is task:
+                del self.entries[key]
+            raise
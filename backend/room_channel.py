@@ -0,0 +1,170 @@
+import asyncio
+import json
+import time
+
+
+def class_intervention(total, distracted, drowsy, engagement):
+    # Same rules the per-camera responses use, applied to the whole class
+    if total == 0:
+        return None
+    if engagement < 70:
+        return "Attention dropping! Suggest a 2-minute stretch break."
+    if drowsy > total * 0.3:
+        return "High drowsiness detected. Try an interactive poll/quiz."
+    return None
+
+
+class RoomAggregate:
+    """Class-level counts for one room, updated incrementally.
+
+    Every camera connection contributes its latest frame's counts; an update
+    swaps that connection's previous contribution out of the running sums, so
+    the cost per frame does not depend on how many cameras are in the room.
+    """
+
+    def __init__(self, room):
+        self.room = room
+        self.cameras = {}  # conn_id -> (total, distracted, drowsy, has_intervention)
+        self.total = 0
+        self.distracted = 0
+        self.drowsy = 0
+        self.camera_interventions = 0
+        self.version = 0
+
+    def _apply(self, entry, sign):
+        total, distracted, drowsy, has_intervention = entry
+        self.total += sign * total
+        self.distracted += sign * distracted
+        self.drowsy += sign * drowsy
+        self.camera_interventions += sign * has_intervention
+
+    def update(self, conn_id, total, distracted, drowsy, intervention):
+        entry = (total, distracted, drowsy, int(intervention is not None))
+        old = self.cameras.get(conn_id)
+        if old == entry:
+            return
+        if old is not None:
+            self._apply(old, -1)
+        self._apply(entry, 1)
+        self.cameras[conn_id] = entry
+        self.version += 1
+
+    def remove(self, conn_id):
+        old = self.cameras.pop(conn_id, None)
+        if old is not None:
+            self._apply(old, -1)
+            self.version += 1
+
+    def snapshot(self):
+        if self.total:
+            engagement = max(0, 100 - (self.distracted + self.drowsy) / self.total * 100)
+        else:
+            engagement = 100
+        return {
+            "room": self.room,
+            "ts": time.time(),
+            "cameras": len(self.cameras),
+            "total": self.total,
+            "distracted": self.distracted,
+            "drowsy": self.drowsy,
+            "engagement": engagement,
+            "intervention": class_intervention(self.total, self.distracted, self.drowsy, engagement),
+            "camera_interventions": self.camera_interventions,
+        }
+
+
+class RoomChannel:
+    """Pushes room aggregates to subscribed teacher sockets on a fixed tick.
+
+    Camera updates only touch the aggregate; once per tick every room that
+    changed is serialized once and sent to all of its subscribers, so fan-out
+    cost depends on the tick and subscriber count, not on the frame rate.
+    """
+
+    def __init__(self, tick=1.0, send_timeout=None):
+        self.tick = tick
+        self.send_timeout = send_timeout or tick
+        self.rooms = {}
+        self.subscribers = {}  # room -> set of websockets
+        self.sent_versions = {}
+        self.task = None
+
+    def aggregate(self, room):
+        aggregate = self.rooms.get(room)
+        if aggregate is None:
+            aggregate = self.rooms[room] = RoomAggregate(room)
+        return aggregate
+
+    def update(self, room, conn_id, total, distracted, drowsy, intervention):
+        self.aggregate(room).update(conn_id, total, distracted, drowsy, intervention)
+
+    def remove(self, room, conn_id):
+        aggregate = self.rooms.get(room)
+        if aggregate is not None:
+            aggregate.remove(conn_id)
+            if not aggregate.cameras and not self.subscribers.get(room):
+                del self.rooms[room]
+                self.sent_versions.pop(room, None)
+
+    async def subscribe(self, room, websocket):
+        self.subscribers.setdefault(room, set()).add(websocket)
+        # New subscribers get the current state right away, then ticks
+        await websocket.send_text(json.dumps(self.aggregate(room).snapshot()))
+
+    def unsubscribe(self, room, websocket):
+        subscribers = self.subscribers.get(room)
+        if subscribers is not None:
+            subscribers.discard(websocket)
+            if not subscribers:
+                del self.subscribers[room]
+                aggregate = self.rooms.get(room)
+                if aggregate is not None and not aggregate.cameras:
+                    del self.rooms[room]
+                    self.sent_versions.pop(room, None)
+
+    @property
+    def subscriber_count(self):
+        return sum(len(s) for s in self.subscribers.values())
+
+    async def _send(self, websocket, message):
+        await asyncio.wait_for(websocket.send_text(message), self.send_timeout)
+
+    async def _drop(self, websocket):
+        try:
+            await websocket.close(code=1013)  # try again later
+        except Exception:
+            pass
+
+    async def broadcast(self):
+        targets = []
+        for room, subscribers in self.subscribers.items():
+            aggregate = self.aggregate(room)
+            if self.sent_versions.get(room) == aggregate.version:
+                continue
+            self.sent_versions[room] = aggregate.version
+            message = json.dumps(aggregate.snapshot())
+            targets.extend((room, ws, message) for ws in subscribers)
+        if not targets:
+            return
+        results = await asyncio.gather(*(self._send(ws, message) for _, ws, message in targets),
+                                       return_exceptions=True)
+        # Subscribers that error out or can't keep up with the tick are dropped
+        for (room, ws, _), result in zip(targets, results):
+            if isinstance(result, Exception):
+                self.unsubscribe(room, ws)
+                asyncio.create_task(self._drop(ws))
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.tick)
+            try:
+                await self.broadcast()
+            except Exception as e:
+                print(f"Room broadcast error: {e}")
+
+    def start(self):
+        self.task = asyncio.create_task(self.run())
+
+    def stop(self):
+        if self.task is not None:
+            self.task.cancel()
@@ -0,0 +1,253 @@
+import queue
+import sqlite3
+import threading
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    room TEXT NOT NULL,
+    session TEXT NOT NULL,
+    started REAL NOT NULL,
+    PRIMARY KEY (room, session)
+);
+CREATE TABLE IF NOT EXISTS frames (
+    room TEXT NOT NULL,
+    session TEXT NOT NULL,
+    ts REAL NOT NULL,
+    engagement REAL NOT NULL,
+    total INTEGER NOT NULL,
+    distracted INTEGER NOT NULL,
+    drowsy INTEGER NOT NULL,
+    width INTEGER NOT NULL DEFAULT 0,
+    height INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS frames_by_time ON frames (room, session, ts);
+CREATE TABLE IF NOT EXISTS students (
+    room TEXT NOT NULL,
+    session TEXT NOT NULL,
+    ts REAL NOT NULL,
+    camera TEXT NOT NULL DEFAULT '',
+    student_id INTEGER NOT NULL,
+    x INTEGER NOT NULL,
+    y INTEGER NOT NULL,
+    emotion TEXT NOT NULL,
+    drowsy INTEGER NOT NULL,
+    distracted INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS students_by_time ON students (room, session, ts);
+CREATE TABLE IF NOT EXISTS events (
+    room TEXT NOT NULL,
+    session TEXT NOT NULL,
+    ts REAL NOT NULL,
+    camera TEXT NOT NULL DEFAULT '',
+    student_id INTEGER NOT NULL,
+    type TEXT NOT NULL,
+    phase TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS events_by_time ON events (room, session, ts);
+"""
+
+
+def _migrate(conn):
+    # Columns added after the first release; older logs get the defaults
+    added = [("students", "camera", "TEXT NOT NULL DEFAULT ''"), ("events", "camera", "TEXT NOT NULL DEFAULT ''"),
+             ("frames", "width", "INTEGER NOT NULL DEFAULT 0"), ("frames", "height", "INTEGER NOT NULL DEFAULT 0")]
+    for table, column, definition in added:
+        columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+        if column not in columns:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+
+def _connect(path):
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+class SessionLog:
+    """Durable, append-only log of per-frame results keyed by room and session.
+
+    append_frame() only puts a tuple on a queue; a writer thread drains it and
+    commits batches with executemany, so the /ws loop never waits on disk.
+    SQLite runs in WAL mode, so time-range queries on a separate connection do
+    not block the writer.
+
+    Student IDs are only unique per camera, so student and event rows carry the
+    camera they came from. version() counts the records appended to a session
+    by this process, so cached reports can be checked without reading the log. At most ``max_pending`` records wait for the writer;
+    beyond that frames are dropped and counted in ``dropped``, unless
+    ``block=True`` (offline imports), where appends wait for the writer instead.
+    """
+
+    def __init__(self, path="insight_sessions.db", batch_size=2000, flush_interval=0.25, max_pending=20000,
+                 block=False):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.block = block
+        self.queue = queue.Queue(maxsize=max_pending)
+        self.known_sessions = set()
+        self.versions = {}
+        self.written = 0
+        self.dropped = 0
+
+        with _connect(path) as conn:
+            conn.executescript(SCHEMA)
+            _migrate(conn)
+        self.read_conn = _connect(path)
+        self.read_lock = threading.Lock()
+        self.writer = threading.Thread(target=self._write_loop, name="session-log-writer", daemon=True)
+        self.running = True
+        self.writer.start()
+
+    def _put(self, item):
+        try:
+            self.queue.put(item, block=self.block)
+            return True
+        except queue.Full:
+            return False
+
+    def version(self, room, session):
+        return self.versions.get((room, session), 0)
+
+    def append_frame(self, room, session, ts, engagement, distracted, drowsy, students, camera="", frame_size=None):
+        # frame_size: (width, height) the positions refer to, for heatmaps
+        self.versions[(room, session)] = self.version(room, session) + 1
+        if not self.running:
+            self.dropped += 1
+            return
+        if (room, session) not in self.known_sessions:
+            if not self._put(("session", (room, session, ts))):
+                self.dropped += 1
+                return
+            self.known_sessions.add((room, session))
+        width, height = frame_size or (0, 0)
+        if not self._put(("frame", (room, session, ts, engagement, len(students), distracted, drowsy, width, height))):
+            self.dropped += 1
+            return
+        if students:
+            rows = [(room, session, ts, camera, s["id"], s["position"]["x"], s["position"]["y"], s["emotion"],
+                     int(s["drowsy"]), int(s["distracted"])) for s in students]
+            if not self._put(("students", rows)):
+                self.dropped += 1
+
+    def append_events(self, room, session, events, camera=""):
+        # Start/end events from VisionEngine (see events.py), only when there are any
+        if not events:
+            return
+        self.versions[(room, session)] = self.version(room, session) + 1
+        rows = [(room, session, e["ts"], camera, e["id"], e["type"], e["phase"]) for e in events]
+        if not self.running or not self._put(("events", rows)):
+            self.dropped += 1
+
+    def _write_loop(self):
+        conn = _connect(self.path)
+        try:
+            while True:
+                batch = self._next_batch()
+                if batch is None:
+                    break
+                self._write(conn, batch)
+        finally:
+            conn.close()
+
+    def _next_batch(self):
+        # Block for the first record, then gather more until the batch is full
+        # or the flush interval has passed.
+        item = self.queue.get()
+        if item is None:
+            return None
+        batch = [item]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                item = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if item is None:
+                self.queue.put_nowait(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _write(self, conn, batch):
+        sessions, frames, students, events = [], [], [], []
+        for kind, rows in batch:
+            if kind == "frame":
+                frames.append(rows)
+            elif kind == "students":
+                students.extend(rows)
+            elif kind == "events":
+                events.extend(rows)
+            else:
+                sessions.append(rows)
+        try:
+            with conn:
+                if sessions:
+                    conn.executemany("INSERT OR IGNORE INTO sessions VALUES (?, ?, ?)", sessions)
+                if frames:
+                    conn.executemany("INSERT INTO frames VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", frames)
+                if students:
+                    conn.executemany("INSERT INTO students (room, session, ts, camera, student_id, x, y, emotion, drowsy, distracted) "
+                                     "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", students)
+                if events:
+                    conn.executemany("INSERT INTO events (room, session, ts, camera, student_id, type, phase) "
+                                     "VALUES (?, ?, ?, ?, ?, ?, ?)", events)
+            self.written += len(frames)
+        except sqlite3.Error as e:
+            self.dropped += len(frames)
+            print(f"Session log write failed: {e}")
+
+    def _query(self, sql, params):
+        with self.read_lock:
+            return self.read_conn.execute(sql, params).fetchall()
+
+    def sessions(self, room=None):
+        if room is None:
+            rows = self._query("SELECT room, session, started FROM sessions ORDER BY started", ())
+        else:
+            rows = self._query("SELECT room, session, started FROM sessions WHERE room = ? ORDER BY started", (room,))
+        return [{"room": r[0], "session": r[1], "started": r[2]} for r in rows]
+
+    def frames(self, room, session, start=None, end=None, limit=None, sizes=False):
+        columns = "ts, engagement, total, distracted, drowsy" + (", width, height" if sizes else "")
+        sql = (f"SELECT {columns} FROM frames "
+               "WHERE room = ? AND session = ? AND ts >= ? AND ts <= ? ORDER BY ts")
+        params = [room, session, start if start is not None else 0.0, end if end is not None else float("inf")]
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return self._query(sql, params)
+
+    def students(self, room, session, start=None, end=None):
+        sql = ("SELECT ts, camera, student_id, x, y, emotion, drowsy, distracted FROM students "
+               "WHERE room = ? AND session = ? AND ts >= ? AND ts <= ? ORDER BY ts")
+        params = (room, session, start if start is not None else 0.0, end if end is not None else float("inf"))
+        return self._query(sql, params)
+
+    def events(self, room, session, start=None, end=None, student_id=None, camera=None):
+        sql = ("SELECT ts, camera, student_id, type, phase FROM events "
+               "WHERE room = ? AND session = ? AND ts >= ? AND ts <= ?")
+        params = [room, session, start if start is not None else 0.0, end if end is not None else float("inf")]
+        if camera is not None:
+            sql += " AND camera = ?"
+            params.append(camera)
+        if student_id is not None:
+            sql += " AND student_id = ?"
+            params.append(student_id)
+        return self._query(sql + " ORDER BY ts", params)
+
+    def pending(self):
+        return self.queue.qsize()
+
+    def close(self):
+        if not self.running:
+            return
+        self.running = False
+        self.queue.put(None)
+        self.writer.join(timeout=10)
+        self.read_conn.close()
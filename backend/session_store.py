@@ -0,0 +1,263 @@
+import time
+
+import numpy as np
+
+from heatmap import HeatmapAccumulator
+
+# Emotion labels are stored as small integer codes; unknown labels get the next code
+EMOTIONS = ["Neutral", "Happy", "Sad", "Angry", "Surprise", "Fear", "Disgust"]
+
+# Engagement below this counts as a distraction event (same rule as the interventions)
+DISTRACTION_THRESHOLD = 70
+
+
+class RingColumns:
+    """Columnar ring buffer, one NumPy array per column.
+
+    Arrays start at ``initial`` rows and double as rows arrive, up to
+    ``capacity``; from then on the oldest rows are overwritten. Short sessions
+    only pay for what they record.
+    """
+
+    def __init__(self, capacity, dtypes, initial=1024):
+        self.capacity = capacity
+        size = min(initial, capacity)
+        self.columns = {name: np.zeros(size, dtype=dtype) for name, dtype in dtypes.items()}
+        self.written = 0
+
+    def __len__(self):
+        return min(self.written, self.capacity)
+
+    @property
+    def allocated(self):
+        return len(next(iter(self.columns.values())))
+
+    def _reserve(self, n):
+        # Grow (before the first wrap) so the next n rows fit
+        needed = min(self.written + n, self.capacity)
+        if needed <= self.allocated:
+            return
+        size = min(max(needed, 2 * self.allocated), self.capacity)
+        for name, column in self.columns.items():
+            grown = np.zeros(size, dtype=column.dtype)
+            grown[:len(column)] = column
+            self.columns[name] = grown
+
+    def append(self, **values):
+        self._reserve(1)
+        i = self.written % self.capacity
+        for name, value in values.items():
+            self.columns[name][i] = value
+        self.written += 1
+
+    def extend(self, **values):
+        # Append n rows at once; only the last `capacity` rows are retained
+        n = len(next(iter(values.values())))
+        if n == 0:
+            return
+        self._reserve(n)
+        positions = (self.written + np.arange(n)) % self.capacity
+        for name, value in values.items():
+            self.columns[name][positions] = value
+        self.written += n
+
+    def column(self, name, last=None):
+        # Oldest to newest, copied out of the ring
+        size = len(self)
+        count = size if last is None else min(last, size)
+        end = self.written % self.capacity if self.written >= self.capacity else self.written
+        idx = (end - count + np.arange(count)) % self.capacity
+        return self.columns[name][idx]
+
+    @property
+    def nbytes(self):
+        return sum(c.nbytes for c in self.columns.values())
+
+
+class TimeBuckets:
+    """Per-interval sums for timeline charts, grown by doubling (tiny: one row
+    per bucket_seconds of session time)."""
+
+    FIELDS = ("frames", "engagement", "students", "distracted", "drowsy")
+
+    def __init__(self, bucket_seconds=10.0, initial=256):
+        self.bucket_seconds = bucket_seconds
+        self.sums = np.zeros((initial, len(self.FIELDS)), dtype=np.float64)
+        self.used = 0
+
+    def add(self, offset, engagement, students, distracted, drowsy):
+        i = max(0, int(offset // self.bucket_seconds))
+        if i >= len(self.sums):
+            grown = np.zeros((max(i + 1, 2 * len(self.sums)), len(self.FIELDS)), dtype=np.float64)
+            grown[:len(self.sums)] = self.sums
+            self.sums = grown
+        self.sums[i] += (1, engagement, students, distracted, drowsy)
+        self.used = max(self.used, i + 1)
+
+    def downsample(self, max_points):
+        """(times, columns) with at most max_points rows; O(bins)."""
+        sums = self.sums[:self.used]
+        group = max(1, -(-len(sums) // max_points))
+        pad = (-len(sums)) % group
+        if pad:
+            sums = np.vstack([sums, np.zeros((pad, sums.shape[1]))])
+        grouped = sums.reshape(-1, group, sums.shape[1]).sum(axis=1)
+        times = np.arange(len(grouped)) * group * self.bucket_seconds
+        return times, grouped
+
+    @property
+    def nbytes(self):
+        return self.sums.nbytes
+
+
+class SessionStore:
+    """In-memory session log with bounded memory and O(1) aggregates.
+
+    Per-frame rows (timestamp, engagement, counts) and per-student rows
+    (position, emotion code) are kept in ring buffers that grow on demand up to
+    a fixed capacity, so memory is bounded however long the session runs.
+    Running sums, counts, the emotion histogram, the attention heatmap and the
+    behavior event counts cover the whole session and are updated on every
+    record, which makes report queries independent of session length.
+    """
+
+    def __init__(self, frame_capacity=200_000, student_capacity=1_000_000):
+        self.frames = RingColumns(frame_capacity, {
+            "ts": np.float64,
+            "engagement": np.float32,
+            "total": np.uint16,
+            "distracted": np.uint16,
+            "drowsy": np.uint16,
+        })
+        self.students = RingColumns(student_capacity, {
+            "ts": np.float64,
+            "x": np.int32,
+            "y": np.int32,
+            "emotion": np.uint8,
+        })
+        self.emotion_codes = {name: code for code, name in enumerate(EMOTIONS)}
+        self.emotion_names = list(EMOTIONS)
+        self.emotion_hist = np.zeros(256, dtype=np.int64)
+
+        self.buckets = TimeBuckets()
+        self.heatmap = HeatmapAccumulator()
+        self.event_counts = {}
+
+        self.frame_count = 0
+        self.engagement_sum = 0.0
+        self.distraction_events = 0
+        self.started_at = None
+        self.version = 0
+
+    @classmethod
+    def from_log(cls, log, room, session, **kwargs):
+        # Rebuild the aggregates of a past session from the persistent SessionLog
+        store = cls(**kwargs)
+        by_ts = {}
+        for ts, _camera, student_id, x, y, emotion, drowsy, distracted in log.students(room, session):
+            by_ts.setdefault(ts, []).append({"id": student_id, "position": {"x": x, "y": y}, "emotion": emotion})
+        for ts, engagement, total, distracted, drowsy, width, height in log.frames(room, session, sizes=True):
+            store.record_frame(by_ts.get(ts, []), engagement, distracted, drowsy, ts=ts,
+                               frame_size=(width, height) if width and height else None)
+        store.record_events([{"type": kind, "phase": phase} for _, _, _, kind, phase in log.events(room, session)])
+        return store
+
+    def emotion_code(self, name):
+        code = self.emotion_codes.get(name)
+        if code is None:
+            code = len(self.emotion_names)
+            if code > 255:
+                code = 0  # Out of codes: fold into Neutral
+            else:
+                self.emotion_codes[name] = code
+                self.emotion_names.append(name)
+        return code
+
+    def record_frame(self, students, engagement, distracted, drowsy, ts=None, frame_size=None):
+        # frame_size: (width, height) the positions refer to; without it the
+        # frame is left out of the heatmap
+        ts = time.time() if ts is None else ts
+        if self.started_at is None:
+            self.started_at = ts
+        self.buckets.add(ts - self.started_at, engagement, len(students), distracted, drowsy)
+        self.frames.append(ts=ts, engagement=engagement, total=len(students),
+                           distracted=distracted, drowsy=drowsy)
+        self.frame_count += 1
+        self.engagement_sum += engagement
+        if engagement < DISTRACTION_THRESHOLD:
+            self.distraction_events += 1
+
+        if students:
+            codes = np.fromiter((self.emotion_code(s["emotion"]) for s in students), dtype=np.uint8,
+                                count=len(students))
+            self.students.extend(
+                ts=np.full(len(students), ts),
+                x=[s["position"]["x"] for s in students],
+                y=[s["position"]["y"] for s in students],
+                emotion=codes,
+            )
+            self.emotion_hist += np.bincount(codes, minlength=256)
+            if frame_size is not None:
+                self.heatmap.add([s["position"]["x"] for s in students], [s["position"]["y"] for s in students],
+                                 *frame_size, ts=ts)
+        self.version += 1
+
+    def record_events(self, events):
+        # Behavior events (see events.py); each start counts once
+        for event in events:
+            if event["phase"] == "start":
+                self.event_counts[event["type"]] = self.event_counts.get(event["type"], 0) + 1
+        self.version += 1
+
+    def behavior(self):
+        return {"left_seat": self.event_counts.get("left_seat", 0),
+                "looked_down": self.event_counts.get("looked_down", 0)}
+
+    def avg_engagement(self):
+        return self.engagement_sum / self.frame_count if self.frame_count else 0.0
+
+    def dominant_emotion(self):
+        if not self.emotion_hist.any():
+            return "N/A"
+        return self.emotion_names[int(np.argmax(self.emotion_hist))]
+
+    def emotion_counts(self):
+        return {name: int(self.emotion_hist[code]) for code, name in enumerate(self.emotion_names)
+                if self.emotion_hist[code]}
+
+    def engagement_timeline(self, max_points=120):
+        """Downsampled engagement and distracted/drowsy shares over the session.
+
+        Returns a dict of equal-length lists: minutes since start, average
+        engagement (%) and the share of students distracted and drowsy (%).
+        """
+        if self.started_at is None:
+            return {"minutes": [], "engagement": [], "distracted": [], "drowsy": []}
+        times, sums = self.buckets.downsample(max_points)
+        frames, engagement, students, distracted, drowsy = sums.T
+        keep = frames > 0
+        students = np.maximum(students, 1)
+        return {
+            "minutes": (times[keep] / 60.0).tolist(),
+            "engagement": (engagement[keep] / frames[keep]).tolist(),
+            "distracted": (100.0 * distracted[keep] / students[keep]).tolist(),
+            "drowsy": (100.0 * drowsy[keep] / students[keep]).tolist(),
+        }
+
+    def positions(self, last=None):
+        # (n, 2) int32 student positions, oldest first, from the retained window
+        return np.stack([self.students.column("x", last), self.students.column("y", last)], axis=1)
+
+    def summary(self):
+        return {
+            "frames": self.frame_count,
+            "avg_engagement": self.avg_engagement(),
+            "distraction_events": self.distraction_events,
+            "dominant_emotion": self.dominant_emotion(),
+            "emotions": self.emotion_counts(),
+        }
+
+    @property
+    def nbytes(self):
+        return (self.frames.nbytes + self.students.nbytes + self.emotion_hist.nbytes + self.buckets.nbytes
+                + self.heatmap.nbytes)
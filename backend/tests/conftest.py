@@ -0,0 +1,6 @@
+import os
+import sys
+
+# The backend modules import each other as top-level modules (uvicorn main:app
+# is started from backend/), so tests put backend/ on the path the same way.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
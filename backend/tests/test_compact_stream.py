@@ -0,0 +1,88 @@
+import random
+
+from compact_stream import CompactDecoder, CompactEncoder
+
+
+def student(student_id, x, y, ear=0.3, emotion="Neutral", drowsy=False, distracted=False, looking_at="Center"):
+    return {"id": student_id, "drowsy": drowsy, "ear": ear, "distracted": distracted, "looking_at": looking_at,
+            "emotion": emotion, "position": {"x": x, "y": y}}
+
+
+def response(students, seq, intervention=None, engagement=100.0):
+    return {
+        "students": students,
+        "stats": {"total": len(students), "distracted": sum(s["distracted"] for s in students),
+                  "drowsy": sum(s["drowsy"] for s in students), "engagement": engagement},
+        "intervention": intervention,
+        "frame": {"seq": seq, "dropped": 0},
+    }
+
+
+def test_snapshot_round_trip():
+    sent = [student(1, 100, 200, ear=0.25, emotion="Happy", drowsy=True, looking_at="Down"),
+            student(7, 640, 10, distracted=True, looking_at="Left")]
+    decoded = CompactDecoder().decode(CompactEncoder().encode(response(sent, 5, "Take a break"), now=0.0))
+    assert decoded["synced"] and decoded["frame"] == {"seq": 5, "dropped": 0, "snapshot": True}
+    assert decoded["students"] == sent
+    assert decoded["stats"] == {"total": 2, "distracted": 1, "drowsy": 1, "engagement": 100.0}
+    assert decoded["intervention"] == "Take a break"
+
+
+def test_deltas_track_the_stream_within_tolerance():
+    rng = random.Random(0)
+    encoder = CompactEncoder(snapshot_interval=1000, stats_interval=0.0, position_tolerance=2)
+    decoder = CompactDecoder()
+    students = {i: student(i, 300 + 10 * i, 200) for i in range(1, 6)}
+    for seq in range(200):
+        for s in students.values():
+            s["position"] = {"x": s["position"]["x"] + rng.randint(-1, 1), "y": s["position"]["y"] + rng.randint(-1, 1)}
+            s["ear"] = round(min(max(s["ear"] + rng.uniform(-0.02, 0.02), 0.05), 0.5), 2)
+            s["drowsy"] = rng.random() < 0.1
+        if seq == 50:
+            del students[3]
+        if seq == 120:
+            students[9] = student(9, 50, 60, emotion="Sad")
+        decoded = decoder.decode(encoder.encode(response(list(students.values()), seq), now=float(seq)))
+
+        by_id = {s["id"]: s for s in decoded["students"]}
+        assert sorted(by_id) == sorted(students)
+        for student_id, truth in students.items():
+            got = by_id[student_id]
+            assert got["drowsy"] == truth["drowsy"]
+            assert got["emotion"] == truth["emotion"]
+            assert abs(got["ear"] - truth["ear"]) <= 0.011
+            assert abs(got["position"]["x"] - truth["position"]["x"]) < 2
+            assert abs(got["position"]["y"] - truth["position"]["y"]) < 2
+        assert decoded["stats"]["total"] == len(students)
+
+
+def test_unchanged_frames_are_header_only_and_stats_are_rate_limited():
+    encoder = CompactEncoder(snapshot_interval=1000, stats_interval=1.0)
+    decoder = CompactDecoder()
+    sent = [student(1, 100, 100)]
+    first = encoder.encode(response(sent, 0), now=0.0)
+    decoder.decode(first)
+    quiet = encoder.encode(response(sent, 1), now=0.1)
+    assert len(quiet) < 20
+
+    decoded = decoder.decode(encoder.encode(response(sent, 2, engagement=50.0), now=0.2))
+    assert decoded["stats"]["engagement"] == 100.0
+    decoded = decoder.decode(encoder.encode(response(sent, 3, engagement=50.0), now=1.5))
+    assert decoded["stats"]["engagement"] == 50.0
+
+
+def test_intervention_is_cleared_and_snapshots_resync():
+    encoder = CompactEncoder(snapshot_interval=3)
+    late = CompactDecoder()
+    messages = [encoder.encode(response([student(1, 10, 10)], 0, "Stretch"), now=0.0),
+                encoder.encode(response([student(1, 10, 10)], 1), now=0.1),
+                encoder.encode(response([student(2, 30, 30)], 2), now=0.2),
+                encoder.encode(response([student(2, 30, 30)], 3), now=0.3)]
+    # A client that joins late is unsynced until the next snapshot
+    assert not late.decode(messages[2])["synced"]
+    decoded = late.decode(messages[3])
+    assert decoded["synced"] and [s["id"] for s in decoded["students"]] == [2]
+
+    decoder = CompactDecoder()
+    assert decoder.decode(messages[0])["intervention"] == "Stretch"
+    assert decoder.decode(messages[1])["intervention"] is None
@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+from emotion import EmotionCache, EmotionModel, FerEmotionModel, InlineEmotionWorker, StandInEmotionModel
+
+
+def test_inline_worker_labels_faces_in_the_same_frame():
+    worker = InlineEmotionWorker(StandInEmotionModel())
+    cache = EmotionCache(worker)
+    frame = np.full((120, 160, 3), 200, dtype=np.uint8)
+    boxes = np.array([[10, 10, 50, 50], [80, 20, 140, 90]])
+
+    cache.update(frame, [1, 2], boxes, now=0.0)
+    labels = cache.lookup([1, 2], now=0.0)
+    assert labels == StandInEmotionModel().predict(np.full((2, 32, 32, 3), 200, dtype=np.uint8))
+    assert worker.batches == 1 and worker.classified == 2
+
+    # Fresh labels are not classified again until the refresh interval passed
+    cache.update(frame, [1, 2], boxes, now=0.5)
+    assert worker.batches == 1
+
+
+def test_emotion_model_is_abstract():
+    with pytest.raises(TypeError):
+        EmotionModel()
+
+
+def test_fer_model_classifies_the_batch_in_one_call():
+    class Detector:
+        def __init__(self):
+            self.calls = []
+
+        def _classify_emotions(self, gray_faces):
+            self.calls.append(gray_faces)
+            scores = np.zeros((len(gray_faces), 7))
+            scores[0, 3] = 1.0  # happy
+            scores[1, 5] = 1.0  # surprise
+            return scores
+
+    model = FerEmotionModel.__new__(FerEmotionModel)
+    model.detector = Detector()
+    model.labels = ["Angry", "Disgust", "Fear", "Happy", "Sad", "Surprise", "Neutral"]
+    crops = np.zeros((2, 64, 64, 3), dtype=np.uint8)
+    crops[1] = 255
+
+    assert model.predict(crops) == ["Happy", "Surprise"]
+    (batch,) = model.detector.calls
+    assert batch.shape == (2, 64, 64)
+    assert np.allclose(batch[0], -1.0) and np.allclose(batch[1], 1.0)
+    assert model.predict(crops[:0]) == []
@@ -0,0 +1,42 @@
+from engine_registry import EngineRegistry
+from events import EventEngine
+
+
+class StubEngine:
+    face_mesh = None
+
+    def __init__(self):
+        self.event_engine = EventEngine()
+
+    def start_session(self):
+        self.event_engine.reset()
+
+
+class StubRegistry(EngineRegistry):
+    def _create(self):
+        self.created += 1
+        return StubEngine()
+
+
+def test_counters_restart_when_a_camera_joins_another_session():
+    registry = StubRegistry()
+    engine = registry.acquire("cam", session="monday")
+    engine.event_engine.counts["left_seat"] = 3
+    registry.release("cam")
+
+    # Reconnecting to the same session keeps the counters
+    assert registry.acquire("cam", session="monday") is engine
+    assert engine.event_engine.counts["left_seat"] == 3
+    registry.release("cam")
+
+    assert registry.acquire("cam", session="tuesday") is engine
+    assert engine.event_engine.counts["left_seat"] == 0
+    assert registry.created == 1
+
+
+def test_evicted_engines_forget_their_session():
+    registry = StubRegistry(ttl=1.0)
+    registry.acquire("cam", session="monday", now=0.0)
+    registry.release("cam", now=0.0)
+    registry.evict(now=5.0)
+    assert "cam" not in registry.sessions
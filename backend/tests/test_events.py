@@ -0,0 +1,116 @@
+import numpy as np
+
+from events import EventEngine
+
+SEAT_A = [100, 100, 200, 220]
+SEAT_B = [400, 100, 500, 220]
+
+
+class Scene:
+    """Drives an EventEngine the way VisionEngine does, with hand-made tracks."""
+
+    def __init__(self, **options):
+        self.engine = EventEngine(capacity=8, **options)
+        self.active = np.zeros(8, dtype=bool)
+        self.ts = 0.0
+        self.events = []
+
+    def frame(self, faces=(), dt=0.1, gone=()):
+        # faces: (slot, id, box, ear, pitch, yaw); gone: slots the tracker dropped
+        self.ts += dt
+        self.active[list(gone)] = False
+        for face in faces:
+            self.active[face[0]] = True
+        columns = list(zip(*faces)) if faces else [[]] * 6
+        slots, ids, boxes, ears, pitch, yaw = columns
+        events = self.engine.update(self.ts, list(ids), list(slots), list(ears), list(pitch), list(yaw),
+                                    self.active.copy(), np.array(boxes, dtype=np.float32).reshape(-1, 4))
+        self.events.extend(events)
+        return [(e["type"], e["id"], e["phase"]) for e in events]
+
+
+def face(slot=0, student_id=1, box=SEAT_A, ear=0.3, pitch=0.0, yaw=0.0):
+    return slot, student_id, box, ear, pitch, yaw
+
+
+def test_drowsy_starts_after_the_debounce_and_ends_after_recovery():
+    scene = Scene()
+    events = [scene.frame([face(ear=0.1)]) for _ in range(30)]
+    assert [i for i, e in enumerate(events) if ("drowsy", 1, "start") in e] == [19]
+    assert scene.engine.states([0])[0][0]
+
+    events = [scene.frame([face(ear=0.35)]) for _ in range(20)]
+    ended = [i for i, e in enumerate(events) if ("drowsy", 1, "end") in e]
+    # The EMA needs a few frames to clear the threshold plus hysteresis, then 5 frames
+    assert len(ended) == 1 and 5 <= ended[0] < 12
+    assert not scene.engine.states([0])[0][0]
+
+
+def test_looked_down_is_debounced():
+    scene = Scene()
+    events = [scene.frame([face(pitch=-40.0)]) for _ in range(15)]
+    looked_down = [i for i, e in enumerate(events) if ("looked_down", 1, "start") in e]
+    # The first frame initializes the EMA below the threshold; it still takes 10 frames
+    assert looked_down == [9]
+    # A single frame looking down does not count
+    scene = Scene()
+    scene.frame([face(pitch=-40.0)])
+    assert all(("looked_down", 1, "start") not in scene.frame([face(pitch=0.0)]) for _ in range(15))
+
+
+def test_left_seat_while_the_tracker_holds_the_track():
+    scene = Scene()
+    scene.frame([face()])
+    assert scene.frame([], dt=2.9) == []
+    assert scene.frame([], dt=0.2) == [("left_seat", 1, "start")]
+    assert scene.frame([face()]) == [("left_seat", 1, "end")]
+    assert scene.engine.counts["left_seat"] == 1
+
+
+def test_reidentified_student_does_not_count_as_left():
+    # The tracker drops track 1 and the same face comes back as track 2
+    scene = Scene()
+    scene.frame([face()])
+    scene.frame([face(slot=1, student_id=2, box=[105, 100, 205, 220])], gone=[0])
+    for _ in range(50):
+        assert scene.frame([face(slot=1, student_id=2, box=[105, 100, 205, 220])]) == []
+    assert scene.engine.counts["left_seat"] == 0
+    assert scene.engine.departed == {}
+
+
+def test_new_track_in_an_empty_seat_ends_the_absence():
+    scene = Scene()
+    scene.frame([face()])
+    scene.frame([], gone=[0])
+    assert scene.frame([], dt=3.5) == [("left_seat", 1, "start")]
+    assert scene.frame([], dt=10.0) == []
+    assert scene.frame([face(slot=0, student_id=7)]) == [("left_seat", 1, "end")]
+    assert scene.engine.departed == {}
+
+
+def test_someone_elsewhere_does_not_keep_the_seat():
+    scene = Scene()
+    scene.frame([face(), face(slot=1, student_id=2, box=SEAT_B)])
+    scene.frame([face(slot=1, student_id=2, box=SEAT_B)], gone=[0])
+    assert scene.frame([face(slot=1, student_id=2, box=SEAT_B)], dt=3.5) == [("left_seat", 1, "start")]
+    # A new student in another seat does not end it either
+    assert scene.frame([face(slot=1, student_id=2, box=SEAT_B),
+                        face(slot=2, student_id=3, box=[700, 100, 800, 220])]) == []
+
+
+def test_dropped_track_closes_its_open_states():
+    scene = Scene()
+    for _ in range(15):
+        scene.frame([face(pitch=-40.0)])
+    assert ("looked_down", 1, "end") in scene.frame([], gone=[0])
+
+
+def test_reset_forgets_tracks_and_counts():
+    scene = Scene()
+    scene.frame([face()])
+    scene.frame([], dt=4.0)
+    assert scene.engine.counts["left_seat"] == 1
+    scene.engine.reset()
+    assert scene.engine.counts["left_seat"] == 0
+    scene.active[:] = False
+    assert scene.frame([], dt=4.0) == []
@@ -0,0 +1,59 @@
+import numpy as np
+
+from face_tracker import FaceTracker, box_iou
+
+FACES = np.array([[100, 100, 200, 220], [400, 120, 480, 210]], dtype=np.float32)
+
+
+def test_ids_persist_and_follow_motion():
+    tracker = FaceTracker()
+    ids, _ = tracker.update(FACES)
+    moved, _ = tracker.update((FACES + 8)[::-1])
+    assert ids.tolist() == [1, 2]
+    assert moved.tolist() == [2, 1]
+
+
+def test_ids_persist_across_a_scale_change():
+    tracker = FaceTracker()
+    ids, _ = tracker.update(FACES, (1280, 720))
+    # The client switches to a quarter of the resolution
+    smaller, _ = tracker.update(FACES / 4, (320, 180))
+    larger, _ = tracker.update(FACES / 2, (640, 360))
+    assert smaller.tolist() == ids.tolist()
+    assert larger.tolist() == ids.tolist()
+    assert not tracker.births
+
+
+def test_ids_survive_a_detection_gap():
+    tracker = FaceTracker(max_misses=15)
+    ids, _ = tracker.update(FACES)
+    for _ in range(15):
+        tracker.update(np.empty((0, 4)))
+    back, _ = tracker.update(FACES)
+    assert back.tolist() == ids.tolist()
+
+
+def test_tracks_die_after_max_misses():
+    tracker = FaceTracker(max_misses=3)
+    tracker.update(FACES[:1])
+    for _ in range(4):
+        tracker.update(np.empty((0, 4)))
+    assert tracker.deaths == [1]
+    assert tracker.live_ids == []
+    ids, _ = tracker.update(FACES[:1])
+    assert ids.tolist() == [2]
+
+
+def test_capacity_grows():
+    tracker = FaceTracker(capacity=2)
+    boxes = np.array([[i * 50, 0, i * 50 + 40, 40] for i in range(5)], dtype=np.float32)
+    ids, slots = tracker.update(boxes)
+    assert ids.tolist() == [1, 2, 3, 4, 5]
+    assert tracker.capacity >= 5
+    assert len(set(slots.tolist())) == 5
+
+
+def test_box_iou():
+    a = np.array([[0, 0, 10, 10]], dtype=np.float32)
+    b = np.array([[0, 0, 10, 10], [5, 0, 15, 10], [20, 20, 30, 30]], dtype=np.float32)
+    assert np.allclose(box_iou(a, b), [[1.0, 1 / 3, 0.0]])
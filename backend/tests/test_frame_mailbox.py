@@ -0,0 +1,50 @@
+import asyncio
+
+from frame_mailbox import LatestMailbox
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_newer_item_overwrites_and_counts_a_drop():
+    async def scenario():
+        mailbox = LatestMailbox()
+        for i in range(3):
+            mailbox.put(i)
+        return await mailbox.get(), mailbox.received, mailbox.dropped
+
+    assert run(scenario()) == (2, 3, 2)
+
+
+def test_get_waits_for_the_next_put():
+    async def scenario():
+        mailbox = LatestMailbox()
+        getter = asyncio.create_task(mailbox.get())
+        await asyncio.sleep(0)
+        assert not getter.done()
+        mailbox.put("frame")
+        return await getter, mailbox.dropped
+
+    assert run(scenario()) == ("frame", 0)
+
+
+def test_close_drains_then_returns_none():
+    async def scenario():
+        mailbox = LatestMailbox()
+        mailbox.put("last")
+        mailbox.close()
+        return await mailbox.get(), await mailbox.get()
+
+    assert run(scenario()) == ("last", None)
+
+
+def test_close_wakes_a_waiting_getter():
+    async def scenario():
+        mailbox = LatestMailbox()
+        getter = asyncio.create_task(mailbox.get())
+        await asyncio.sleep(0)
+        mailbox.close()
+        return await asyncio.wait_for(getter, 1)
+
+    assert run(scenario()) is None
@@ -0,0 +1,56 @@
+import base64
+
+import cv2
+import numpy as np
+import pytest
+
+from frame_protocol import FrameDecoder, choose_decode_scale, image_width, pack_frame
+
+
+def encode(width, height=None, ext=".jpg"):
+    height = height or width * 9 // 16
+    image = np.full((height, width, 3), 128, dtype=np.uint8)
+    ok, buf = cv2.imencode(ext, image)
+    assert ok
+    return buf.tobytes()
+
+
+@pytest.mark.parametrize("ext", [".jpg", ".png", ".webp"])
+def test_image_width_reads_header(ext):
+    assert image_width(encode(1280, ext=ext)) == 1280
+    assert image_width(encode(333, ext=ext)) == 333
+
+
+def test_image_width_unknown_payload():
+    assert image_width(b"not an image") is None
+    assert image_width(b"") is None
+
+
+def test_first_frame_uses_reduced_scale():
+    decoder = FrameDecoder(min_width=320)
+    frames = [decoder.decode_binary(pack_frame(encode(1280), seq)) for seq in range(3)]
+    assert [f.scale for f in frames] == [4, 4, 4]
+    assert {f.image.shape[1] for f in frames} == {320}
+
+
+def test_scale_follows_resolution_changes():
+    decoder = FrameDecoder(min_width=320)
+    for width in (1280, 512, 320, 960, 640, 1920):
+        frame = decoder.decode_binary(pack_frame(encode(width), 0))
+        assert frame.scale == choose_decode_scale(width, 320)
+        assert frame.image.shape[1] * frame.scale == width
+        assert frame.image.shape[1] >= 320
+
+
+def test_client_scale_is_respected():
+    frame = FrameDecoder(min_width=320).decode_binary(pack_frame(encode(1280), 0, scale=2))
+    assert frame.scale == 2
+    assert frame.image.shape[1] == 640
+
+
+def test_text_frames_use_header_width():
+    decoder = FrameDecoder(min_width=320)
+    data_url = "data:image/jpeg;base64," + base64.b64encode(encode(1280)).decode()
+    frame = decoder.decode_text(data_url)
+    assert frame.scale == 4
+    assert frame.image.shape[1] == 320
@@ -0,0 +1,45 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+from head_pose import POSE_INDICES, HeadPoseSolver
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "benchmarks"))
+from bench_head_pose import load_face, make_sequences, upright_mesh  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def face():
+    # FaceMesh landmarks of a real, roughly frontal face
+    return load_face()
+
+
+@pytest.mark.parametrize("mode", HeadPoseSolver.MODES)
+def test_frontal_face_is_level(face, mode):
+    points, w, h = face
+    pitch, yaw = HeadPoseSolver(mode=mode).solve(points[None], POSE_INDICES, w, h)
+    # Inside VisionEngine's distracted limits (15 degrees pitch, 20 yaw)
+    assert abs(pitch[0]) < 15
+    assert abs(yaw[0]) < 20
+
+
+def test_modes_agree_on_a_real_face(face):
+    points, w, h = face
+    pnp = HeadPoseSolver(mode="pnp").solve(points[None], POSE_INDICES, w, h)
+    fast = HeadPoseSolver(mode="fast").solve(points[None], POSE_INDICES, w, h)
+    assert abs(pnp[0][0] - fast[0][0]) < 5
+    assert abs(pnp[1][0] - fast[1][0]) < 5
+
+
+@pytest.mark.parametrize("mode", HeadPoseSolver.MODES)
+def test_rotated_real_mesh(face, mode):
+    mesh = upright_mesh(*face)
+    points, truth = make_sequences(mesh, faces=10, frames=20, w=1280, h=720, noise_px=1.0, seed=1)
+    solver = HeadPoseSolver(mode=mode)
+    errors = []
+    for t in range(len(points)):
+        pitch, yaw = solver.solve(points[t], POSE_INDICES, 1280, 720)
+        errors.append(np.abs(np.stack([pitch, yaw], axis=1) - truth[t]))
+    assert np.percentile(errors, 95) < 3
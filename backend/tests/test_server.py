@@ -0,0 +1,113 @@
+import functools
+import importlib
+import os
+import time
+
+import cv2
+import numpy as np
+import pytest
+
+from capture_control import CAPTURE_LEVELS, CaptureController
+from frame_protocol import FrameDecoder, choose_decode_scale, pack_frame
+from landmarks import MIN_INPUT_WIDTH
+
+fastapi_testclient = pytest.importorskip("fastapi.testclient")
+
+
+@pytest.fixture(scope="module")
+def client(tmp_path_factory):
+    # Engines on a thread in the server process, session log in a temp dir
+    os.environ["INSIGHT_WORKERS"] = "0"
+    os.environ["INSIGHT_DB"] = str(tmp_path_factory.mktemp("server") / "sessions.db")
+    main = importlib.import_module("main")
+    with fastapi_testclient.TestClient(main.app) as client:
+        client.main = main
+        yield client
+
+
+def wait_for(condition, timeout=5.0):
+    # The server side of a closed websocket finishes on the test client's loop thread
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_unknown_heatmap_room_is_404(client):
+    assert client.get("/heatmap/nowhere").status_code == 404
+    assert "nowhere" not in client.main.heatmaps
+
+
+def test_stats_of_a_past_session_are_rebuilt(client):
+    assert client.get("/stats", params={"room": "nowhere", "session": "s"}).json()["frames"] == 0
+
+
+def test_metrics(client):
+    if client.main.metrics is None:
+        pytest.skip("metrics disabled")
+    assert "insight_state" in client.get("/metrics").text
+
+
+def test_teacher_subscription_is_removed_on_disconnect(client):
+    with client.websocket_connect("/ws/teacher?room=teachers") as ws:
+        assert "total" in ws.receive_json()
+        assert client.main.room_channel.subscriber_count == 1
+    wait_for(lambda: client.main.room_channel.subscriber_count == 0)
+
+
+def test_client_following_capture_hints_keeps_decoding_the_minimum_width(client, monkeypatch):
+    # Every frame is over a tiny budget, so each answer steps the capture level
+    # down; the client re-picks its decode scale for every hinted width
+    decoded_widths = []
+
+    class RecordingDecoder(FrameDecoder):
+        def decode_binary(self, data):
+            frame = super().decode_binary(data)
+            decoded_widths.append(frame.image.shape[1])
+            return frame
+
+    monkeypatch.setattr(client.main, "FrameDecoder", RecordingDecoder)
+    monkeypatch.setattr(client.main, "CaptureController",
+                        functools.partial(CaptureController, interval=0.0, min_samples=1))
+    monkeypatch.setattr(client.main, "LATENCY_BUDGET_MS", 0.001)
+
+    sent_widths = []
+    with client.websocket_connect("/ws?room=control&control=1") as ws:
+        hint = ws.receive_json()["control"]
+        for seq in range(len(CAPTURE_LEVELS)):
+            width = hint["width"]
+            ok, jpeg = cv2.imencode(".jpg", np.full((width * 3 // 4, width, 3), 128, dtype=np.uint8),
+                                    [cv2.IMWRITE_JPEG_QUALITY, int(hint["quality"] * 100)])
+            scale = choose_decode_scale(width, MIN_INPUT_WIDTH)
+            ws.send_bytes(pack_frame(jpeg.tobytes(), seq, scale=scale))
+            assert ws.receive_json()["frame"]["scale"] == scale
+            sent_widths.append(width)
+            if seq < len(CAPTURE_LEVELS) - 1:
+                hint = ws.receive_json()["control"]
+
+    assert sent_widths == [width for width, _ in CAPTURE_LEVELS]
+    assert decoded_widths == [width // choose_decode_scale(width, MIN_INPUT_WIDTH) for width in sent_widths]
+    assert min(decoded_widths) >= MIN_INPUT_WIDTH
+
+
+def test_camera_shared_by_overlapping_connections_stays_assigned(client, monkeypatch):
+    # A reconnect that opens before the old socket closed: closing the old
+    # one must not take the camera away from the new one
+    from worker_pool import InferencePool
+
+    pool = InferencePool(num_workers=1, slots_per_worker=2)
+    client.portal.call(pool.start)
+    try:
+        client.portal.call(pool.wait_ready)
+        monkeypatch.setattr(client.main, "inference_pool", pool)
+        ok, jpeg = cv2.imencode(".jpg", np.full((240, 320, 3), 128, dtype=np.uint8))
+        with client.websocket_connect("/ws?room=shared&camera=cam1") as survivor:
+            with client.websocket_connect("/ws?room=shared&camera=cam1") as old:
+                old.send_bytes(pack_frame(jpeg.tobytes(), 0))
+                assert old.receive_json()["frame"]["seq"] == 0
+            wait_for(lambda: client.main.session_connections.get(("shared", "default")) == 1)
+            survivor.send_bytes(pack_frame(jpeg.tobytes(), 1))
+            assert survivor.receive_json()["frame"]["seq"] == 1
+        wait_for(lambda: ("shared", "cam1") not in pool.assignments)
+    finally:
+        client.portal.call(pool.stop)
@@ -0,0 +1,48 @@
+import sqlite3
+
+from session_log import SessionLog
+
+
+def student(student_id):
+    return {"id": student_id, "position": {"x": 10, "y": 20}, "emotion": "Happy", "drowsy": False, "distracted": True}
+
+
+def test_rows_are_namespaced_by_camera(tmp_path):
+    log = SessionLog(str(tmp_path / "log.db"), flush_interval=0.01)
+    log.append_frame("r", "s", 1.0, 50.0, 1, 0, [student(1)], camera="front")
+    log.append_frame("r", "s", 1.0, 50.0, 1, 0, [student(1)], camera="back")
+    log.append_events("r", "s", [{"ts": 1.0, "id": 1, "type": "distracted", "phase": "start"}], camera="front")
+    log.append_events("r", "s", [{"ts": 1.5, "id": 1, "type": "distracted", "phase": "start"}], camera="back")
+    log.close()
+
+    log = SessionLog(str(tmp_path / "log.db"))
+    assert sorted(row[1] for row in log.students("r", "s")) == ["back", "front"]
+    assert log.events("r", "s", camera="back") == [(1.5, "back", 1, "distracted", "start")]
+    log.close()
+
+
+def test_full_queue_drops_and_counts(tmp_path):
+    log = SessionLog(str(tmp_path / "log.db"), max_pending=3)
+    # Stop the writer so nothing drains the queue
+    log.close()
+    log.running = True
+    for i in range(5):
+        log.append_frame("r", "s", float(i), 50.0, 0, 0, [], camera="front")
+    # The session record and the first two frames fit
+    assert log.pending() == 3
+    assert log.dropped == 3
+
+
+def test_old_logs_are_migrated(tmp_path):
+    path = str(tmp_path / "old.db")
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE events (room TEXT NOT NULL, session TEXT NOT NULL, ts REAL NOT NULL, "
+                     "student_id INTEGER NOT NULL, type TEXT NOT NULL, phase TEXT NOT NULL)")
+        conn.execute("INSERT INTO events VALUES ('r', 's', 1.0, 7, 'drowsy', 'start')")
+    log = SessionLog(path, flush_interval=0.01)
+    log.append_events("r", "s", [{"ts": 2.0, "id": 7, "type": "drowsy", "phase": "end"}], camera="front")
+    log.close()
+
+    log = SessionLog(path)
+    assert log.events("r", "s") == [(1.0, "", 7, "drowsy", "start"), (2.0, "front", 7, "drowsy", "end")]
+    log.close()
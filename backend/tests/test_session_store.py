@@ -0,0 +1,46 @@
+import numpy as np
+
+from session_store import RingColumns, SessionStore
+
+
+def test_ring_grows_on_demand_up_to_capacity():
+    ring = RingColumns(10, {"a": np.int64}, initial=2)
+    assert ring.allocated == 2
+    for i in range(5):
+        ring.append(a=i)
+    assert ring.allocated == 8
+    assert ring.column("a").tolist() == [0, 1, 2, 3, 4]
+
+    ring.extend(a=np.arange(5, 30))
+    assert ring.allocated == 10
+    assert ring.column("a").tolist() == list(range(20, 30))
+    assert ring.column("a", 3).tolist() == [27, 28, 29]
+
+
+def test_new_store_is_small():
+    store = SessionStore()
+    assert store.nbytes < 1_000_000
+    for i in range(50):
+        store.record_frame([{"id": i, "position": {"x": i, "y": i}, "emotion": "Happy"}], 0.5, 0, 0, ts=1000.0 + i)
+    assert store.summary()["frames"] == 50
+    assert store.summary()["dominant_emotion"] == "Happy"
+
+
+def test_rebuilt_store_has_the_sessions_heatmap_and_behavior(tmp_path):
+    from session_log import SessionLog
+
+    log = SessionLog(str(tmp_path / "log.db"), flush_interval=0.01)
+    students = [{"id": 1, "position": {"x": 600, "y": 10}, "emotion": "Happy", "drowsy": False, "distracted": False}]
+    log.append_frame("r", "a", 1.0, 100.0, 0, 0, students, camera="c", frame_size=(640, 480))
+    log.append_events("r", "a", [{"ts": 1.0, "id": 1, "type": "left_seat", "phase": "start"},
+                                 {"ts": 2.0, "id": 1, "type": "left_seat", "phase": "end"}], camera="c")
+    log.append_frame("r", "b", 1.0, 100.0, 0, 0, students, camera="c", frame_size=(640, 480))
+    assert log.version("r", "a") == 2 and log.version("r", "b") == 1
+    log.close()
+
+    log = SessionLog(str(tmp_path / "log.db"))
+    store = SessionStore.from_log(log, "r", "a")
+    log.close()
+    assert store.behavior() == {"left_seat": 1, "looked_down": 0}
+    assert store.heatmap.total == 1
+    assert store.heatmap.grid[1, 60] == 1
@@ -0,0 +1,30 @@
+import numpy as np
+
+from worker_pool import DEFAULT_SLOT_BYTES, SharedFrameRing, fit_frame, scale_positions
+
+
+def test_oversized_frame_is_downscaled_to_fit_a_slot():
+    frame = np.zeros((1440, 2560, 3), dtype=np.uint8)
+    fitted, factor = fit_frame(frame, DEFAULT_SLOT_BYTES)
+    assert fitted.nbytes <= DEFAULT_SLOT_BYTES
+    assert abs(fitted.shape[1] / fitted.shape[0] - 2560 / 1440) < 0.01
+    assert abs(fitted.shape[1] * factor - 2560) < 1e-6
+
+    ring = SharedFrameRing(1, DEFAULT_SLOT_BYTES)
+    try:
+        ring.write(0, fitted)
+    finally:
+        ring.close()
+
+
+def test_frames_that_fit_are_untouched():
+    frame = np.zeros((1080, 1920, 3), dtype=np.uint8)
+    fitted, factor = fit_frame(frame, DEFAULT_SLOT_BYTES)
+    assert fitted is frame
+    assert factor == 1.0
+
+
+def test_positions_are_mapped_back():
+    students = [{"id": 1, "position": {"x": 100, "y": 50}}]
+    scale_positions(students, 2.0)
+    assert students[0]["position"] == {"x": 200, "y": 100}
@@ -1,17 +1,38 @@
 import cv2
 import mediapipe as mp
 import numpy as np
-from math import hypot
 import time
+from landmarks import (LEFT_EYE, RIGHT_EYE, MIN_INPUT_WIDTH, landmarks_to_array, to_pixels, average_ear,
+                       gaze_direction, heatmap_points)
+from head_pose import GENERIC_FACE_3D, POSE_INDICES, HeadPoseSolver
+from face_tracker import FaceTracker, landmark_boxes
+from keyframes import KeyframeScheduler
+from events import EventEngine
+from emotion import EmotionCache, shared_emotion_worker
+from face_crops import MultiFacePipeline, shared_crop_mesher
 
 class VisionEngine:
-    def __init__(self):
+    MIN_INPUT_WIDTH = MIN_INPUT_WIDTH
+
+    def __init__(self, pose_mode="pnp", keyframe_interval=4, cpu_budget_ms=None, timed=False, face_mesh=None,
+                 multi_face=False, mesh_threads=None, detect_interval=10, emotion_model=None,
+                 emotion_inline=False):
         self.mp_face_mesh = mp.solutions.face_mesh
-        self.face_mesh = self.mp_face_mesh.FaceMesh(
-            min_detection_confidence=0.5,
-            min_tracking_confidence=0.5,
-            refine_landmarks=True
-        )
+        # multi_face: detect faces on a downscaled frame and run FaceMesh on
+        # per-face crops (face_crops.py) instead of one full-frame pass, which
+        # only finds a single face
+        self.crops = None
+        if multi_face:
+            self.crops = MultiFacePipeline(shared_crop_mesher(threads=mesh_threads),
+                                           detect_interval=detect_interval)
+            self.face_mesh = face_mesh
+        else:
+            # face_mesh: an existing FaceMesh to reuse (see engine_registry.FaceMeshPool)
+            self.face_mesh = face_mesh or self.mp_face_mesh.FaceMesh(
+                min_detection_confidence=0.5,
+                min_tracking_confidence=0.5,
+                refine_landmarks=True
+            )
         self.mp_drawing = mp.solutions.drawing_utils
         self.drawing_spec = self.mp_drawing.DrawingSpec(thickness=1, circle_radius=1)
 
@@ -19,177 +40,171 @@ class VisionEngine:
         self.EAR_THRESHOLD = 0.25
         self.CONSECUTIVE_FRAMES = 20
         
-        # 3D Model Points for Head Pose (approximate generic face)
-        self.face_3d = np.array([
-            [0.0, 0.0, 0.0],            # Nose tip
-            [0.0, -330.0, -65.0],       # Chin
-            [-225.0, 170.0, -135.0],    # Left eye left corner
-            [225.0, 170.0, -135.0],     # Right eye right corner
-            [-150.0, -150.0, -125.0],   # Left Mouth corner
-            [150.0, -150.0, -125.0]     # Right mouth corner
-        ], dtype=np.float64)
-
-        # Indices for landmarks corresponding to the 3D points
-        self.nose_idx = 1
-        self.chin_idx = 199
-        self.left_eye_left_idx = 33
-        self.right_eye_right_idx = 263
-        self.left_mouth_idx = 61
-        self.right_mouth_idx = 291
-        
-        # Eye indices for EAR
-        self.LEFT_EYE = [362, 385, 387, 263, 373, 380]
-        self.RIGHT_EYE = [33, 160, 158, 133, 153, 144]
-
-        # Emotion model (Temporarily disabled to fix dependency conflicts)
-        self.has_emotion_model = False
-        # try:
-        #      from fer import FER
-        #      self.emotion_detector = FER(mtcnn=True)
-        #      self.has_emotion_model = True
-        # except ImportError:
-        #      print("FER library not found. Running without advanced emotion detection.")
-        #      self.has_emotion_model = False
-
-        self.frame_count = 0
-        self.last_emotion = "Neutral"
-
-        # Behavioral Counters
-        self.leaving_seat_count = 0
-        self.looking_down_count = 0
-        
-        # State tracking for behaviors
-        self.last_face_seen_time = time.time()
-        self.is_seat_empty = False
-        self.is_looking_down = False
-
-    def calculate_ear(self, landmarks, eye_indices, w, h):
-        # Extract coordinates
-        coords = []
-        for idx in eye_indices:
-            lm = landmarks[idx]
-            coords.append((int(lm.x * w), int(lm.y * h)))
-        
-        # Vertical distances
-        v1 = hypot(coords[1][0] - coords[5][0], coords[1][1] - coords[5][1])
-        v2 = hypot(coords[2][0] - coords[4][0], coords[2][1] - coords[4][1])
-        
-        # Horizontal distance
-        h_dist = hypot(coords[0][0] - coords[3][0], coords[0][1] - coords[3][1])
-        
-        if h_dist == 0: return 0
-        ear = (v1 + v2) / (2.0 * h_dist)
-        return ear
-
-    def get_head_pose(self, landmarks, w, h):
-        face_2d = []
-        for idx in [self.nose_idx, self.chin_idx, self.left_eye_left_idx, self.right_eye_right_idx, self.left_mouth_idx, self.right_mouth_idx]:
-            lm = landmarks[idx]
-            x, y = int(lm.x * w), int(lm.y * h)
-            face_2d.append([x, y])
-            
-        face_2d = np.array(face_2d, dtype=np.float64)
-        focal_length = 1 * w
-        cam_matrix = np.array([ [focal_length, 0, w / 2],
-                                [0, focal_length, h / 2],
-                                [0, 0, 1]])
-        dist_matrix = np.zeros((4, 1), dtype=np.float64)
-
-        success, rot_vec, trans_vec = cv2.solvePnP(self.face_3d, face_2d, cam_matrix, dist_matrix)
-        
-        if not success:
-            return None
+        # 3D Model Points for Head Pose (FaceMesh geometry) and their landmarks
+        self.face_3d = GENERIC_FACE_3D
+        self.pose_indices = POSE_INDICES
 
-        rmat, jac = cv2.Rodrigues(rot_vec)
-        angles, mtxR, mtxQ, Qx, Qy, Qz = cv2.RQDecomp3x3(rmat)
+        # "pnp" (SQPnP) or "fast" (closed-form from landmark geometry)
+        self.pose_solver = HeadPoseSolver(self.face_3d, mode=pose_mode)
 
-        x_angle = angles[0] * 360
-        y_angle = angles[1] * 360
-        
-        return x_angle, y_angle
+        # Persistent student IDs across frames
+        self.tracker = FaceTracker()
 
-    def process_frame(self, frame):
-        # Frame is assumed to be a numpy array (BGR)
-        h, w, c = frame.shape
+        # FaceMesh runs on keyframes only; landmarks are propagated with optical
+        # flow in between (keyframe_interval=1 runs FaceMesh on every frame)
+        self.scheduler = KeyframeScheduler(max_interval=keyframe_interval, cpu_budget_ms=cpu_budget_ms)
+        
+        # Eye indices for EAR
+        self.LEFT_EYE = LEFT_EYE
+        self.RIGHT_EYE = RIGHT_EYE
+
+        # Emotion model ("standin", "fer" or None): classified in the background
+        # on face crops, process_frame only reads the cached labels.
+        # emotion_inline classifies in process_frame instead (offline analysis)
+        worker = shared_emotion_worker(emotion_model, inline=emotion_inline) if emotion_model else None
+        self.emotions = EmotionCache(worker) if worker is not None else None
+
+        # Per-stage milliseconds of the last frame, only collected when timed
+        self.timings = {} if timed else None
+
+        # Per-track drowsy/distracted/looked down/left seat states, smoothed
+        # and debounced; events holds the start/end events of the last frame
+        self.event_engine = EventEngine(ear_threshold=self.EAR_THRESHOLD, drowsy_frames=self.CONSECUTIVE_FRAMES,
+                                        capacity=self.tracker.capacity)
+        self.events = []
+
+    # Behavioral Counters
+    @property
+    def leaving_seat_count(self):
+        return self.event_engine.counts["left_seat"]
+
+    @property
+    def looking_down_count(self):
+        return self.event_engine.counts["looked_down"]
+
+    def start_session(self):
+        # The camera moved on to a new session: behavior states and counters
+        # start over, the tracker keeps its student IDs
+        self.event_engine.reset()
+        self.events = []
+
+    def _lap(self, stage, start):
+        # Records the time since start under stage and returns the new start
+        now = time.perf_counter()
+        self.timings[stage] = (now - start) * 1000.0
+        return now
+
+    def detect_landmarks(self, frame):
+        # (faces, 478, 3) normalized landmarks, from FaceMesh on keyframes and
+        # from optical flow propagation otherwise
+        h, w = frame.shape[:2]
+        timed = self.timings is not None
+        gray = None
+        if self.scheduler.enabled:
+            t = time.perf_counter()
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            if not self.scheduler.should_detect(frame.shape):
+                points = self.scheduler.propagate(gray, w, h)
+                if points is not None:
+                    if self.crops is not None:
+                        # Next keyframe's crops follow the propagated faces
+                        self.crops.follow(points, frame.shape)
+                    if timed:
+                        self._lap("flow", t)
+                    return points
+
+        start = t = time.perf_counter()
+        if self.crops is not None:
+            points = self.crops.process(frame)
+            if timed:
+                self.timings.update(self.crops.timings)
+            if gray is not None:
+                self.scheduler.record_keyframe(gray, points, w, h, (time.perf_counter() - start) * 1000.0)
+            return points
         rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        if timed:
+            t = self._lap("color", t)
         results = self.face_mesh.process(rgb_frame)
+        if timed:
+            t = self._lap("facemesh", t)
+        points = landmarks_to_array(results.multi_face_landmarks)
+        if timed:
+            self._lap("landmarks", t)
+        if gray is not None:
+            self.scheduler.record_keyframe(gray, points, w, h, (time.perf_counter() - start) * 1000.0)
+        return points
+
+    def process_frame(self, frame, ts=None):
+        # Frame is assumed to be a numpy array (BGR); ts is the capture time in
+        # seconds (defaults to now, offline analysis passes video time)
+        h, w, c = frame.shape
+        now = time.time() if ts is None else ts
+        timed = self.timings is not None
+        if timed:
+            self.timings.clear()
+        points = self.detect_landmarks(frame)
+        t = time.perf_counter()
         
         students_data = []
-        overall_status = "Active"
-        
-        if results.multi_face_landmarks:
-            # Face Detected
-            if self.is_seat_empty:
-                self.is_seat_empty = False  # Student returned
-            self.last_face_seen_time = time.time()
-
-            for face_landmarks in results.multi_face_landmarks:
-                # 1. Drowsiness (EAR)
-                left_ear = self.calculate_ear(face_landmarks.landmark, self.LEFT_EYE, w, h)
-                right_ear = self.calculate_ear(face_landmarks.landmark, self.RIGHT_EYE, w, h)
-                avg_ear = (left_ear + right_ear) / 2.0
-                is_drowsy = avg_ear < self.EAR_THRESHOLD
-
-                # 2. Focus (Head Pose)
-                pose_angles = self.get_head_pose(face_landmarks.landmark, w, h)
-                is_distracted = False
-                looking_direction = "Center"
-                
-                if pose_angles:
-                    pitch, yaw = pose_angles
-                    
-                    # Pitch < -10 is Down in current logic. 
-                    # Requirement: Count when looking down (Pitch > 20 deg provided in prompt, likely meaning deeply down).
-                    # We interpret "Down" as pitch < -20 based on existing coordinate system.
-                    
-                    if pitch < -10: looking_direction = "Down"
-                    elif pitch > 10: looking_direction = "Up"
-                    elif yaw < -10: looking_direction = "Left"
-                    elif yaw > 10: looking_direction = "Right"
-                    
-                    if abs(pitch) > 15 or abs(yaw) > 20:
-                        is_distracted = True
-
-                    # Looking Down Counter Logic
-                    # If pitch is significantly down (e.g. < -20)
-                    if pitch < -20:
-                        self.is_looking_down = True
-                    elif self.is_looking_down and pitch > -15:
-                        # Returned to normal/up from down
-                        self.looking_down_count += 1
-                        self.is_looking_down = False
-
-                # 3. Emotion
-                emotion = "Neutral"
-                if self.has_emotion_model:
-                     # Optimization: Run emotion detection every 30 frames (approx 1-2 sec)
-                     if self.frame_count % 30 == 0:
-                         # Use the full frame for detection stability
-                         # top_emotion returns (emotion_name, score)
-                         detected_emotion, score = self.emotion_detector.top_emotion(frame)
-                         if detected_emotion:
-                             self.last_emotion = detected_emotion
-                     
-                     emotion = self.last_emotion 
-                
-                # Get Face Center for Heatmap
-                nose = face_landmarks.landmark[1]
-                cx, cy = int(nose.x * w), int(nose.y * h)
 
+        if len(points):
+            # Face Detected
+            # All faces at once: (faces, 478, 3) normalized, (faces, 478, 2) pixels
+            pixels = to_pixels(points, w, h)
+            num_faces = len(pixels)
+            boxes = landmark_boxes(pixels)
+            track_ids, track_slots = self.tracker.update(boxes, (w, h))
+            if timed:
+                t = self._lap("track", t)
+
+            # 1. Drowsiness (EAR)
+            ears = average_ear(pixels)
+            if timed:
+                t = self._lap("ear", t)
+
+            # 2. Focus (Head Pose), degrees, NaN where the solver failed
+            pitch, yaw = self.pose_solver.solve(points, self.pose_indices, w, h)
+            if timed:
+                t = self._lap("pose", t)
+
+            looking_directions = gaze_direction(pitch, yaw)
+
+            # Drowsy, distracted and looked down are debounced per student (EAR
+            # below the threshold for CONSECUTIVE_FRAMES frames, pose off for 10)
+            self.events = self.event_engine.update(now, track_ids, track_slots, ears, pitch, yaw,
+                                                   self.tracker.active, boxes)
+            drowsy, distracted = self.event_engine.states(track_slots)
+            if timed:
+                t = self._lap("events", t)
+
+            # 3. Emotion: last label per student, stale faces are queued for a refresh
+            if self.emotions is not None:
+                self.emotions.update(frame, track_ids, boxes, now)
+                self.emotions.retain(self.tracker.live_ids)
+                emotions = self.emotions.lookup(track_ids, now)
+            else:
+                emotions = ["Neutral"] * num_faces
+            if timed:
+                t = self._lap("emotion", t)
+
+            # Get Face Center for Heatmap
+            positions = heatmap_points(pixels)
+
+            for i in range(num_faces):
                 students_data.append({
-                   "id": np.random.randint(1000,9999), # Mock ID for tracking
-                   "drowsy": is_drowsy,
-                   "ear": round(avg_ear, 2),
-                   "distracted": is_distracted,
-                   "looking_at": looking_direction,
-                   "emotion": emotion,
-                   "position": {"x": cx, "y": cy}
+                   "id": int(track_ids[i]),
+                   "drowsy": bool(drowsy[i]),
+                   "ear": round(float(ears[i]), 2),
+                   "distracted": bool(distracted[i]),
+                   "looking_at": str(looking_directions[i]),
+                   "emotion": emotions[i],
+                   "position": {"x": int(positions[i, 0]), "y": int(positions[i, 1])}
                 })
+            if timed:
+                self._lap("features", t)
         else:
-            # No Face Detected
-            if not self.is_seat_empty:
-                if time.time() - self.last_face_seen_time > 3.0:
-                    self.leaving_seat_count += 1
-                    self.is_seat_empty = True
+            # No Face Detected: tracks age, and their seats count as left after 3s
+            self.tracker.update(np.empty((0, 4)), (w, h))
+            self.events = self.event_engine.update(now, [], [], [], [], [], self.tracker.active, np.empty((0, 4)))
 
         return students_data, frame
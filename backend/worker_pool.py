@@ -0,0 +1,453 @@
+import asyncio
+import itertools
+import multiprocessing as mp
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+
+from engine_registry import EngineRegistry, registry_options
+from metrics import metrics_enabled
+
+# Largest decoded frame a slot can hold (1080p BGR).
+DEFAULT_SLOT_BYTES = 1920 * 1080 * 3
+
+# Reconnect affinity is remembered for this many recently closed cameras
+MAX_PREVIOUS = 4096
+
+# How often an idle worker checks for expired engines, in seconds
+EVICT_INTERVAL = 10.0
+
+# How often the collector checks that every worker process is still alive, in seconds
+LIVENESS_INTERVAL = 1.0
+
+# Modules the forkserver imports once, so every worker (and every restart)
+# forks with them already loaded instead of importing from scratch
+PRELOAD_MODULES = ["numpy", "cv2", "mediapipe", "face_crops", "vision_engine", "worker_pool"]
+
+
+def start_method():
+    # forkserver where available: the server process imports modules but
+    # never creates FaceMesh graphs or threads, so forking it is safe
+    method = os.environ.get("INSIGHT_START_METHOD")
+    if method:
+        return method
+    return "forkserver" if "forkserver" in mp.get_all_start_methods() else "spawn"
+
+
+class SharedFrameRing:
+    """Fixed number of frame-sized slots in one shared memory block.
+
+    The parent writes a decoded frame into a free slot and only sends the slot
+    index and shape to the worker, so pixel data is never pickled.
+    """
+
+    def __init__(self, slots, slot_bytes, name=None):
+        self.slots = slots
+        self.slot_bytes = slot_bytes
+        self.owner = name is None
+        if self.owner:
+            self.shm = shared_memory.SharedMemory(create=True, size=slots * slot_bytes)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def view(self, slot, shape):
+        return np.ndarray(shape, dtype=np.uint8, buffer=self.shm.buf, offset=slot * self.slot_bytes)
+
+    def write(self, slot, frame):
+        if frame.nbytes > self.slot_bytes:
+            raise ValueError(f"frame of {frame.nbytes} bytes does not fit a {self.slot_bytes} byte slot")
+        np.copyto(self.view(slot, frame.shape), frame)
+
+    def close(self):
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+def fit_frame(frame, max_bytes):
+    """Downscale frame (keeping its aspect ratio) until it fits max_bytes.
+
+    Returns the frame and the factor from its coordinates back to the original.
+    """
+    if frame.nbytes <= max_bytes:
+        return frame, 1.0
+    h, w = frame.shape[:2]
+    factor = (frame.nbytes / max_bytes) ** 0.5
+    size = (int(w / factor), int(h / factor))
+    while size[0] * size[1] * frame.nbytes // (h * w) > max_bytes:
+        size = (size[0] - 1, size[1] - 1)
+    return cv2.resize(frame, size, interpolation=cv2.INTER_AREA), w / size[0]
+
+
+def scale_positions(students, factor):
+    for s in students:
+        s["position"] = {"x": int(s["position"]["x"] * factor), "y": int(s["position"]["y"] * factor)}
+
+
+def engine_options():
+    # VisionEngine settings shared by every worker, from the environment
+    budget = os.environ.get("INSIGHT_CPU_BUDGET_MS")
+    return {
+        "pose_mode": os.environ.get("INSIGHT_POSE_MODE", "pnp"),
+        "keyframe_interval": int(os.environ.get("INSIGHT_KEYFRAME_INTERVAL", 4)),
+        "cpu_budget_ms": float(budget) if budget else None,
+        "multi_face": os.environ.get("INSIGHT_MULTI_FACE") == "1",
+        "mesh_threads": int(os.environ.get("INSIGHT_MESH_THREADS", 0)) or None,
+        "detect_interval": int(os.environ.get("INSIGHT_DETECT_INTERVAL", 10)),
+        "emotion_model": os.environ.get("INSIGHT_EMOTION_MODEL") or None,
+        "timed": metrics_enabled(),
+    }
+
+
+def behavior_snapshot(engine):
+    return {
+        "left_seat": engine.leaving_seat_count,
+        "looked_down": engine.looking_down_count,
+    }
+
+
+def _worker_main(index, shm_name, slots, slot_bytes, task_queue, result_queue):
+    # Runs in a child process: every camera routed here gets its own
+    # VisionEngine (from the registry) so tracking state never moves between
+    # processes. Registry stats are reported whenever they change.
+    ring = SharedFrameRing(slots, slot_bytes, name=shm_name)
+    registry = EngineRegistry(engine_options(), **registry_options())
+    reported = None
+    try:
+        registry.warmup()
+        result_queue.put(("ready", index))
+        while True:
+            try:
+                task = task_queue.get(timeout=EVICT_INTERVAL)
+            except queue.Empty:
+                registry.evict()
+                task = ("idle",)
+            if task is None:
+                break
+            kind = task[0]
+            if kind == "open":
+                registry.acquire(task[1], session=task[2])
+            elif kind == "close":
+                registry.release(task[1])
+                registry.evict()
+            elif kind == "frame":
+                _, job_id, camera, slot, shape = task
+                try:
+                    engine = registry.get(camera)
+                    frame = ring.view(slot, shape)
+                    students, _ = engine.process_frame(frame)
+                    result_queue.put(("result", job_id, students, behavior_snapshot(engine), engine.timings,
+                                      engine.events, None))
+                except Exception as e:
+                    result_queue.put(("result", job_id, None, None, None, None, repr(e)))
+
+            stats = registry.stats()
+            if stats != reported:
+                result_queue.put(("engines", index, stats))
+                reported = stats
+    finally:
+        registry.clear()
+        ring.shm.close()
+
+
+class _Worker:
+    def __init__(self, index, ctx, slots, slot_bytes, result_queue):
+        self.index = index
+        self.ring = SharedFrameRing(slots, slot_bytes)
+        self.task_queue = ctx.Queue()
+        self.process = ctx.Process(
+            target=_worker_main,
+            args=(index, self.ring.name, slots, slot_bytes, self.task_queue, result_queue),
+            daemon=True,
+        )
+        self.free_slots = None
+        self.cameras = set()
+        self.engine_stats = {}
+        self.started = None
+        self.ready = False
+
+    def start(self):
+        self.started = time.perf_counter()
+        self.process.start()
+        self.free_slots = asyncio.Queue()
+        for slot in range(self.ring.slots):
+            self.free_slots.put_nowait(slot)
+
+
+class InferencePool:
+    """Process pool running VisionEngine off the event loop.
+
+    Cameras are pinned to one worker (the one with the fewest active cameras
+    when they connect), so per-camera engine state stays in one process. A
+    camera that reconnects goes back to its previous worker, where its engine
+    may still be alive.
+    """
+
+    def __init__(self, num_workers=None, slots_per_worker=4, slot_bytes=DEFAULT_SLOT_BYTES):
+        self.num_workers = num_workers or os.cpu_count() or 1
+        self.slots_per_worker = slots_per_worker
+        self.slot_bytes = slot_bytes
+        self.ctx = mp.get_context(start_method())
+        if self.ctx.get_start_method() == "forkserver":
+            self.ctx.set_forkserver_preload(PRELOAD_MODULES)
+        self.result_queue = None
+        self.workers = []
+        self.assignments = {}
+        self.users = {}  # camera -> open connections
+        self.sessions = {}  # camera -> session of its open connection
+        self.previous = OrderedDict()  # camera -> worker index, for reconnects
+        self.pending = {}
+        self.job_ids = itertools.count()
+        self.loop = None
+        self.collector = None
+        self.running = False
+        self.ready_event = None
+        self.startup_seconds = {}  # worker index -> seconds from start to ready
+        self.restarts = 0
+
+    @property
+    def ready(self):
+        # False again while a crashed worker is being replaced
+        return self.ready_event is not None and self.ready_event.is_set() and all(w.ready for w in self.workers)
+
+    async def wait_ready(self):
+        await self.ready_event.wait()
+
+    def start(self):
+        self.loop = asyncio.get_running_loop()
+        self.ready_event = asyncio.Event()
+        self.result_queue = self.ctx.Queue()
+        for i in range(self.num_workers):
+            worker = _Worker(i, self.ctx, self.slots_per_worker, self.slot_bytes, self.result_queue)
+            worker.start()
+            self.workers.append(worker)
+        self.running = True
+        self.collector = threading.Thread(target=self._collect, name="inference-results", daemon=True)
+        self.collector.start()
+
+    def acquire(self, camera, session=None):
+        # A connection for camera opened; its engine is kept until release().
+        # An engine bound to another session starts that session over. Several
+        # connections may share a camera (a reconnect that opens before the
+        # old socket closed); it stays assigned until the last one releases it.
+        self.users[camera] = self.users.get(camera, 0) + 1
+        worker = self.assignments.get(camera)
+        if worker is None:
+            index = self.previous.pop(camera, None)
+            if index is not None and index < len(self.workers):
+                worker = self.workers[index]
+            else:
+                worker = min(self.workers, key=lambda w: len(w.cameras))
+            worker.cameras.add(camera)
+            self.assignments[camera] = worker
+        self.sessions[camera] = session
+        worker.task_queue.put(("open", camera, session))
+
+    async def process(self, camera, frame):
+        # Frames larger than a slot (above 1080p by default) are downscaled to
+        # fit; positions are still returned in the coordinates of ``frame``
+        frame, factor = fit_frame(frame, self.slot_bytes)
+        worker = self.assignments[camera]
+        slot = await worker.free_slots.get()
+        try:
+            worker.ring.write(slot, frame)
+        except Exception:
+            worker.free_slots.put_nowait(slot)
+            raise
+        job_id = next(self.job_ids)
+        future = self.loop.create_future()
+        self.pending[job_id] = (worker, slot, future)
+        worker.task_queue.put(("frame", job_id, camera, slot, frame.shape))
+        students, behavior, timings, events = await future
+        if factor != 1.0:
+            scale_positions(students, factor)
+        return students, behavior, timings, events
+
+    def release(self, camera):
+        count = self.users.get(camera, 0) - 1
+        if count > 0:
+            self.users[camera] = count
+            # The worker's registry counts connections too
+            self.assignments[camera].task_queue.put(("close", camera))
+            return
+        self.users.pop(camera, None)
+        worker = self.assignments.pop(camera, None)
+        self.sessions.pop(camera, None)
+        if worker is not None:
+            worker.cameras.discard(camera)
+            worker.task_queue.put(("close", camera))
+            self.previous[camera] = worker.index
+            while len(self.previous) > MAX_PREVIOUS:
+                self.previous.popitem(last=False)
+
+    def engine_stats(self):
+        # Registry stats summed over workers
+        totals = {}
+        for worker in self.workers:
+            for name, value in worker.engine_stats.items():
+                totals[name] = totals.get(name, 0) + value
+        return totals
+
+    def _collect(self):
+        # Liveness is checked on a fixed schedule, not only when the queue is
+        # idle: other workers' results must not hide a crashed one
+        next_check = time.monotonic() + LIVENESS_INTERVAL
+        while self.running:
+            now = time.monotonic()
+            if now >= next_check:
+                self.loop.call_soon_threadsafe(self._check_workers)
+                next_check = now + LIVENESS_INTERVAL
+            try:
+                message = self.result_queue.get(timeout=max(next_check - now, 0.01))
+            except queue.Empty:
+                continue
+            except (EOFError, OSError):
+                break
+            if message[0] == "engines":
+                self.loop.call_soon_threadsafe(self._update_engine_stats, *message[1:])
+            elif message[0] == "ready":
+                self.loop.call_soon_threadsafe(self._worker_ready, *message[1:])
+            else:
+                self.loop.call_soon_threadsafe(self._resolve, *message[1:])
+
+    def _worker_ready(self, index):
+        if index >= len(self.workers):
+            return
+        worker = self.workers[index]
+        worker.ready = True
+        self.startup_seconds[index] = time.perf_counter() - worker.started
+        if all(w.ready for w in self.workers):
+            self.ready_event.set()
+
+    def startup_stats(self):
+        return {
+            "pool_ready": int(self.ready),
+            "worker_startup_seconds": max(self.startup_seconds.values(), default=0.0),
+            "worker_restarts": self.restarts,
+        }
+
+    def _update_engine_stats(self, index, stats):
+        if index < len(self.workers):
+            self.workers[index].engine_stats = stats
+
+    def _resolve(self, job_id, students, behavior, timings, events, error):
+        entry = self.pending.pop(job_id, None)
+        if entry is None:
+            return
+        worker, slot, future = entry
+        worker.free_slots.put_nowait(slot)
+        if future.done():
+            return
+        if error is not None:
+            future.set_exception(RuntimeError(f"Worker {worker.index} failed: {error}"))
+        else:
+            future.set_result((students, behavior, timings, events))
+
+    def _check_workers(self):
+        # Fail jobs of crashed workers and replace them with a fresh process.
+        for i, worker in enumerate(self.workers):
+            if not self.running or worker.process.is_alive():
+                continue
+            print(f"Inference worker {worker.index} died, restarting")
+            self.restarts += 1
+            for job_id, (owner, slot, future) in list(self.pending.items()):
+                if owner is worker:
+                    del self.pending[job_id]
+                    if not future.done():
+                        future.set_exception(RuntimeError(f"Worker {worker.index} died"))
+            worker.ring.close()
+            replacement = _Worker(worker.index, self.ctx, self.slots_per_worker, self.slot_bytes, self.result_queue)
+            replacement.start()
+            # Connected cameras stay on this worker and get fresh engines
+            replacement.cameras = worker.cameras
+            for camera in worker.cameras:
+                self.assignments[camera] = replacement
+                for _ in range(self.users.get(camera, 1)):
+                    replacement.task_queue.put(("open", camera, self.sessions.get(camera)))
+            self.workers[i] = replacement
+
+    def stop(self):
+        self.running = False
+        for worker in self.workers:
+            worker.task_queue.put(None)
+        for worker in self.workers:
+            worker.process.join(timeout=5)
+            if worker.process.is_alive():
+                worker.process.terminate()
+            worker.ring.close()
+        for _, _, future in self.pending.values():
+            if not future.done():
+                future.cancel()
+        self.pending.clear()
+        self.workers = []
+
+
+class InlinePool:
+    """Same interface as InferencePool but runs engines on a thread of this
+    process. Used with INSIGHT_WORKERS=0 (debugging, single-core boxes)."""
+
+    def __init__(self):
+        self.registry = EngineRegistry(engine_options(), **registry_options())
+        self.num_workers = 0
+        self.ready_event = None
+        self.startup_seconds = 0.0
+
+    @property
+    def ready(self):
+        return self.ready_event is not None and self.ready_event.is_set()
+
+    async def wait_ready(self):
+        await self.ready_event.wait()
+
+    def start(self):
+        self.ready_event = asyncio.Event()
+        asyncio.get_running_loop().create_task(self._warmup())
+
+    async def _warmup(self):
+        start = time.perf_counter()
+        await asyncio.to_thread(self.registry.warmup)
+        self.startup_seconds = time.perf_counter() - start
+        self.ready_event.set()
+
+    def startup_stats(self):
+        return {"pool_ready": int(self.ready), "worker_startup_seconds": self.startup_seconds}
+
+    def acquire(self, camera, session=None):
+        self.registry.acquire(camera, session=session)
+
+    async def process(self, camera, frame):
+        engine = self.registry.get(camera)
+        loop = asyncio.get_running_loop()
+        students, _ = await loop.run_in_executor(None, engine.process_frame, frame)
+        return students, behavior_snapshot(engine), engine.timings, engine.events
+
+    def release(self, camera):
+        # Expired engines are only checked for when cameras come and go here
+        self.registry.release(camera)
+        self.registry.evict()
+
+    def engine_stats(self):
+        return self.registry.stats()
+
+    def stop(self):
+        self.registry.clear()
+
+
+def create_pool():
+    workers = int(os.environ.get("INSIGHT_WORKERS", os.cpu_count() or 1))
+    if workers <= 0:
+        return InlinePool()
+    return InferencePool(
+        num_workers=workers,
+        slots_per_worker=int(os.environ.get("INSIGHT_SLOTS_PER_WORKER", 4)),
+    )
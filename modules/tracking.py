@@ -5,27 +5,67 @@ import streamlit as st
 from streamlit_webrtc import webrtc_streamer, WebRtcMode
 import av
 import time
-import queue
+import threading
 import functools
+import os
+import sys
+
+# Landmark helpers are shared with the FastAPI backend
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+from landmarks import landmarks_to_array, to_pixels, average_ear
+from head_pose import GENERIC_FACE_3D, POSE_INDICES, HeadPoseSolver
 
 # Initialize MediaPipe Face Mesh
 mp_face_mesh = mp.solutions.face_mesh
 mp_drawing = mp.solutions.drawing_utils
 mp_drawing_styles = mp.solutions.drawing_styles
 
-def calculate_ear(eye_landmarks):
-    # eye_landmarks: list of [x, y]
-    # Vertical distances
-    A = np.linalg.norm(eye_landmarks[1] - eye_landmarks[5])
-    B = np.linalg.norm(eye_landmarks[2] - eye_landmarks[4])
-    # Horizontal distance
-    C = np.linalg.norm(eye_landmarks[0] - eye_landmarks[3])
-    ear = (A + B) / (2.0 * C)
-    return ear
+# "none" draws nothing, "minimal" the nose direction line and alerts,
+# "full" also the mesh tesselation and contours (redrawn every Nth frame)
+OVERLAY_MODES = ("none", "minimal", "full")
+
+# Seconds between Streamlit metric updates
+METRICS_INTERVAL = 0.5
+
+
+class LatestValue:
+    """Thread-safe single-value mailbox from the video thread to the UI.
+
+    put() overwrites whatever the reader has not picked up yet, so memory stays
+    flat however far the UI falls behind; get() waits for a value newer than
+    the last one it returned.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._value = None
+        self._version = 0
+        self._seen = 0
+
+    def put(self, value):
+        with self._cond:
+            self._value = value
+            self._version += 1
+            self._cond.notify_all()
+
+    def get(self, timeout=None):
+        # Newest value, or None if nothing new arrived within timeout
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._version != self._seen, timeout):
+                return None
+            self._seen = self._version
+            return self._value
+
 
 class VideoProcessor:
-    def __init__(self, result_queue):
-        self.result_queue = result_queue
+    def __init__(self, results=None, overlay="minimal", full_overlay_every=5):
+        self.results = results if results is not None else LatestValue()
+        # Can be changed while streaming (see render())
+        self.overlay = overlay
+        self.full_overlay_every = full_overlay_every
+        # Full mesh drawing of the last redraw: BGR layer plus the mask of drawn pixels
+        self.mesh_layer = None
+        self.mesh_mask = None
         self.engagement_score = 100
         self.distracted_count = 0
         self.drowsy_count = 0
@@ -46,15 +86,10 @@ class VideoProcessor:
         self.drowsy_event_active = False
         self.distracted_event_active = False
 
-        # Head Pose 3D Model Points (Generic)
-        self.face_3d = np.array([
-            [0.0, 0.0, 0.0],             # Nose tip
-            [0.0, -330.0, -65.0],        # Chin
-            [-225.0, 170.0, -135.0],     # Left eye left corner
-            [225.0, 170.0, -135.0],      # Right eye right corner
-            [-150.0, -150.0, -125.0],    # Left Mouth corner
-            [150.0, -150.0, -125.0]      # Right mouth corner
-        ], dtype=np.float64)
+        # Head Pose 3D Model Points (FaceMesh geometry, see head_pose.py)
+        self.face_3d = GENERIC_FACE_3D
+        # Caches intrinsics per frame size
+        self.pose_solver = HeadPoseSolver(self.face_3d)
 
         try:
             self.face_mesh = mp_face_mesh.FaceMesh(
@@ -73,51 +108,36 @@ class VideoProcessor:
 
         image = frame.to_ndarray(format="bgr24")
         h, w, c = image.shape
-        
-        # Convert to RGB for MediaPipe
-        image.flags.writeable = False
+        overlay = self.overlay
+        draw = overlay != "none"
+
+        # MediaPipe wants RGB; drawing happens on the original BGR image, so
+        # there is no conversion back
         image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        image_rgb.flags.writeable = False
         results = self.face_mesh.process(image_rgb)
-        image.flags.writeable = True
 
-        image = cv2.cvtColor(image_rgb, cv2.COLOR_RGB2BGR)
-        
         current_focused = True
 
+        if overlay == "full":
+            self._draw_mesh(image, results.multi_face_landmarks)
+
         if results.multi_face_landmarks:
-            for face_landmarks in results.multi_face_landmarks:
-                # Draw landmarks
-                mp_drawing.draw_landmarks(
-                    image=image,
-                    landmark_list=face_landmarks,
-                    connections=mp_face_mesh.FACEMESH_TESSELATION,
-                    landmark_drawing_spec=None,
-                    connection_drawing_spec=mp_drawing_styles.get_default_face_mesh_tesselation_style())
-                
-                # Optional: Draw contours
-                mp_drawing.draw_landmarks(
-                    image=image,
-                    landmark_list=face_landmarks,
-                    connections=mp_face_mesh.FACEMESH_CONTOURS,
-                    landmark_drawing_spec=None,
-                    connection_drawing_spec=mp_drawing_styles.get_default_face_mesh_contours_style())
+            # (faces, 478, 2) pixel coordinates, EAR for every eye of every face
+            pixels = to_pixels(landmarks_to_array(results.multi_face_landmarks), w, h)
+            ears = average_ear(pixels)
+            poses_2d = pixels[:, POSE_INDICES].astype(np.float64, order="C")
+
+            for i in range(len(pixels)):
+                avg_ear = ears[i]
+                face_2d = poses_2d[i]
 
-                lm_np = np.array([(lm.x * w, lm.y * h) for lm in face_landmarks.landmark])
-                
                 # --- Drowsiness Detection (EAR) ---
-                # Left Eye Indices: 33, 160, 158, 133, 153, 144
-                # Right Eye Indices: 362, 385, 387, 263, 373, 380
-                left_eye = lm_np[[33, 160, 158, 133, 153, 144]]
-                right_eye = lm_np[[362, 385, 387, 263, 373, 380]]
-                
-                ear_left = calculate_ear(left_eye)
-                ear_right = calculate_ear(right_eye)
-                avg_ear = (ear_left + ear_right) / 2.0
-                
                 if avg_ear < self.EAR_THRESHOLD:
                     self.drowsy_frame_counter += 1
                     if self.drowsy_frame_counter >= self.EAR_CONSEC_FRAMES:
-                        cv2.putText(image, "DROWSY!", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
+                        if draw:
+                            cv2.putText(image, "DROWSY!", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
                         current_focused = False
                         if not self.drowsy_event_active:
                             self.drowsy_count += 1
@@ -127,32 +147,17 @@ class VideoProcessor:
                     self.drowsy_event_active = False
 
                 # --- Distraction Detection (Head Pose) ---
-                face_2d = []
-                # Points: Nose(1), Chin(152), L-Eye(33), R-Eye(263), L-Mouth(61), R-Mouth(291)
-                for idx in [1, 152, 33, 263, 61, 291]:
-                    face_2d.append([face_landmarks.landmark[idx].x * w, face_landmarks.landmark[idx].y * h])
-                
-                face_2d = np.array(face_2d, dtype=np.float64)
-                focal_length = 1 * w
-                cam_matrix = np.array([ [focal_length, 0, w / 2],
-                                        [0, focal_length, h / 2],
-                                        [0, 0, 1]])
-                dist_matrix = np.zeros((4, 1), dtype=np.float64)
-                
-                success, rot_vec, trans_vec = cv2.solvePnP(self.face_3d, face_2d, cam_matrix, dist_matrix)
+                pose = self.pose_solver.solve_pnp(face_2d, w, h)
                 
-                if success:
-                    rmat, jac = cv2.Rodrigues(rot_vec)
-                    angles, mtxR, mtxQ, Qx, Qy, Qz = cv2.RQDecomp3x3(rmat)
-                    
-                    # Pitch (x), Yaw (y), Roll (z)
-                    pitch = angles[0]
-                    yaw = angles[1]
+                if pose is not None:
+                    # Pitch (x), Yaw (y) in degrees
+                    pitch, yaw, rot_vec, trans_vec = pose
                     
                     if abs(pitch) > self.POSE_PITCH_THRESHOLD or abs(yaw) > self.POSE_YAW_THRESHOLD:
                         self.distracted_frame_counter += 1
                         if self.distracted_frame_counter >= 10: # small buffer
-                            cv2.putText(image, "DISTRACTED!", (10, 70), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
+                            if draw:
+                                cv2.putText(image, "DISTRACTED!", (10, 70), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
                             current_focused = False
                             if not self.distracted_event_active:
                                 self.distracted_count += 1
@@ -162,10 +167,11 @@ class VideoProcessor:
                         self.distracted_event_active = False
                         
                     # Visualize Nose Direction
-                    nose_end_point2D, jac = cv2.projectPoints(np.array([(0.0, 0.0, 1000.0)]), rot_vec, trans_vec, cam_matrix, dist_matrix)
-                    p1 = (int(face_2d[0][0]), int(face_2d[0][1]))
-                    p2 = (int(nose_end_point2D[0][0][0]), int(nose_end_point2D[0][0][1]))
-                    cv2.line(image, p1, p2, (255, 0, 0), 2)
+                    if draw:
+                        nose_end_point2D = self.pose_solver.project([(0.0, 0.0, 1000.0)], rot_vec, trans_vec, w, h)
+                        p1 = (int(face_2d[0][0]), int(face_2d[0][1]))
+                        p2 = (int(nose_end_point2D[0][0]), int(nose_end_point2D[0][1]))
+                        cv2.line(image, p1, p2, (255, 0, 0), 2)
 
         # Update Engagement
         self.total_frames += 1
@@ -174,22 +180,51 @@ class VideoProcessor:
         
         self.engagement_score = int((self.focused_frames / self.total_frames) * 100) if self.total_frames > 0 else 100
 
-        # Send stats to queue
+        # Latest stats for the UI (older unread ones are overwritten)
         stats_dict = {
             "engagement_score": self.engagement_score,
             "distracted_count": self.distracted_count,
             "drowsy_count": self.drowsy_count
         }
-        self.result_queue.put(stats_dict)
+        self.results.put(stats_dict)
 
+        if not draw:
+            return frame
         return av.VideoFrame.from_ndarray(image, format="bgr24")
 
+    def _draw_mesh(self, image, multi_face_landmarks):
+        # Tesselation and contours are redrawn into a layer every
+        # full_overlay_every frames (the Python drawing loop is the expensive
+        # part); frames in between composite the cached layer
+        if self.mesh_layer is None or self.mesh_layer.shape != image.shape \
+                or self.total_frames % max(1, self.full_overlay_every) == 0:
+            layer = np.zeros_like(image)
+            for face_landmarks in multi_face_landmarks or ():
+                mp_drawing.draw_landmarks(
+                    image=layer,
+                    landmark_list=face_landmarks,
+                    connections=mp_face_mesh.FACEMESH_TESSELATION,
+                    landmark_drawing_spec=None,
+                    connection_drawing_spec=mp_drawing_styles.get_default_face_mesh_tesselation_style())
+                mp_drawing.draw_landmarks(
+                    image=layer,
+                    landmark_list=face_landmarks,
+                    connections=mp_face_mesh.FACEMESH_CONTOURS,
+                    landmark_drawing_spec=None,
+                    connection_drawing_spec=mp_drawing_styles.get_default_face_mesh_contours_style())
+            self.mesh_layer = layer
+            self.mesh_mask = layer.any(axis=2)
+        np.copyto(image, self.mesh_layer, where=self.mesh_mask[..., None])
+
 def render():
     st.header("Real-time Engagement Tracking")
-    
-    # Create a thread-safe queue for data transfer
-    result_queue = queue.Queue()
-    
+
+    overlay = st.selectbox("Overlay", OVERLAY_MODES, index=OVERLAY_MODES.index("minimal"))
+    full_overlay_every = st.slider("Redraw full mesh every N frames", 1, 30, 5, disabled=overlay != "full")
+
+    # Latest stats from the video thread
+    results = LatestValue()
+
     # Layout for metrics
     col1, col2, col3 = st.columns(3)
     with col1:
@@ -202,8 +237,9 @@ def render():
         drowsy_metric = st.empty()
         drowsy_metric.metric("Drowsy Count", "0")
 
-    # Factory to pass queue to VideoProcessor
-    video_processor_factory = functools.partial(VideoProcessor, result_queue=result_queue)
+    # Factory to pass the mailbox and overlay settings to VideoProcessor
+    video_processor_factory = functools.partial(VideoProcessor, results=results, overlay=overlay,
+                                                full_overlay_every=full_overlay_every)
 
     # Webcam Streamer
     ctx = webrtc_streamer(
@@ -215,17 +251,23 @@ def render():
         async_processing=True,
     )
 
-    # Loop to update metrics while streaming
-    if ctx.state.playing:
-        while ctx.state.playing:
-            try:
-                # Non-blocking get with timeout
-                data = result_queue.get(timeout=0.1)
-                
-                eng_metric.metric("Engagement Score", f"{data['engagement_score']}%")
-                dist_metric.metric("Distracted Count", f"{data['distracted_count']}")
-                drowsy_metric.metric("Drowsy Count", f"{data['drowsy_count']}")
-            except queue.Empty:
-                pass
-            
-            time.sleep(0.01) # Small sleep to prevent high CPU usage
+    # Overlay changes apply to the running processor without restarting the stream
+    if ctx.video_processor:
+        ctx.video_processor.overlay = overlay
+        ctx.video_processor.full_overlay_every = full_overlay_every
+
+    # Loop to update metrics while streaming: at most every METRICS_INTERVAL
+    # seconds, and only the metrics whose value changed
+    shown = {}
+    while ctx.state.playing:
+        data = results.get(timeout=METRICS_INTERVAL)
+        if data is None:
+            continue
+        for key, widget, label, text in (
+                ("engagement_score", eng_metric, "Engagement Score", f"{data['engagement_score']}%"),
+                ("distracted_count", dist_metric, "Distracted Count", f"{data['distracted_count']}"),
+                ("drowsy_count", drowsy_metric, "Drowsy Count", f"{data['drowsy_count']}")):
+            if shown.get(key) != data[key]:
+                widget.metric(label, text)
+                shown[key] = data[key]
+        time.sleep(METRICS_INTERVAL)